@@ -0,0 +1,26 @@
+"""RingString Master: расчет схем стринг-арта без графического интерфейса."""
+from .geometry import (
+    ChordIndex, ChordScoreTable, calculate_nails, get_chord_index,
+    DirCache, GeometryCache, geometry_cache, configure_geometry_cache,
+)
+from .engine import (
+    CALC_SIZE, RENDER_SIZE, SolverParams, GenerationResult, Checkpoint, CheckpointMismatch, StringArtEngine,
+    adjust_photo, adjust_gray, photo_lut, crop_to_hoop, fit_to_hoop, build_error_matrix, suggest_params,
+    solve, resume, solve_greedy, solve_pyramid, residual_matrix, pyramid_levels, refine_sequence,
+    scale_weight, level_params, image_digest, PARAM_LIMITS, check_params,
+    INCREMENTAL_MIN_LINES, use_incremental,
+    reconstruction_error, residual_rmse, render_strings, flatten_on_white,
+    STRATEGIES, LookaheadPicker, register_strategy, compare_with_greedy,
+    RENDER_TIERS, render_size, thread_density, density_to_alpha,
+)
+from .color import ColorLayer, parse_palette, split_layers, solve_color, render_color
+from .instrument import Instrumentation, Profiler, log_sink
+from .formats import (
+    write_instructions, read_instructions, iter_instructions, convert_instructions,
+    SequenceFile, write_binary,
+)
+from .export import write_svg, write_pdf, write_png_tiled, nail_positions
+from .jit import BACKENDS, NUMBA_AVAILABLE
+from .preview import PhotoPreview, StringsOverlay
+from .results import ResultCache, result_cache, configure_result_cache
+from .background import BackgroundRemover, get_remover, rembg_available
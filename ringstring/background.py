@@ -0,0 +1,162 @@
+"""Удаление фона (rembg) с одной сессией модели на процесс и кэшем масок.
+
+Модель загружается при первом вызове и дальше переиспользуется - и в программе,
+и в пакетном режиме (по одной загрузке на рабочий процесс). Маска ищется по хэшу
+содержимого фото: сначала в памяти, затем на диске; повторное удаление фона
+у того же фото модель не запускает. max_side > 0 - модель работает на уменьшенной
+копии, а маска растягивается до размера фото.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from PIL import Image
+
+DEFAULT_MODEL = "u2net"
+_rembg = None
+_rembg_error = None
+
+
+def rembg_available():
+    # Импорт rembg тяжелый (onnxruntime) - выполняется один раз и только по требованию.
+    # Сломанная установка тоже считается "недоступно".
+    global _rembg, _rembg_error
+    if _rembg is None and _rembg_error is None:
+        try:
+            import rembg
+            _rembg = rembg
+        except Exception as e:
+            _rembg_error = e
+    return _rembg is not None
+
+
+def rembg_error():
+    rembg_available()
+    return _rembg_error
+
+
+_sessions = {}  # модель -> сессия rembg (одна на процесс)
+_sessions_lock = threading.Lock()
+
+
+def get_session(model=DEFAULT_MODEL):
+    with _sessions_lock:
+        if model not in _sessions:
+            if not rembg_available():
+                raise RuntimeError(f"rembg недоступен: {_rembg_error}")
+            _sessions[model] = _rembg.new_session(model)
+        return _sessions[model]
+
+
+def _default_cache_dir():
+    path = os.environ.get("RINGSTRING_MASK_CACHE")
+    if path is not None:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "ringstring", "masks")
+
+
+class BackgroundRemover:
+    def __init__(self, model=DEFAULT_MODEL, max_side=0, cache_dir=None, max_mb=256, memory_items=16):
+        # cache_dir="" - без дискового кэша
+        self.model = model
+        self.max_side = max_side
+        self.cache_dir = _default_cache_dir() if cache_dir is None else cache_dir
+        self.max_bytes = int(max_mb * 1024**2)
+        self.memory_items = memory_items
+        self._masks = OrderedDict()  # хэш -> маска "L", от давно использованных к недавним
+        self._lock = threading.Lock()
+
+    def key(self, img):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{self.model}|{self.max_side}|{img.mode}|{img.size}".encode())
+        h.update(img.tobytes())
+        return h.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load(self, key):
+        if not self.cache_dir: return None
+        path = self._disk_path(key)
+        try:
+            with Image.open(path) as m:
+                mask = m.convert("L")
+            os.utime(path)  # Отметка для LRU
+            return mask
+        except OSError:
+            return None
+
+    def _store(self, key, mask):
+        if not self.cache_dir: return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.png")
+            mask.save(tmp)
+            os.replace(tmp, self._disk_path(key))
+            self._evict()
+        except OSError:
+            pass  # Кэш - только ускорение
+
+    def _evict(self):
+        files = []
+        for f in os.scandir(self.cache_dir):
+            if f.name.endswith(".png") and not f.name.startswith("."):
+                st = f.stat()
+                files.append((st.st_mtime, st.st_size, f.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def _compute(self, img):
+        src = img.convert("RGB")
+        if self.max_side and max(src.size) > self.max_side:
+            src = src.copy()
+            src.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+        mask = _rembg.remove(src, session=get_session(self.model), only_mask=True).convert("L")
+        if mask.size != img.size:
+            mask = mask.resize(img.size, Image.Resampling.BILINEAR)
+        return mask
+
+    def mask(self, img):
+        # Маска переднего плана (L, размер фото)
+        key = self.key(img)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = self._load(key)
+        if mask is None or mask.size != img.size:
+            mask = self._compute(img)
+            self._store(key, mask)
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > self.memory_items:
+                self._masks.popitem(last=False)
+        return mask
+
+    def remove(self, img, background=(255, 255, 255, 255)):
+        # Фото на однотонном фоне (RGBA)
+        out = Image.new("RGBA", img.size, background)
+        out.paste(img.convert("RGBA"), (0, 0), self.mask(img))
+        return out
+
+
+_removers = {}
+_removers_lock = threading.Lock()
+
+
+def get_remover(model=DEFAULT_MODEL, max_side=0):
+    # Общий экземпляр процесса: кэш масок в памяти живет между вызовами и заданиями пакета
+    with _removers_lock:
+        key = (model, max_side)
+        if key not in _removers:
+            _removers[key] = BackgroundRemover(model, max_side)
+        return _removers[key]
@@ -0,0 +1,367 @@
+"""Пакетная генерация на пуле процессов.
+
+Индекс хорд строится один раз в главном процессе и кладется в разделяемую
+память; рабочие процессы только подключаются к нему и не перестраивают таблицы.
+"""
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+from .background import get_remover
+from .color import prepare_color, render_color, solve_color
+from .engine import (Checkpoint, CheckpointMismatch, StringArtEngine, flatten_on_white, pyramid_levels,
+                     use_incremental)
+from .export import DIAMETER_MM
+from .formats import write_instructions
+from .geometry import ChordIndex, get_chord_index, register_chord_index
+from .instrument import Instrumentation, Profiler, log_sink, phase
+from .results import result_cache, source_key
+
+
+@dataclass
+class JobOptions:
+    output_dir: str = "ringstring_out"
+    formats: tuple = ("txt", "json", "csv")
+    render: bool = True
+    brightness: float = 1.0
+    contrast: float = 1.0
+    colors: str = ""         # Цветной режим: "cmy", "cmyk" или список цветов
+    color_workers: int = 1   # Процессов на слои одного фото
+    profile_dir: str = ""    # Куда писать JSON-профиль каждого задания ("" - не писать)
+    trace_memory: bool = False
+    log_events: bool = False  # Фазы и ход расчета в logging ("ringstring")
+    checkpoint_dir: str = ""  # Чекпоинты заданий: продолжение после сбоя и добавление линий
+    checkpoint_every: int = 500
+    remove_bg: bool = False   # Удалить фон (rembg) перед расчетом
+    bg_max_side: int = 0      # rembg на копии не больше этого размера (0 - в полном размере)
+    use_cache: bool = True    # Кэш результатов: то же фото с теми же параметрами - без расчета
+    compare_greedy: bool = False  # Не жадная стратегия: еще и жадный расчет для сравнения
+    diameter_mm: float = DIAMETER_MM  # Диаметр обруча для SVG / PDF
+
+
+@dataclass
+class JobResult:
+    path: str
+    ok: bool
+    lines: int = 0
+    elapsed: float = 0.0
+    outputs: list = field(default_factory=list)
+    error: str = ""
+    report: dict = None      # Сводка стратегии против жадного расчета (compare_with_greedy)
+    stopped: bool = False    # Расчет остановлен (should_stop) до нужного числа линий
+    cached: bool = False     # Результат взят из кэша результатов
+
+
+@dataclass
+class BatchReport:
+    results: list
+    workers: int
+    wall_time: float
+
+    @property
+    def failed(self):
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def cached(self):
+        return [r for r in self.results if r.ok and r.cached]
+
+    @property
+    def total_lines(self):
+        # Только посчитанные линии: результаты из кэша в скорость не входят
+        return sum(r.lines for r in self.results if r.ok and not r.cached)
+
+    @property
+    def jobs_per_min(self):
+        return len(self.results) / self.wall_time * 60 if self.wall_time else 0.0
+
+    @property
+    def lines_per_sec(self):
+        return self.total_lines / self.wall_time if self.wall_time else 0.0
+
+    def summary(self):
+        return (f"Заданий: {len(self.results)} (ошибок: {len(self.failed)}, из кэша: {len(self.cached)}), "
+                f"процессов: {self.workers}, время: {self.wall_time:.1f} с, {self.jobs_per_min:.1f} заданий/мин, "
+                f"{self.lines_per_sec:.0f} линий/с")
+
+    def to_dict(self):
+        return {"workers": self.workers, "wall_time": self.wall_time, "cached_jobs": len(self.cached),
+                "jobs_per_min": self.jobs_per_min, "lines_per_sec": self.lines_per_sec,
+                "jobs": [asdict(r) for r in self.results]}
+
+
+def load_photo(path):
+    # Так же, как при загрузке в программе
+    img = Image.open(path).convert("RGBA")
+    img.thumbnail((1200, 1200))
+    return img
+
+
+def _job_photo(path, options):
+    # Фото задания; модель rembg - одна на процесс (get_remover), а не на каждое фото
+    img = load_photo(path)
+    if options.remove_bg:
+        img = get_remover(max_side=options.bg_max_side).remove(img)
+    return img
+
+
+_STORED = ("svg", "pdf")  # Форматы, которые хранятся в кэше результатов готовыми файлами
+
+
+def _source_key(path, params, options):
+    with open(path, "rb") as f:
+        data = f.read()
+    settings = {"brightness": options.brightness, "contrast": options.contrast,
+                "remove_bg": options.remove_bg, "bg_max_side": options.bg_max_side if options.remove_bg else 0}
+    return source_key(data, params, settings)
+
+
+def process_photo(path, params, options, progress=None, should_stop=None):
+    # Одно фото -> схемы в нужных форматах (+ PNG). Ошибки не выбрасываются наружу.
+    # should_stop() -> True - остановить расчет; сохраняется то, что успело посчитаться.
+    stem = os.path.splitext(os.path.basename(path))[0]
+    t0 = time.perf_counter()
+    try:
+        if options.colors:
+            return _process_color_photo(path, stem, params, options, t0)
+        instrument, profiler = _job_instrument(stem, params, options)
+        ckpt_path, resume_args = _job_checkpoint(stem, params, options)
+        cache = result_cache if options.use_cache else None
+        engine = StringArtEngine(params, instrument, cache)
+        result = source = None
+        if cache is not None and "checkpoint" not in resume_args:
+            # Тот же файл с теми же настройками: без загрузки фото, rembg и рендера
+            with phase(instrument, "cache"):
+                source = _source_key(path, params, options)
+                result = cache.lookup(source, params)
+            if result is not None and options.compare_greedy and result.report is not None \
+                    and "greedy_error" not in result.report:
+                result = None  # Сравнения в записи нет - его посчитает engine.generate
+        if result is None:
+            photo = _job_photo(path, options)
+            try:
+                result = engine.generate(photo, options.brightness, options.contrast, render=False,
+                                         compare=options.compare_greedy, progress=progress,
+                                         should_stop=should_stop, **resume_args)
+            except CheckpointMismatch:
+                # Файл с тем же именем, но другое фото (или яркость, фон) - расчет с нуля
+                resume_args.pop("checkpoint")
+                result = engine.generate(photo, options.brightness, options.contrast, render=False,
+                                         compare=options.compare_greedy, progress=progress,
+                                         should_stop=should_stop, **resume_args)
+            if source is not None and result.cache_key is not None:
+                cache.link(source, result.cache_key)
+        key = result.cache_key if cache is not None else None
+        outputs = []
+        if ckpt_path:
+            result.checkpoint.save(ckpt_path)
+            outputs.append(ckpt_path)
+        for f in options.formats:
+            out = os.path.join(options.output_dir, f"{stem}.{f}")
+            # Текстовые форматы пишутся из последовательности быстрее, чем копируются
+            name = f"{options.diameter_mm:g}mm.{f}" if f in _STORED else None
+            if not (key and name and cache.output(key, name, out)):
+                write_instructions(out, result.sequence, params.nails, params=params,
+                                   diameter=options.diameter_mm)
+                if key and name: cache.add_output(key, name, out)
+            outputs.append(out)
+        if options.render:
+            out = os.path.join(options.output_dir, f"{stem}.png")
+            if not (key and cache.output(key, "render.png", out)):
+                with phase(instrument, "finalize"):
+                    result.image = engine.render(result)
+                    flatten_on_white(result.image).save(out)
+                if key: cache.add_output(key, "render.png", out)
+            outputs.append(out)
+        if profiler is not None:
+            out = os.path.join(options.profile_dir, f"{stem}.profile.json")
+            profiler.dump(out)
+            outputs.append(out)
+    except Exception as e:
+        return JobResult(path, False, elapsed=time.perf_counter() - t0, error=f"{type(e).__name__}: {e}")
+    return JobResult(path, True, len(result.sequence) - 1, time.perf_counter() - t0, outputs,
+                     report=result.report, stopped=result.stopped, cached=result.cached)
+
+
+def _job_instrument(stem, params, options):
+    # (Instrumentation, Profiler) задания; без профиля и журнала - (None, None)
+    if not options.profile_dir and not options.log_events:
+        return None, None
+    instrument = Instrumentation(trace_memory=options.trace_memory)
+    profiler = None
+    if options.profile_dir:
+        os.makedirs(options.profile_dir, exist_ok=True)
+        profiler = Profiler({"job": stem, "params": params.to_dict()}).attach(instrument)
+    if options.log_events:
+        instrument.subscribe(log_sink(), ("phase", "line", "memory"))
+    return instrument, profiler
+
+
+def _job_checkpoint(stem, params, options):
+    # (путь чекпоинта, аргументы solve). Подходящий чекпоинт продолжается:
+    # после сбоя - до params.lines, после завершения - добавляются недостающие линии.
+    # Чекпоинт с другими параметрами не используется; с другим фото (хэш в чекпоинте) -
+    # отвергается при продолжении (CheckpointMismatch), и расчет идет с нуля.
+    if not options.checkpoint_dir:
+        return None, {}
+    os.makedirs(options.checkpoint_dir, exist_ok=True)
+    path = os.path.join(options.checkpoint_dir, f"{stem}.ckpt.npz")
+    args = {}
+    if options.checkpoint_every:
+        args.update(checkpoint_every=options.checkpoint_every, on_checkpoint=lambda c: c.save(path))
+    if os.path.exists(path):
+        ckpt = Checkpoint.load(path)
+        if ckpt.matches(params) and ckpt.lines_done <= params.lines:
+            args["checkpoint"] = ckpt
+    return path, args
+
+
+def _process_color_photo(path, stem, params, options, t0):
+    rgb = prepare_color(_job_photo(path, options), options.brightness, options.contrast, params.calc_size)
+    layers = solve_color(rgb, params, options.colors, workers=options.color_workers)
+    outputs = []
+    for layer in layers:
+        for f in options.formats:
+            out = os.path.join(options.output_dir, f"{stem}_{layer.name}.{f}")
+            write_instructions(out, layer.sequence, params.nails, color=layer.hex, params=params,
+                               diameter=options.diameter_mm)
+            outputs.append(out)
+    if options.render:
+        nails = get_chord_index(params.nails, params.calc_size).nails
+        out = os.path.join(options.output_dir, f"{stem}.png")
+        flatten_on_white(render_color(layers, nails, params.calc_size)).save(out)
+        outputs.append(out)
+    lines = sum(len(layer.sequence) - 1 for layer in layers)
+    return JobResult(path, True, lines, time.perf_counter() - t0, outputs)
+
+
+# =================================================================================
+# РАЗДЕЛЯЕМАЯ ПАМЯТЬ ДЛЯ ИНДЕКСА ХОРД
+# =================================================================================
+class SharedChordIndex:
+    # Копия массивов индекса в блоках shared_memory; владелец - главный процесс
+    def __init__(self, index):
+        self.blocks = []
+        self.spec = {"n_nails": index.n_nails, "size": index.size, "arrays": {}}
+        for name, arr in index.arrays().items():
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            self.blocks.append(shm)
+            self.spec["arrays"][name] = (shm.name, arr.shape, arr.dtype.str)
+
+    def close(self):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+
+_attached = []  # Держим ссылки на подключенные блоки, пока жив процесс
+
+def _attach(name):
+    # Рабочие процессы пула делят трекер ресурсов с главным, поэтому повторная
+    # регистрация блока безопасна; удаляет блоки только владелец (close()).
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_chord_index(spec):
+    arrays = {}
+    for name, (shm_name, shape, dtype) in spec["arrays"].items():
+        shm = _attach(shm_name)
+        _attached.append(shm)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        arrays[name] = arr
+    inverted = None
+    if "pix_offsets" in arrays:
+        inverted = (arrays["pix_offsets"], arrays["pix_rows"])
+    index = ChordIndex.from_arrays(spec["n_nails"], spec["size"], arrays["pair_row"],
+                                   arrays["offsets"], arrays["pixels"], inverted)
+    register_chord_index(index)
+    return index
+
+
+# =================================================================================
+# ПУЛ ПРОЦЕССОВ
+# =================================================================================
+_events = None
+
+def _init_worker(specs, events):
+    global _events
+    _events = events
+    for spec in specs:
+        attach_chord_index(spec)
+
+
+def _run_job(job_id, path, params, options):
+    def progress(i, max_lines):
+        _events.put((job_id, i, max_lines))
+    return job_id, process_photo(path, params, options, progress)
+
+
+def run_batch(paths, params, options, workers=None, on_progress=None, on_done=None):
+    # on_progress(path, i, max_lines) - ход расчета задания,
+    # on_done(JobResult) - задание завершено (успешно или с ошибкой).
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(options.output_dir, exist_ok=True)
+    # Индексы всех уровней пирамиды; инкрементальный режим нужен только черновику
+    levels = pyramid_levels(params)
+    indexes = [get_chord_index(params.nails, size) for size in levels]
+    if use_incremental(params):
+        indexes[0].inverted()
+
+    results = [None] * len(paths)
+    t0 = time.perf_counter()
+
+    if workers == 1:
+        for n, path in enumerate(paths):
+            progress = (lambda i, m, p=path: on_progress(p, i, m)) if on_progress else None
+            results[n] = process_photo(path, params, options, progress)
+            if on_done: on_done(results[n])
+        return BatchReport(results, workers, time.perf_counter() - t0)
+
+    shared = [SharedChordIndex(index) for index in indexes]
+    ctx = mp.get_context()
+    events = ctx.Queue()
+    stop = threading.Event()
+
+    def pump():
+        # Пересылаем прогресс из рабочих процессов в колбэк главного процесса
+        while not stop.is_set():
+            try:
+                job_id, i, max_lines = events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if on_progress: on_progress(paths[job_id], i, max_lines)
+
+    pump_thread = threading.Thread(target=pump, daemon=True)
+    pump_thread.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=([sh.spec for sh in shared], events)) as pool:
+            futures = {pool.submit(_run_job, n, path, params, options): n for n, path in enumerate(paths)}
+            for fut in as_completed(futures):
+                n = futures[fut]
+                try:
+                    _, results[n] = fut.result()
+                except Exception as e:
+                    # Упал сам рабочий процесс - остальные задания продолжают считаться
+                    results[n] = JobResult(paths[n], False, error=f"{type(e).__name__}: {e}")
+                if on_done: on_done(results[n])
+    finally:
+        stop.set()
+        pump_thread.join()
+        for sh in shared:
+            sh.close()
+    return BatchReport(results, workers, time.perf_counter() - t0)
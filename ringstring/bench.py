@@ -0,0 +1,224 @@
+"""Бенчмарк и контроль качества алгоритма: python -m ringstring.bench.
+
+Прогоняет расчет без интерфейса на синтетических и встроенных фото по сетке
+параметров, пишет JSON (линий/с, время по фазам, пик памяти, ошибка
+реконструкции, хэш последовательности) и сравнивает с сохраненной базой.
+Эталонные последовательности: оптимизированные варианты решателя должны
+давать ту же последовательность, что и основной путь, а хэши - совпадать с базой.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import replace
+
+import numpy as np
+from PIL import Image
+
+from .engine import (
+    SolverParams, adjust_photo, fit_to_hoop, solve, render_strings, reconstruction_error,
+)
+from .geometry import get_chord_index
+from .jit import NUMBA_AVAILABLE
+
+BENCH_VERSION = 1
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_IMAGES = ("1.jpg", "3.jpg")
+
+FULL_GRID = {"nails": (100, 240, 360), "lines": (1000, 3000, 6000), "weight": (10, 30, 150)}
+QUICK_GRID = {"nails": (240,), "lines": (1000,), "weight": (30,)}
+
+# Варианты решателя, которые обязаны давать ту же последовательность, что и основной
+SOLVER_VARIANTS = {
+    "incremental": lambda p: replace(p, incremental=True),
+    "numpy": lambda p: replace(p, backend="numpy"),
+}
+if NUMBA_AVAILABLE:
+    SOLVER_VARIANTS["numba"] = lambda p: replace(p, backend="numba")
+
+
+# =================================================================================
+# ИЗОБРАЖЕНИЯ
+# =================================================================================
+def synthetic_image(name, size=500):
+    yy, xx = np.mgrid[0:size, 0:size] / (size - 1) * 2 - 1
+    r = np.hypot(xx, yy)
+    if name == "gradient":
+        arr = 255 * np.clip(r, 0, 1)
+    elif name == "rings":
+        arr = 127.5 + 127.5 * np.cos(r * 6 * np.pi)
+    else:
+        raise ValueError(f"Неизвестное синтетическое изображение: {name}")
+    return Image.fromarray(arr.astype(np.uint8), "L")
+
+
+def load_bench_images(names=None):
+    # {имя: изображение "L"}, до подгонки под круг
+    images = {"gradient": synthetic_image("gradient"), "rings": synthetic_image("rings")}
+    for fname in BUNDLED_IMAGES:
+        path = os.path.join(REPO_DIR, fname)
+        if os.path.exists(path):
+            images[fname] = adjust_photo(Image.open(path))
+    if names:
+        images = {k: v for k, v in images.items() if k in names}
+    return images
+
+
+def sequence_hash(sequence):
+    return hashlib.sha256(np.asarray(sequence, dtype=np.uint16).tobytes()).hexdigest()
+
+
+# =================================================================================
+# ПРОГОН
+# =================================================================================
+def run_case(image, params, measure_memory=False, check_variants=True):
+    phases = {}
+    t = time.perf_counter()
+    calc_img = fit_to_hoop(image, params.calc_size)
+    phases["prepare"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    index = get_chord_index(params.nails, params.calc_size)
+    phases["geometry"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    result = solve(calc_img, params)
+    phases["solve"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    render_strings(result.sequence, index.nails, params.calc_size)
+    phases["render"] = time.perf_counter() - t
+
+    lines = len(result.sequence) - 1
+    case = {
+        "params": params.to_dict(),
+        "lines_done": lines,
+        "lines_per_sec": lines / phases["solve"] if phases["solve"] else 0.0,
+        "phases": phases,
+        "rmse": reconstruction_error(calc_img, result.sequence, params),
+        "sequence_sha256": sequence_hash(result.sequence),
+    }
+
+    if measure_memory:
+        # Отдельный прогон: tracemalloc замедляет расчет и портит замер скорости
+        tracemalloc.start()
+        solve(calc_img, params)
+        render_strings(result.sequence, index.nails, params.calc_size)
+        case["peak_mem_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+        tracemalloc.stop()
+
+    if check_variants:
+        case["variants"] = {}
+        for name, make in SOLVER_VARIANTS.items():
+            t = time.perf_counter()
+            seq = solve(calc_img, make(params)).sequence
+            case["variants"][name] = {"identical": seq == result.sequence,
+                                      "seconds": time.perf_counter() - t}
+    return case
+
+
+def case_key(case):
+    p = case["params"]
+    return f"{case['image']}|n{p['nails']}|l{p['lines']}|w{p['line_weight']}"
+
+
+def run_benchmark(grid, images, base_params=None, measure_memory=False, check_variants=True, log=print):
+    base_params = base_params or SolverParams()
+    cases = []
+    for img_name, image in images.items():
+        for n in grid["nails"]:
+            for lines in grid["lines"]:
+                for weight in grid["weight"]:
+                    params = replace(base_params, nails=n, lines=lines, line_weight=weight)
+                    case = run_case(image, params, measure_memory, check_variants)
+                    case["image"] = img_name
+                    cases.append(case)
+                    if log:
+                        bad = [k for k, v in case.get("variants", {}).items() if not v["identical"]]
+                        log(f"{case_key(case)}: {case['lines_per_sec']:.0f} линий/с, "
+                            f"rmse {case['rmse']:.2f}" + (f", РАСХОЖДЕНИЕ: {bad}" if bad else ""))
+    return {
+        "version": BENCH_VERSION,
+        "platform": {"python": platform.python_version(), "numpy": np.__version__,
+                     "machine": platform.machine(), "cpu_count": os.cpu_count()},
+        "cases": cases,
+    }
+
+
+def compare(report, baseline, speed_tolerance=0.2, error_tolerance=1e-3):
+    # Регрессия: скорость упала больше допуска, ошибка выросла, либо изменилась
+    # последовательность (эталонная проверка)
+    base = {case_key(c): c for c in baseline.get("cases", [])}
+    rows, regressions = [], 0
+    for case in report["cases"]:
+        key = case_key(case)
+        old = base.get(key)
+        if old is None: continue
+        row = {
+            "case": key,
+            "speed_ratio": case["lines_per_sec"] / old["lines_per_sec"] if old["lines_per_sec"] else None,
+            "rmse_delta": case["rmse"] - old["rmse"],
+            "golden": case["sequence_sha256"] == old["sequence_sha256"],
+        }
+        row["regression"] = (
+            not row["golden"]
+            or row["rmse_delta"] > error_tolerance
+            or (row["speed_ratio"] is not None and row["speed_ratio"] < 1 - speed_tolerance)
+        )
+        regressions += row["regression"]
+        rows.append(row)
+    return {"cases": rows, "regressions": regressions}
+
+
+# =================================================================================
+# КОМАНДНАЯ СТРОКА
+# =================================================================================
+def _int_list(text):
+    return tuple(int(x) for x in text.split(",") if x.strip())
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m ringstring.bench",
+                                description="Бенчмарк и контроль качества решателя.")
+    p.add_argument("-o", "--output", default="bench_results.json", help="куда сохранить JSON")
+    p.add_argument("--quick", action="store_true", help="одна точка сетки вместо полной")
+    p.add_argument("--nails", type=_int_list, help="список через запятую")
+    p.add_argument("--lines", type=_int_list, help="список через запятую")
+    p.add_argument("--weights", type=_int_list, help="список через запятую")
+    p.add_argument("--images", help="имена изображений через запятую (gradient,rings,1.jpg,3.jpg)")
+    p.add_argument("--memory", action="store_true", help="замерять пик памяти (tracemalloc)")
+    p.add_argument("--no-variants", action="store_true", help="не сверять варианты решателя")
+    p.add_argument("--baseline", help="JSON с базой для сравнения")
+    p.add_argument("--speed-tolerance", type=float, default=0.2, help="допустимое падение скорости (доля)")
+    args = p.parse_args(argv)
+
+    grid = dict(QUICK_GRID if args.quick else FULL_GRID)
+    if args.nails: grid["nails"] = args.nails
+    if args.lines: grid["lines"] = args.lines
+    if args.weights: grid["weight"] = args.weights
+    images = load_bench_images(args.images.split(",") if args.images else None)
+
+    report = run_benchmark(grid, images, measure_memory=args.memory, check_variants=not args.no_variants)
+    failed = sum(not v["identical"] for c in report["cases"] for v in c.get("variants", {}).values())
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.speed_tolerance)
+        for row in report["comparison"]["cases"]:
+            if row["regression"]:
+                print(f"РЕГРЕССИЯ {row['case']}: скорость x{row['speed_ratio']:.2f}, "
+                      f"rmse {row['rmse_delta']:+.3f}, эталон {'OK' if row['golden'] else 'ИЗМЕНЕН'}")
+        failed += report["comparison"]["regressions"]
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
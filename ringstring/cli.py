@@ -0,0 +1,148 @@
+"""Пакетная генерация схем из командной строки: python -m ringstring."""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from .background import rembg_available, rembg_error
+from .batch import JobOptions, run_batch
+from .color import parse_palette
+from .engine import (CALC_SIZE, INCREMENTAL_MIN_LINES, STRATEGIES, SolverParams, check_params,
+                     format_strategy_report)
+from .export import DIAMETER_MM
+from .geometry import configure_geometry_cache
+from .jit import BACKENDS
+from .results import configure_result_cache
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+FORMATS = ("txt", "json", "csv", "rsq", "svg", "pdf")
+
+
+def find_images(path):
+    if os.path.isfile(path):
+        return [path]
+    names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTS))
+    return [os.path.join(path, n) for n in names]
+
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="python -m ringstring",
+                                description="Пакетная генерация схем стринг-арта из фото.")
+    p.add_argument("input", help="фото или папка с фото (*.jpg, *.png)")
+    p.add_argument("-o", "--output", default="ringstring_out", help="папка для результатов")
+    p.add_argument("--nails", type=int, default=240, help="кол-во гвоздей")
+    p.add_argument("--lines", type=int, default=3000, help="кол-во линий")
+    p.add_argument("--weight", type=int, default=30, help="плотность нити при расчете")
+    p.add_argument("--skip", type=int, default=15, help="пропуск соседних гвоздей")
+    p.add_argument("--brightness", type=float, default=1.0)
+    p.add_argument("--contrast", type=float, default=1.0)
+    p.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=None,
+                   help="инкрементальный расчет (по умолчанию - от %d линий)" % INCREMENTAL_MIN_LINES)
+    p.add_argument("--calc-size", type=int, default=CALC_SIZE, help="разрешение расчета (px)")
+    p.add_argument("--strategy", default="greedy", choices=sorted(STRATEGIES),
+                   help="выбор линии: greedy - жадно, beam - просмотр на несколько линий вперед")
+    p.add_argument("--beam-width", type=int, default=4, help="beam: сколько лучших линий раскрывать")
+    p.add_argument("--lookahead", type=int, default=2, help="beam: на сколько линий смотреть вперед")
+    p.add_argument("--time-budget", type=float, default=0.0,
+                   help="beam: секунд на просмотр вперед на фото, дальше жадно (0 - без ограничения)")
+    p.add_argument("--compare-greedy", action="store_true",
+                   help="не жадная стратегия: еще и жадный расчет, вывести выигрыш (вдвое дольше)")
+    p.add_argument("--backend", default="auto", choices=BACKENDS,
+                   help="жадный цикл: numba - JIT-ядро, numpy, auto - numba, если установлена")
+    p.add_argument("--draft-size", type=int, default=0,
+                   help="пирамида: черновик на этом разрешении, затем уточнение (0 - выкл.)")
+    p.add_argument("--formats", default="txt,json,csv", help="форматы схемы через запятую (txt, json, csv, rsq, svg, pdf)")
+    p.add_argument("--diameter", type=float, default=DIAMETER_MM,
+                   help="диаметр обруча, мм: SVG / PDF печатаются в натуральную величину")
+    p.add_argument("--no-render", action="store_true", help="не сохранять PNG с рендером")
+    p.add_argument("--remove-bg", action="store_true", help="удалить фон (rembg) перед расчетом")
+    p.add_argument("--bg-max-side", type=int, default=0,
+                   help="rembg на уменьшенной копии фото (px по большей стороне, 0 - полный размер)")
+    p.add_argument("--colors", default="",
+                   help="цветной режим: cmy, cmyk или цвета нитей через запятую (#d62828,black)")
+    p.add_argument("--geometry-cache", help="папка дискового кэша геометрии (\"\" - выключить)")
+    p.add_argument("--geometry-cache-mb", type=float, help="бюджет кэша геометрии, МБ")
+    p.add_argument("--result-cache", help="папка дискового кэша результатов (\"\" - выключить)")
+    p.add_argument("--result-cache-mb", type=float, help="бюджет кэша результатов, МБ")
+    p.add_argument("--no-cache", action="store_true", help="всегда считать заново, не используя кэш результатов")
+    p.add_argument("-j", "--workers", type=int, default=1, help="кол-во процессов (0 - все ядра)")
+    p.add_argument("--report", help="сохранить отчет о пакете в JSON")
+    p.add_argument("--checkpoint-dir", default="",
+                   help="папка чекпоинтов: повторный запуск продолжает расчет или добавляет линии")
+    p.add_argument("--checkpoint-every", type=int, default=500, help="сохранять чекпоинт каждые N линий")
+    p.add_argument("--profile", default="", help="папка для JSON-профилей заданий (фазы, след по линиям)")
+    p.add_argument("--trace-memory", action="store_true", help="добавить в профиль снимок tracemalloc")
+    p.add_argument("-v", "--verbose", action="store_true", help="выводить фазы расчета в журнал")
+    return p
+
+
+def params_from_args(args):
+    return SolverParams(nails=args.nails, lines=args.lines, line_weight=args.weight,
+                        skip_nails=args.skip, incremental=args.incremental,
+                        calc_size=args.calc_size, draft_size=args.draft_size,
+                        strategy=args.strategy, beam_width=args.beam_width, lookahead=args.lookahead,
+                        time_budget=args.time_budget, backend=args.backend)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    for f in formats:
+        if f not in FORMATS:
+            print(f"Неизвестный формат: {f}", file=sys.stderr)
+            return 2
+
+    params = params_from_args(args)
+    try:
+        check_params(params)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(processName)s %(message)s")
+    configure_geometry_cache(args.geometry_cache, args.geometry_cache_mb)
+    configure_result_cache(args.result_cache, args.result_cache_mb)
+    images = find_images(args.input)
+    if not images:
+        print("Фото не найдены", file=sys.stderr)
+        return 1
+    workers = args.workers or os.cpu_count()
+    # Параллелим либо фото, либо цветные слои одного фото
+    options = JobOptions(output_dir=args.output, formats=tuple(formats), render=not args.no_render,
+                         brightness=args.brightness, contrast=args.contrast, colors=args.colors,
+                         color_workers=os.cpu_count() if workers == 1 else 1,
+                         profile_dir=args.profile, trace_memory=args.trace_memory,
+                         log_events=args.verbose, checkpoint_dir=args.checkpoint_dir,
+                         checkpoint_every=args.checkpoint_every,
+                         remove_bg=args.remove_bg, bg_max_side=args.bg_max_side,
+                         use_cache=not args.no_cache, diameter_mm=args.diameter,
+                         compare_greedy=args.compare_greedy)
+    if args.colors:
+        try:
+            parse_palette(args.colors)
+        except ValueError as e:
+            print(f"Неверная палитра --colors: {e}", file=sys.stderr)
+            return 2
+    if args.remove_bg and not rembg_available():
+        print(f"rembg недоступен: {rembg_error()}", file=sys.stderr)
+        return 2
+    done = []
+
+    def on_done(res):
+        done.append(res)
+        if res.ok:
+            print(f"[{len(done)}/{len(images)}] {res.path}: {res.lines} линий за {res.elapsed:.1f} с"
+                  + (" (из кэша)" if res.cached else ""))
+            if res.report and "greedy_error" in res.report:
+                print("    " + format_strategy_report(res.report))
+        else:
+            print(f"[{len(done)}/{len(images)}] {res.path}: ОШИБКА {res.error}", file=sys.stderr)
+
+    report = run_batch(images, params, options, workers=workers, on_done=on_done)
+    print(report.summary())
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+    return 1 if report.failed else 0
@@ -0,0 +1,157 @@
+"""Цветной стринг-арт: фото делится на слои по цветам нитей, слои считаются параллельно.
+
+Каждый цвет нити - отдельная схема на своей матрице ошибки (тот же жадный
+алгоритм, что и для черной нити). Слои не зависят друг от друга, поэтому
+считаются в отдельных процессах, и время растет с числом ядер, а не цветов.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from .engine import (
+    CALC_SIZE, RENDER_SIZE, fit_to_hoop, pyramid_levels, solve,
+    render_size, thread_density, density_to_alpha, strings_layer,
+)
+from .geometry import get_chord_index
+
+CMY = [("cyan", (0, 255, 255)), ("magenta", (255, 0, 255)), ("yellow", (255, 255, 0))]
+CMYK = CMY + [("black", (0, 0, 0))]
+PALETTES = {"cmy": CMY, "cmyk": CMYK}
+
+
+@dataclass
+class ColorLayer:
+    name: str
+    rgb: tuple
+    sequence: list
+
+    @property
+    def hex(self):
+        return "#%02x%02x%02x" % self.rgb
+
+
+def parse_palette(spec):
+    # "cmy", "cmyk" или список цветов через запятую: "#d62828,#003049,black"
+    if spec.lower() in PALETTES:
+        return PALETTES[spec.lower()]
+    palette = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part: continue
+        rgb = Image.new("RGB", (1, 1), part).getpixel((0, 0))
+        name = part.lstrip("#").lower()
+        palette.append((name, rgb))
+    if not palette: raise ValueError(f"Пустая палитра: {spec!r}")
+    return palette
+
+
+def adjust_color_photo(img, brightness=1.0, contrast=1.0):
+    img = img.convert("RGB")
+    img = ImageEnhance.Brightness(img).enhance(brightness)
+    return ImageEnhance.Contrast(img).enhance(contrast)
+
+
+# =================================================================================
+# РАЗДЕЛЕНИЕ НА СЛОИ
+# Каждый слой - изображение "L", где темнее = больше нити этого цвета,
+# т.е. ровно то, что ожидает solve().
+# =================================================================================
+def _ink_cmyk(rgb, with_black):
+    cmy = 1.0 - rgb
+    if not with_black:
+        return [cmy[..., i] for i in range(3)]
+    k = cmy.min(axis=-1)
+    rest = np.where(k < 1.0, 1.0 - k, 1.0)[..., None]
+    cmy = (cmy - k[..., None]) / rest
+    return [cmy[..., i] for i in range(3)] + [k]
+
+
+def _ink_palette(rgb, palette):
+    # Пиксель относится к ближайшему цвету палитры (или к белому фону);
+    # насыщенность слоя падает с расстоянием от цвета нити до цвета пикселя
+    colors = np.array([c for _, c in palette], dtype=np.float32) / 255.0
+    dist = np.linalg.norm(rgb[..., None, :] - colors, axis=-1)
+    dist_white = np.linalg.norm(rgb - 1.0, axis=-1)
+    nearest = np.argmin(dist, axis=-1)
+    span = np.linalg.norm(colors - 1.0, axis=-1)
+    inks = []
+    for k in range(len(palette)):
+        ink = np.clip(1.0 - dist[..., k] / max(span[k], 1e-6), 0.0, 1.0)
+        inks.append(np.where((nearest == k) & (dist[..., k] < dist_white), ink, 0.0))
+    return inks
+
+
+def split_layers(rgb_img, palette):
+    rgb = np.asarray(rgb_img.convert("RGB"), dtype=np.float32) / 255.0
+    if palette is CMY or palette is CMYK:
+        inks = _ink_cmyk(rgb, palette is CMYK)
+    else:
+        inks = _ink_palette(rgb, palette)
+    layers = []
+    for (name, color), ink in zip(palette, inks):
+        img = Image.fromarray(np.round(255 * (1.0 - ink)).astype(np.uint8), "L")
+        layers.append((name, color, img))
+    return layers
+
+
+def prepare_color(image, brightness=1.0, contrast=1.0, calc_size=CALC_SIZE):
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    return fit_to_hoop(adjust_color_photo(image, brightness, contrast), calc_size)
+
+
+# =================================================================================
+# РАСЧЕТ СЛОЕВ
+# =================================================================================
+def split_lines(total, layer_imgs):
+    # Общий бюджет линий делится пропорционально количеству "чернил" в слое
+    ink = np.array([255.0 - np.asarray(img, dtype=np.float32).mean() for img in layer_imgs])
+    if ink.sum() <= 0:
+        return [max(1, total // len(layer_imgs))] * len(layer_imgs)
+    return [max(1, int(round(total * k / ink.sum()))) for k in ink]
+
+
+def _solve_layer(layer_img, params):
+    return solve(layer_img, params).sequence
+
+
+def solve_color(rgb_calc_img, params, palette="cmyk", workers=None, on_layer=None):
+    # on_layer(ColorLayer) - слой готов. Возвращает список ColorLayer в порядке палитры.
+    if isinstance(palette, str):
+        palette = parse_palette(palette)
+    split = split_layers(rgb_calc_img, palette)
+    lines = split_lines(params.lines, [img for _, _, img in split])
+    jobs = [(img, replace(params, lines=n)) for (_, _, img), n in zip(split, lines)]
+
+    # Индекс хорд готовим до запуска процессов: при fork он наследуется,
+    # иначе процессы открывают его из дискового кэша (mmap) и делят страницы
+    for size in pyramid_levels(params):
+        get_chord_index(params.nails, size)
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    layers = [None] * len(jobs)
+    if workers == 1:
+        for k, job in enumerate(jobs):
+            layers[k] = ColorLayer(split[k][0], split[k][1], _solve_layer(*job))
+            if on_layer: on_layer(layers[k])
+        return layers
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_solve_layer, *job) for job in jobs]
+        for k, fut in enumerate(futures):
+            layers[k] = ColorLayer(split[k][0], split[k][1], fut.result())
+            if on_layer: on_layer(layers[k])
+    return layers
+
+
+def render_color(layers, nails, calc_size=CALC_SIZE, size=RENDER_SIZE):
+    # Слои накладываются в порядке палитры (черный в CMYK - последним)
+    size = render_size(size)
+    img = Image.new("RGBA", (size, size), (255, 255, 255, 0))
+    for layer in layers:
+        alpha = density_to_alpha(thread_density(layer.sequence, nails, calc_size, size))
+        img = Image.alpha_composite(img, strings_layer(alpha, layer.rgb))
+    return img
@@ -0,0 +1,90 @@
+"""Пакетная конвертация архива схем: python -m ringstring.convert.
+
+Переводит TXT / JSON / CSV / RSQ в нужный формат (по умолчанию - компактный RSQ),
+сохраняя структуру папок. Файлы читаются и пишутся потоково.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .formats import RSQ_EXT, convert_instructions
+
+SCHEME_EXTS = (".txt", ".json", ".csv", RSQ_EXT)
+
+
+def find_schemes(root):
+    if os.path.isfile(root):
+        return [root]
+    found = []
+    for dirpath, _, names in os.walk(root):
+        found += [os.path.join(dirpath, n) for n in sorted(names) if n.lower().endswith(SCHEME_EXTS)]
+    return found
+
+
+def _convert_one(job):
+    src, dst, default_nails = job
+    try:
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        convert_instructions(src, dst, default_nails)
+        return src, os.path.getsize(src), os.path.getsize(dst), ""
+    except Exception as e:
+        return src, 0, 0, f"{type(e).__name__}: {e}"
+
+
+def convert_archive(src, dst_dir, fmt="rsq", default_nails=240, workers=1, on_done=None):
+    # on_done(src, ошибка) - файл обработан. Возвращает (файлов, ошибок, байт было, байт стало)
+    base = src if os.path.isdir(src) else os.path.dirname(src)
+    jobs, taken = [], set()
+    for path in find_schemes(src):
+        rel, ext = os.path.splitext(os.path.relpath(path, base))
+        # Одна схема в нескольких форматах (1.txt, 1.json) не должна перезаписывать саму себя
+        dst = f"{rel}.{fmt}" if rel not in taken else f"{rel}_{ext.lstrip('.').lower()}.{fmt}"
+        taken.add(rel)
+        jobs.append((path, os.path.join(dst_dir, dst), default_nails))
+
+    if workers == 1:
+        results = map(_convert_one, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_convert_one, jobs, chunksize=64)
+    done = failed = size_in = size_out = 0
+    try:
+        for path, n_in, n_out, error in results:
+            done += 1
+            failed += bool(error)
+            size_in += n_in
+            size_out += n_out
+            if on_done: on_done(path, error)
+    finally:
+        if pool is not None: pool.shutdown()
+    return done, failed, size_in, size_out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m ringstring.convert",
+                                description="Конвертация архива схем (TXT/JSON/CSV/RSQ).")
+    p.add_argument("input", help="файл схемы или папка (обходится рекурсивно)")
+    p.add_argument("-o", "--output", required=True, help="папка для результатов")
+    p.add_argument("--to", default="rsq", choices=("rsq", "txt", "json", "csv", "svg", "pdf"),
+                   help="целевой формат (svg, pdf - шаблон для печати)")
+    p.add_argument("--nails", type=int, default=240, help="кол-во гвоздей, если в файле не указано")
+    p.add_argument("-j", "--workers", type=int, default=1, help="кол-во процессов (0 - все ядра)")
+    args = p.parse_args(argv)
+
+    def on_done(path, error):
+        if error: print(f"{path}: ОШИБКА {error}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    done, failed, size_in, size_out = convert_archive(
+        args.input, args.output, args.to, args.nails, args.workers or os.cpu_count() or 1, on_done)
+    ratio = size_out / size_in if size_in else 0.0
+    print(f"Файлов: {done} (ошибок: {failed}), {size_in / 1024:.0f} КБ -> {size_out / 1024:.0f} КБ "
+          f"(x{ratio:.2f}), {time.perf_counter() - t0:.1f} с")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,840 @@
+"""Расчет схемы без интерфейса: подготовка фото, жадный алгоритм, рендер нитей.
+
+Модуль не импортирует tkinter и работает на серверах без дисплея.
+"""
+import hashlib
+import json
+import math
+import os
+import time
+from dataclasses import dataclass, asdict, replace
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageOps, ImageDraw, ImageEnhance
+
+from .geometry import get_chord_index, ChordScoreTable
+from .instrument import phase, memory_trace
+from .jit import JitGreedy, use_jit
+
+CALC_SIZE = 500     # Размер изображения, на котором идет расчет
+RENDER_SIZE = 2000  # Размер финального рендера нитей
+CHECKPOINT_VERSION = 1
+ALGORITHM_VERSION = 2  # Меняется при любом изменении результата расчета (ключ кэша результатов)
+# Параметры, от которых последовательность не зависит (JIT-ядро и таблица счета
+# совпадают с обычным расчетом бит в бит)
+NO_EFFECT = ("backend", "incremental")
+
+
+@dataclass
+class SolverParams:
+    nails: int = 240
+    lines: int = 3000
+    line_weight: int = 30    # "Вес" одной нити
+    skip_nails: int = 15     # Пропуск соседей
+    calc_size: int = CALC_SIZE
+    incremental: bool | None = None  # Таблица счета хорд; None - по числу линий (use_incremental)
+    draft_size: int = 0      # Пирамида: черновик на этом размере (0 - выключено)
+    refine_radius: int = 3   # Пирамида: насколько гвоздей можно сдвинуть точку при уточнении
+    strategy: str = "greedy" # Выбор следующей линии (см. STRATEGIES)
+    beam_width: int = 4      # "beam": сколько лучших линий раскрывается на каждом шаге просмотра
+    lookahead: int = 2       # "beam": на сколько линий вперед смотреть
+    time_budget: float = 0.0 # "beam": секунд на просмотр вперед, дальше - жадно (0 - без ограничения)
+    backend: str = "auto"    # Жадный цикл: "numpy", "numba" (JIT) или "auto" - Numba, если есть
+
+    def to_dict(self):
+        return asdict(self)
+
+
+# С какого числа линий таблица счета окупает построение обратного индекса
+# (360 гвоздей без кэша геометрии: 1000 линий - 1.6 с против 1.0 с, 2000 - 1.8 с против 2.5 с)
+INCREMENTAL_MIN_LINES = 2000
+
+
+def use_incremental(params):
+    # Явное значение incremental побеждает; None - таблица только на длинных расчетах
+    if params.incremental is None:
+        return params.lines >= INCREMENTAL_MIN_LINES
+    return params.incremental
+
+
+# Границы как у ползунков программы; командная строка и сервис проверяют их (check_params)
+PARAM_LIMITS = {"nails": (10, 360), "lines": (1, 6000), "calc_size": (50, 2000)}
+
+
+def check_params(params):
+    # ValueError с понятным сообщением, если параметр вне PARAM_LIMITS
+    for name, (lo, hi) in PARAM_LIMITS.items():
+        value = getattr(params, name)
+        if not lo <= value <= hi:
+            raise ValueError(f"{name} = {value}: допустимо от {lo} до {hi}")
+
+
+@dataclass
+class GenerationResult:
+    params: SolverParams
+    sequence: list
+    nails: list              # Координаты гвоздей в пикселях расчета
+    stopped: bool = False
+    elapsed: float = 0.0
+    image: Image.Image = None  # Рендер нитей (RGBA), если запрошен
+    checkpoint: "Checkpoint" = None  # Состояние в конце расчета - для продолжения
+    report: dict = None      # Сводка стратегии (не жадной): сколько линий с просмотром и т.п.
+    cached: bool = False     # Взят из кэша результатов, расчет не запускался
+    cache_key: str = None    # Ключ записи в кэше результатов (None - не кэширован)
+
+
+class CheckpointMismatch(ValueError):
+    # Чекпоинт посчитан для другого фото или с другой геометрией
+    pass
+
+
+@dataclass
+class Checkpoint:
+    # Полное состояние жадного решателя: по нему расчет продолжается так же,
+    # как если бы не прерывался (текущий гвоздь - последний в sequence)
+    params: SolverParams
+    sequence: list
+    error_matrix: np.ndarray  # float32, calc_size x calc_size
+    image: str = ""           # image_digest фото расчета ("" - неизвестно: чекпоинт старой версии)
+
+    @property
+    def lines_done(self):
+        return len(self.sequence) - 1
+
+    @property
+    def current_nail(self):
+        return self.sequence[-1]
+
+    def compatible(self, params):
+        # Продолжать можно с другим числом линий, но не с другой геометрией или весом нити
+        p = self.params
+        return (p.nails, p.skip_nails, p.line_weight, p.calc_size) == \
+               (params.nails, params.skip_nails, params.line_weight, params.calc_size)
+
+    def matches(self, params):
+        # Строже compatible: совпадают все параметры, кроме числа линий и не влияющих на
+        # результат. draft_size не сравнивается - продолжение всегда идет жадным расчетом
+        skip = ("lines", "draft_size") + NO_EFFECT
+        mine, other = self.params.to_dict(), params.to_dict()
+        return all(mine[k] == other[k] for k in mine if k not in skip)
+
+    def provenance(self):
+        # Откуда состояние: фото, параметры и проложенные линии. Продолжение кэшируется
+        # только с этим ключом; None - фото неизвестно, результат не кэшируется
+        if not self.image: return None
+        h = hashlib.blake2b(digest_size=16)
+        p = {k: v for k, v in self.params.to_dict().items() if k not in NO_EFFECT}
+        h.update(json.dumps({"image": self.image, "params": p}, sort_keys=True).encode())
+        h.update(np.asarray(self.sequence, dtype=np.int32).tobytes())
+        return h.hexdigest()
+
+    def save(self, path):
+        # Атомарно: при падении во время записи старый файл остается целым
+        tmp = f"{path}.tmp{os.getpid()}.npz"
+        np.savez_compressed(tmp, version=CHECKPOINT_VERSION, params=json.dumps(self.params.to_dict()),
+                            sequence=np.asarray(self.sequence, dtype=np.int32),
+                            error_matrix=self.error_matrix, image=self.image)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != CHECKPOINT_VERSION:
+                raise ValueError(f"Неподдерживаемая версия чекпоинта: {path}")
+            params = SolverParams(**json.loads(str(data["params"])))
+            error_matrix = data["error_matrix"].astype(np.float32)
+            sequence = data["sequence"].tolist()
+            image = str(data["image"]) if "image" in data.files else ""
+        if error_matrix.shape != (params.calc_size, params.calc_size):
+            raise ValueError(f"Чекпоинт поврежден: {path}")
+        return cls(params, sequence, error_matrix, image)
+
+
+# =================================================================================
+# ПОДГОТОВКА ИЗОБРАЖЕНИЯ
+# =================================================================================
+_RAMP = Image.frombytes("L", (256, 1), bytes(range(256)))
+
+
+def photo_lut(histogram, brightness=1.0, contrast=1.0):
+    # Яркость и контраст одной таблицей на 256 значений - то же, что два прохода
+    # ImageEnhance. Среднее для контраста берется из гистограммы серого, а не из пикселей.
+    bright = ImageEnhance.Brightness(_RAMP).enhance(brightness)
+    hist = np.bincount(np.frombuffer(bright.tobytes(), dtype=np.uint8),
+                       weights=np.asarray(histogram, dtype=np.float64), minlength=256)
+    mean = int(np.dot(np.arange(256), hist) / max(hist.sum(), 1) + 0.5)
+    return list(Image.blend(Image.new("L", _RAMP.size, mean), bright, contrast).tobytes())
+
+
+def image_digest(img):
+    # Хэш подготовленного фото - по нему чекпоинт и кэш узнают свое фото
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{img.mode}|{img.size}".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def adjust_gray(gray, brightness=1.0, contrast=1.0, histogram=None):
+    # gray - уже серое изображение; гистограмму можно передать готовой
+    return gray.point(photo_lut(histogram or gray.histogram(), brightness, contrast))
+
+
+def adjust_photo(img, brightness=1.0, contrast=1.0):
+    return adjust_gray(ImageOps.grayscale(img.convert("RGB")), brightness, contrast)
+
+
+@lru_cache(maxsize=8)
+def _circle_mask(size):
+    # Общий для всех вызовов - не изменять
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+    return mask
+
+
+@lru_cache(maxsize=8)
+def _outside_circle(size):
+    return np.asarray(_circle_mask(size)) == 0
+
+
+def crop_to_hoop(processed, radius, scale=1.0, offset=(0, 0), calc_size=CALC_SIZE):
+    # offset - смещение центра фото относительно центра круга (в пикселях холста).
+    # Сначала ищется область фото под кругом, и только она пересэмплируется - сразу
+    # в calc_size, без промежуточного фото размером scale x оригинал.
+    # Со старым путем (масштаб фото, вставка в круг, resize круга) при scale = 1 пиксели
+    # совпадают, при scale > 1 - с точностью до округления LANCZOS; край круга и края
+    # фото старый путь смешивал с белым. При scale < 1 или круге меньше calc_size
+    # старый путь дважды пересэмплировал фото с увеличением, здесь оно резче -
+    # результаты заметно отличаются.
+    size = radius * 2
+    cur_w = int(processed.width * scale)
+    cur_h = int(processed.height * scale)
+    paste_x = int(offset[0] + radius - cur_w / 2)
+    paste_y = int(offset[1] + radius - cur_h / 2)
+
+    k = calc_size / size  # Пиксели круга -> пиксели расчета
+    base = np.full((calc_size, calc_size), 255, dtype=np.uint8)
+    # Часть фото внутри квадрата круга - в пикселях расчета
+    x0, y0 = math.ceil(max(paste_x, 0) * k), math.ceil(max(paste_y, 0) * k)
+    x1, y1 = math.floor(min(paste_x + cur_w, size) * k), math.floor(min(paste_y + cur_h, size) * k)
+    if x1 > x0 and y1 > y0:
+        sx, sy = processed.width / cur_w, processed.height / cur_h
+        box = (max((x0 / k - paste_x) * sx, 0), max((y0 / k - paste_y) * sy, 0),
+               min((x1 / k - paste_x) * sx, processed.width), min((y1 / k - paste_y) * sy, processed.height))
+        roi = processed.resize((x1 - x0, y1 - y0), Image.Resampling.LANCZOS, box=box)
+        base[y0:y1, x0:x1] = np.asarray(roi)
+    base[_outside_circle(calc_size)] = 255
+    return Image.fromarray(base, "L")
+
+
+def fit_to_hoop(processed, calc_size=CALC_SIZE):
+    # Для пакетного режима: центральный квадрат фото вписывается в круг целиком
+    img = ImageOps.fit(processed, (calc_size, calc_size), Image.Resampling.LANCZOS)
+    return Image.composite(img, Image.new(img.mode, img.size, "white"), _circle_mask(calc_size))
+
+
+def build_error_matrix(calc_img):
+    # Целевое изображение: 255 - черный, 0 - белый
+    target_img = ImageOps.invert(calc_img)
+    w, h = target_img.size
+
+    # Маска круга
+    msk = Image.new("L", (w, h), 0)
+    ImageDraw.Draw(msk).ellipse((0, 0, w, h), fill=255)
+    target_img = Image.composite(target_img, Image.new("L", target_img.size, 0), msk)
+
+    # Error Matrix: содержит "сколько еще нужно добавить черноты"
+    # Может уходить в минус (перечернено)
+    return np.array(target_img, dtype=np.float32)
+
+
+def suggest_params(calc_img):
+    # Подбор параметров по средней насыщенности изображения
+    avg_darkness = float(np.mean(np.array(ImageOps.invert(calc_img))))
+    if avg_darkness < 30:
+        lines, opacity = 2500, 20
+    elif avg_darkness < 60:
+        lines, opacity = 3000, 30
+    elif avg_darkness < 100:
+        lines, opacity = 3500, 35
+    else:
+        lines, opacity = 4000, 45
+    return SolverParams(nails=240, lines=lines, line_weight=opacity), avg_darkness
+
+
+# =================================================================================
+# ГЛАВНЫЙ АЛГОРИТМ (ERROR MINIMIZATION)
+# progress(i, max_lines) - каждые 25 линий, on_line(i, a, b) - после каждой линии,
+# should_stop() - проверяется перед каждой линией.
+# instrument - Instrumentation (см. instrument.py): фазы, след по линиям, память.
+# checkpoint - продолжить с сохраненного состояния (calc_img тогда не нужен);
+# on_checkpoint(Checkpoint) - снимок состояния каждые checkpoint_every линий.
+# =================================================================================
+def solve(calc_img, params, progress=None, on_line=None, should_stop=None, instrument=None,
+          checkpoint=None, checkpoint_every=0, on_checkpoint=None):
+    if params.strategy not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия: {params.strategy}")
+    with memory_trace(instrument):
+        if checkpoint is None and len(pyramid_levels(params)) > 1:
+            return solve_pyramid(calc_img, params, progress, on_line, should_stop, instrument)
+        return solve_greedy(calc_img, params, progress, on_line, should_stop, instrument,
+                            checkpoint, checkpoint_every, on_checkpoint)
+
+
+def resume(checkpoint, lines=None, **callbacks):
+    # Продолжить прерванный расчет (lines=None) или добавить линий: lines - новое общее число
+    params = replace(checkpoint.params, lines=lines or checkpoint.params.lines)
+    return solve(None, params, checkpoint=checkpoint, **callbacks)
+
+
+def solve_greedy(calc_img, params, progress=None, on_line=None, should_stop=None, instrument=None,
+                 checkpoint=None, checkpoint_every=0, on_checkpoint=None):
+    t0 = time.perf_counter()
+    if checkpoint is not None:
+        if not checkpoint.compatible(params):
+            raise CheckpointMismatch("Чекпоинт посчитан с другими гвоздями, весом нити или размером")
+        image = checkpoint.image
+        if calc_img is not None and image and image != image_digest(calc_img):
+            raise CheckpointMismatch("Чекпоинт посчитан для другого фото")
+        error_matrix = checkpoint.error_matrix.copy()
+    else:
+        with phase(instrument, "mask"):
+            error_matrix = build_error_matrix(calc_img)
+        image = image_digest(calc_img)
+    w = error_matrix.shape[1]
+
+    # Пиксели всех хорд берем из готового индекса (строится один раз)
+    err_flat = error_matrix.ravel()
+    with phase(instrument, "geometry"):
+        index = get_chord_index(params.nails, w)
+        candidates = index.candidates(params.skip_nails)
+        # Инкрементальный режим: суммы всех хорд хранятся и обновляются после каждой нити
+        # (JIT-ядру таблица не нужна - оно пересчитывает суммы без интерпретатора)
+        table = ChordScoreTable(index, err_flat) if use_incremental(params) and not use_jit(params.backend) else None
+        # Жадная стратегия - просто argmax, остальные выбирают линию сами
+        picker = STRATEGIES[params.strategy](index, candidates, err_flat, params)
+
+    sequence = list(checkpoint.sequence) if checkpoint is not None else [0]
+    curr = sequence[-1]
+    stopped = False
+
+    line_weight = float(params.line_weight)
+    max_lines = params.lines
+
+    # Что нужно подписчикам - решается один раз, а не на каждой линии
+    timed = want_lines = want_residual = want_progress = False
+    if instrument is not None:
+        timed = instrument.wants("phase")
+        want_lines = instrument.wants("line")
+        want_residual = want_lines and instrument.trace_residual
+        want_progress = instrument.wants("progress")
+    t_scoring = t_apply = 0.0
+    residual = None
+    if want_residual:
+        residual = float(np.maximum(err_flat, 0).sum())  # Сколько черноты еще не покрыто
+
+    if picker is None and not want_residual and use_jit(params.backend):
+        # JIT-ядро: весь цикл по линиям без интерпретатора, колбэки - после каждой пачки
+        if timed: t = time.perf_counter()
+        stopped = _solve_jit(JitGreedy(index, params.skip_nails, err_flat, line_weight), sequence, params,
+                             error_matrix, progress, on_line, should_stop, instrument,
+                             checkpoint_every, on_checkpoint, image)
+        if timed: t_scoring += time.perf_counter() - t  # Выбор и вычитание в ядре не разделяются
+    else:
+        for i in range(len(sequence) - 1, max_lines):
+            if should_stop is not None and should_stop():
+                stopped = True
+                break
+
+            targets, rows = candidates[curr]
+            if len(targets) == 0: break
+
+            # СУТЬ АЛГОРИТМА: Считаем сумму значений под каждой линией (сразу для всех).
+            # Если значения положительные - там нужно рисовать.
+            # Если отрицательные (уже перечернено) - сумма уменьшается, линия не выбирается.
+            # argmax берет первый максимум - как и старый перебор по возрастанию номера.
+            if timed: t = time.perf_counter()
+            if table is not None:
+                scores = table.scores[rows]
+            else:
+                scores = index.chord_sums(err_flat, rows)
+            k = int(np.argmax(scores)) if picker is None else picker(curr, targets, scores)
+            if timed: t_scoring += time.perf_counter() - t
+            if scores[k] <= -999999999.0: break
+            best_nail = int(targets[k])
+
+            # Вычитаем вес нити из матрицы.
+            # Разрешаем уходить в минус (не используем clip(0)).
+            if timed: t = time.perf_counter()
+            pix = index.chord(curr, best_nail)
+            if want_residual:
+                touched = np.unique(pix)
+                residual -= float(np.maximum(err_flat[touched], 0).sum())
+            err_flat[pix] -= line_weight
+            if table is not None:
+                table.subtract(pix, line_weight)
+            if timed: t_apply += time.perf_counter() - t
+
+            sequence.append(best_nail)
+            prev, curr = curr, best_nail
+
+            if i % 25 == 0:
+                if progress is not None: progress(i, max_lines)
+                if want_progress: instrument.emit("progress", i=i, total=max_lines)
+            if on_line is not None:
+                on_line(i, prev, curr)
+            if want_lines:
+                if want_residual:
+                    residual += float(np.maximum(err_flat[touched], 0).sum())
+                instrument.emit("line", i=i, a=prev, b=curr, score=float(scores[k]), residual=residual)
+            if checkpoint_every and on_checkpoint is not None and (i + 1) % checkpoint_every == 0:
+                on_checkpoint(Checkpoint(params, list(sequence), error_matrix.copy(), image))
+
+    if timed:
+        instrument.emit("phase", name="scoring", seconds=t_scoring)
+        instrument.emit("phase", name="apply", seconds=t_apply)
+    return GenerationResult(params=params, sequence=sequence, nails=index.nails,
+                            stopped=stopped, elapsed=time.perf_counter() - t0,
+                            checkpoint=Checkpoint(params, list(sequence), error_matrix, image),
+                            report=picker.report() if hasattr(picker, "report") else None)
+
+
+def _solve_jit(jit, sequence, params, error_matrix, progress=None, on_line=None, should_stop=None,
+               instrument=None, checkpoint_every=0, on_checkpoint=None, image=""):
+    # Пачки до 25 линий (шаг progress), каждая чекпоинт-граница - конец пачки.
+    # Колбэки вызываются после пачки для каждой линии в том же порядке, что и в
+    # цикле NumPy; should_stop проверяется между пачками. Возвращает stopped.
+    max_lines = params.lines
+    want_lines = instrument is not None and instrument.wants("line")
+    want_progress = instrument is not None and instrument.wants("progress")
+    want_ckpt = checkpoint_every and on_checkpoint is not None
+    i = len(sequence) - 1
+    while i < max_lines:
+        if should_stop is not None and should_stop(): return True
+        end = min((i // 25 + 1) * 25, max_lines)
+        if want_ckpt: end = min(end, (i // checkpoint_every + 1) * checkpoint_every)
+        nails, scores = jit.run(sequence[-1], end - i)
+        for n, b, score in zip(range(i, end), nails.tolist(), scores.tolist()):
+            prev = sequence[-1]
+            sequence.append(b)
+            if n % 25 == 0:
+                if progress is not None: progress(n, max_lines)
+                if want_progress: instrument.emit("progress", i=n, total=max_lines)
+            if on_line is not None:
+                on_line(n, prev, b)
+            if want_lines:
+                instrument.emit("line", i=n, a=prev, b=b, score=score, residual=None)
+            if want_ckpt and (n + 1) % checkpoint_every == 0:
+                on_checkpoint(Checkpoint(params, list(sequence), error_matrix.copy(), image))
+        if len(nails) < end - i: break  # Кандидатов не осталось
+        i = end
+    return False
+
+
+# =================================================================================
+# СТРАТЕГИИ ВЫБОРА ЛИНИИ
+# Стратегия - фабрика (index, candidates, err_flat, params) -> выбор линии или None.
+# Выбор: pick(текущий гвоздь, целевые гвозди, суммы под их хордами) -> номер в targets;
+# вызывается перед каждой линией, матрицу ошибки после выбора обновляет решатель.
+# None - обычный argmax (жадный алгоритм, самый быстрый путь).
+# =================================================================================
+class LookaheadPicker:
+    # Просмотр на lookahead линий вперед: на каждом уровне раскрываются beam_width
+    # лучших по сумме линий, выбирается первая линия лучшего пути. Пока не кончился
+    # time_budget; затем - жадно. lookahead=1 или beam_width=1 - тот же жадный выбор.
+    def __init__(self, index, candidates, err_flat, params):
+        self.index = index
+        self.candidates = candidates
+        self.err_flat = err_flat
+        self.weight = float(params.line_weight)
+        self.depth = params.lookahead
+        self.width = params.beam_width
+        self.deadline = time.perf_counter() + params.time_budget if params.time_budget else None
+        self.lines = self.greedy_lines = 0
+
+    def _top(self, scores):
+        # Номера width лучших сумм; при равенстве - меньший номер, как у argmax
+        if len(scores) <= self.width:
+            return np.argsort(-scores, kind="stable")
+        top = np.argpartition(-scores, self.width - 1)[:self.width]
+        return top[np.lexsort((top, -scores[top]))]
+
+    def _best_path(self, curr, depth):
+        # Лучшая сумма depth линий подряд от гвоздя curr
+        targets, rows = self.candidates[curr]
+        if len(targets) == 0: return 0.0
+        scores = self.index.chord_sums(self.err_flat, rows)
+        if depth == 1: return float(scores.max())
+        return max(self._branch(curr, targets, scores, j, depth) for j in self._top(scores))
+
+    def _branch(self, curr, targets, scores, j, depth):
+        # Кладем нить curr -> targets[j] на время просмотра и смотрим дальше
+        pix = self.index.chord(curr, int(targets[j]))
+        saved = self.err_flat[pix]
+        self.err_flat[pix] -= self.weight
+        total = scores[j] + self._best_path(int(targets[j]), depth - 1)
+        self.err_flat[pix] = saved
+        return total
+
+    def __call__(self, curr, targets, scores):
+        if self.depth <= 1 or self.width <= 1 or (self.deadline and time.perf_counter() > self.deadline):
+            self.greedy_lines += 1
+            return int(np.argmax(scores))
+        self.lines += 1
+        top = self._top(scores)
+        totals = [self._branch(curr, targets, scores, j, self.depth) for j in top]
+        return int(top[int(np.argmax(totals))])
+
+    def report(self):
+        return {"strategy": "beam", "lookahead_lines": self.lines, "greedy_lines": self.greedy_lines,
+                "budget_hit": bool(self.greedy_lines and self.deadline)}
+
+
+STRATEGIES = {
+    "greedy": lambda index, candidates, err_flat, params: None,
+    "beam": LookaheadPicker,
+}
+
+
+def register_strategy(name, factory):
+    STRATEGIES[name] = factory
+
+
+def compare_with_greedy(calc_img, result, extra=0.5):
+    # Качество результата стратегии против жадного расчета с теми же параметрами:
+    # ошибка при равном числе линий и сколько линий нужно жадному для той же ошибки
+    # (ищется до (1 + extra) x линий; None - не догнал).
+    params = replace(result.params, strategy="greedy", draft_size=0)
+    lines = len(result.sequence) - 1
+    error = residual_rmse(result.checkpoint.error_matrix)
+    t = time.perf_counter()
+    greedy = solve_greedy(calc_img, replace(params, lines=lines))
+    greedy_seconds = time.perf_counter() - t
+    greedy_error = residual_rmse(greedy.checkpoint.error_matrix)
+
+    reached = lines if greedy_error <= error else None
+    if reached is None and extra > 0:
+        step = max(lines // 100, 1)
+        found = []
+
+        def on_checkpoint(ckpt):
+            if residual_rmse(ckpt.error_matrix) <= error:
+                found.append(ckpt.lines_done)
+
+        solve_greedy(None, replace(params, lines=lines + int(lines * extra)), checkpoint=greedy.checkpoint,
+                     should_stop=lambda: bool(found), checkpoint_every=step, on_checkpoint=on_checkpoint)
+        reached = found[0] if found else None
+    return {"lines": lines, "error": error, "greedy_error": greedy_error,
+            "gain_pct": 100.0 * (greedy_error - error) / greedy_error if greedy_error else 0.0,
+            "greedy_lines_same_error": reached,
+            "seconds": result.elapsed, "greedy_seconds": greedy_seconds}
+
+
+def format_strategy_report(report):
+    same = report.get("greedy_lines_same_error")
+    same = f"жадному нужно {same} линий" if same is not None else "жадный не догнал"
+    return (f"ошибка {report['error']:.2f} против {report['greedy_error']:.2f} у жадного "
+            f"({report['gain_pct']:+.2f}%), {same}; {report['seconds']:.1f} с против {report['greedy_seconds']:.1f} с")
+
+
+def residual_matrix(calc_img, sequence, params):
+    # Матрица ошибки после всех нитей последовательности
+    error_matrix = build_error_matrix(calc_img)
+    index = get_chord_index(params.nails, error_matrix.shape[1])
+    err_flat = error_matrix.ravel()
+    w = float(params.line_weight)
+    for a, b in zip(sequence, sequence[1:]):
+        err_flat[index.chord(a, b)] -= w
+    return error_matrix
+
+
+def residual_rmse(error_matrix):
+    # RMSE остатка матрицы ошибки внутри круга (меньше - лучше)
+    return float(np.sqrt(np.mean(error_matrix[~_outside_circle(error_matrix.shape[1])] ** 2)))
+
+
+def reconstruction_error(calc_img, sequence, params):
+    # RMSE остатка после всех нитей последовательности
+    return residual_rmse(residual_matrix(calc_img, sequence, params))
+
+
+# =================================================================================
+# ПИРАМИДА РАЗРЕШЕНИЙ (COARSE-TO-FINE)
+# Черновая последовательность быстро ищется жадным алгоритмом на малом размере,
+# затем на каждом следующем уровне (x2) она пересчитывается и уточняется
+# локально: каждую точку можно сдвинуть на соседний гвоздь, если две ее
+# линии от этого лучше покрывают ошибку. Полный перебор на высоком разрешении
+# не выполняется. Вес нити на каждом уровне пересчитывается под его размер (scale_weight).
+# =================================================================================
+def pyramid_levels(params):
+    if not params.draft_size or params.draft_size >= params.calc_size:
+        return [params.calc_size]
+    levels = [params.draft_size]
+    while levels[-1] * 2 < params.calc_size:
+        levels.append(levels[-1] * 2)
+    levels.append(params.calc_size)
+    return levels
+
+
+def scale_weight(line_weight, size, calc_size):
+    # Вес нити на другом разрешении. Нить той же толщины закрывает долю пикселя,
+    # пропорциональную размеру, а темнота фото на пиксель от размера не зависит:
+    # вес масштабируется линейно, и N линий заполняют фото так же, как на calc_size
+    return line_weight * size / calc_size
+
+
+def level_params(params, size):
+    # Параметры уровня пирамиды (или пробного расчета) размером size
+    return replace(params, calc_size=size, draft_size=0,
+                   line_weight=scale_weight(params.line_weight, size, params.calc_size))
+
+
+def refine_sequence(sequence, error_matrix, params, progress=None, should_stop=None, instrument=None):
+    # Возвращает (новая последовательность, сколько точек сдвинуто)
+    index = get_chord_index(params.nails, error_matrix.shape[1])
+    allowed = index.allowed_mask(params.skip_nails)
+    err_flat = error_matrix.ravel()
+    w = float(params.line_weight)
+    n = params.nails
+    seq = list(sequence)
+
+    for a, b in zip(seq, seq[1:]):
+        err_flat[index.chord(a, b)] -= w
+
+    moved = 0
+    shifts = np.arange(-params.refine_radius, params.refine_radius + 1)
+    for k in range(1, len(seq)):
+        if should_stop is not None and should_stop(): break
+        a, m0 = seq[k - 1], seq[k]
+        b = seq[k + 1] if k + 1 < len(seq) else None
+
+        # Убираем две линии точки и ищем для нее лучший гвоздь по соседству
+        err_flat[index.chord(a, m0)] += w
+        if b is not None: err_flat[index.chord(m0, b)] += w
+
+        ms = (m0 + shifts) % n
+        ok = allowed[a, ms]
+        if b is not None: ok &= allowed[ms, b]
+        ms = ms[ok]
+        if len(ms):
+            scores = index.chord_sums(err_flat, index.pair_row[a, ms].astype(np.int64))
+            if b is not None:
+                scores += index.chord_sums(err_flat, index.pair_row[ms, b].astype(np.int64))
+            # Сдвигаем только при строгом улучшении
+            j = int(np.argmax(scores))
+            cur = scores[ms == m0]
+            if ms[j] != m0 and (len(cur) == 0 or scores[j] > cur[0]):
+                seq[k] = int(ms[j])
+                moved += 1
+
+        err_flat[index.chord(a, seq[k])] -= w
+        if b is not None: err_flat[index.chord(seq[k], b)] -= w
+
+        if k % 25 == 0:
+            if progress is not None: progress(k, len(seq))
+            if instrument is not None: instrument.emit("progress", i=k, total=len(seq))
+    return seq, moved
+
+
+def solve_pyramid(calc_img, params, progress=None, on_line=None, should_stop=None, instrument=None):
+    t0 = time.perf_counter()
+    levels = pyramid_levels(params)
+    draft_img = calc_img.resize((levels[0], levels[0]), Image.Resampling.LANCZOS)
+    result = solve_greedy(draft_img, level_params(params, levels[0]), progress, on_line, should_stop, instrument)
+    report = result.report
+
+    sequence = result.sequence
+    for size in levels[1:]:
+        if result.stopped or (should_stop is not None and should_stop()): break
+        level_img = calc_img if size == calc_img.width else calc_img.resize((size, size), Image.Resampling.LANCZOS)
+        with phase(instrument, "mask"):
+            level_err = build_error_matrix(level_img)
+        with phase(instrument, "refine"):
+            sequence, _ = refine_sequence(sequence, level_err, level_params(params, size),
+                                          progress, should_stop, instrument)
+
+    # Продолжение после пирамиды идет обычным жадным расчетом на полном размере
+    final_params = replace(params, draft_size=0)
+    checkpoint = Checkpoint(final_params, list(sequence), residual_matrix(calc_img, sequence, final_params),
+                            image_digest(calc_img))
+    nails = get_chord_index(params.nails, calc_img.width).nails
+    return GenerationResult(params=params, sequence=sequence, nails=nails,
+                            stopped=result.stopped, elapsed=time.perf_counter() - t0,
+                            checkpoint=checkpoint, report=report)
+
+
+# =================================================================================
+# РЕНДЕР
+# Нити не рисуются по одной: покрытие всех хорд накапливается в массиве плотности
+# (bincount по точкам хорд с билинейным сглаживанием), затем плотность переводится
+# в затемнение по закону пропускания: каждая нить пропускает (1 - opacity) света,
+# поэтому пересечения темнеют мультипликативно, как у настоящих нитей.
+# =================================================================================
+THREAD_WIDTH = 2      # Толщина нити на рендере RENDER_SIZE, px
+THREAD_OPACITY = 40   # Непрозрачность одной нити (из 255)
+RENDER_TIERS = {"thumbnail": 400, "screen": 1000, "print": RENDER_SIZE}
+_RENDER_CHUNK = 1 << 22  # Точек хорд за один проход bincount (ограничивает память)
+
+
+def render_size(size):
+    # Размер в пикселях или уровень из RENDER_TIERS
+    return RENDER_TIERS.get(size, size)
+
+
+def _band_samples(v0, vd, steps, lo, hi):
+    # (первая точка, число точек) каждой хорды с координатой v в [lo, hi];
+    # v(k) = v0 + (k + 0.5) / steps * vd монотонна вдоль хорды
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ka = (lo - v0) / vd * steps - 0.5
+        kb = (hi - v0) / vd * steps - 0.5
+    k_min = np.where(vd == 0, 0, np.ceil(np.minimum(ka, kb)))
+    k_max = np.where(vd == 0, np.where((v0 >= lo) & (v0 <= hi), steps - 1, -1), np.floor(np.maximum(ka, kb)))
+    k_min = np.clip(k_min, 0, steps).astype(np.int64)
+    k_max = np.clip(k_max, -1, steps - 1).astype(np.int64)
+    return k_min, np.maximum(k_max - k_min + 1, 0)
+
+
+def thread_density(sequence, nails, calc_size=CALC_SIZE, size=RENDER_SIZE, width=None, rows=None,
+                   chunk=_RENDER_CHUNK):
+    # Сколько слоев нити покрывает каждый пиксель (float32, size x size).
+    # Толщина по умолчанию масштабируется от THREAD_WIDTH на RENDER_SIZE.
+    # rows=(y0, y1) - только полоса строк y0..y1-1 (рендер по частям), chunk - точек за проход.
+    size = render_size(size)
+    if width is None:
+        width = THREAD_WIDTH * size / RENDER_SIZE
+    y0, y1 = rows or (0, size)
+    # Буфер с полем в 1 пиксель: второй сосед сглаживания всегда в массиве
+    stride = size + 1
+    n_cells = stride * (y1 - y0 + 1)
+    density = np.zeros(n_cells, dtype=np.float64)
+    if len(sequence) >= 2:
+        pts = np.asarray(nails, dtype=np.float64)[np.asarray(sequence)] * (size / calc_size)
+        pts = np.clip(pts, 0, size - 1)
+        delta = pts[1:] - pts[:-1]
+        # Сглаживание как у Ву: одна точка на пиксель по главной оси хорды,
+        # по второй оси вес делится между двумя соседними пикселями
+        x_major = np.abs(delta[:, 0]) >= np.abs(delta[:, 1])
+        ax_major = np.where(x_major, 0, 1)
+        ax_minor = 1 - ax_major
+        rows_ = np.arange(len(delta))
+        major0, major_d = pts[:-1][rows_, ax_major], delta[rows_, ax_major]
+        minor0, minor_d = pts[:-1][rows_, ax_minor], delta[rows_, ax_minor]
+        mul_major = np.where(x_major, 1, stride)
+        mul_minor = np.where(x_major, stride, 1)
+
+        steps = np.maximum(np.ceil(np.abs(major_d)), 1).astype(np.int64)
+        area = width * np.hypot(delta[:, 0], delta[:, 1]) / steps  # Площадь нити на одну точку
+        first_k, counts = np.zeros_like(steps), steps
+        if rows is not None:
+            # Точки хорды, задевающие полосу (с запасом: строки точки - floor(y)..floor(y)+1)
+            first_k, counts = _band_samples(pts[:-1, 1], delta[:, 1], steps, y0 - 2, y1 + 1)
+        ends = np.cumsum(counts)
+
+        first = 0
+        while first < len(counts):
+            start = ends[first] - counts[first]
+            last = max(int(np.searchsorted(ends, start + chunk, side="right")), first + 1)
+            part = slice(first, last)
+            n = counts[part]
+            # Середины отрезков длиной 1/steps вдоль хорды
+            t = np.arange(ends[last - 1] - start, dtype=np.float32)
+            t -= np.repeat((ends[part] - n - start - first_k[part]).astype(np.float32), n)
+            t += 0.5
+            t /= np.repeat(steps[part].astype(np.float32), n)
+
+            major = np.repeat(major0[part].astype(np.float32), n)
+            major += t * np.repeat(major_d[part].astype(np.float32), n)
+            minor = np.repeat(minor0[part].astype(np.float32), n)
+            minor += t * np.repeat(minor_d[part].astype(np.float32), n)
+            lo = np.floor(minor)
+            frac = minor - lo
+            step_minor = np.repeat(mul_minor[part], n)
+            idx = np.rint(major).astype(np.int64) * np.repeat(mul_major[part], n)
+            idx += lo.astype(np.int64) * step_minor
+            a = np.repeat(area[part].astype(np.float32), n)
+            if rows is None:
+                density += np.bincount(idx, weights=a * (1 - frac), minlength=n_cells)
+                density += np.bincount(idx + step_minor, weights=a * frac, minlength=n_cells)
+            else:
+                idx -= y0 * stride
+                for j, w in ((idx, a * (1 - frac)), (idx + step_minor, a * frac)):
+                    keep = (j >= 0) & (j < n_cells)
+                    density += np.bincount(j[keep], weights=w[keep], minlength=n_cells)
+            first = last
+    return density.reshape(y1 - y0 + 1, stride)[:y1 - y0, :size].astype(np.float32)
+
+
+def density_to_alpha(density, opacity=THREAD_OPACITY):
+    # Пропускание (1 - opacity)^плотность -> альфа-канал uint8
+    transmit = np.power(np.float32(1.0 - opacity / 255.0), density)
+    return np.round(255.0 * (1.0 - transmit)).astype(np.uint8)
+
+
+def strings_layer(alpha, rgb=(0, 0, 0)):
+    # RGBA-слой цвета нити с готовым альфа-каналом
+    rgba = np.empty(alpha.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = rgb
+    rgba[..., 3] = alpha
+    return Image.fromarray(rgba, "RGBA")
+
+
+def render_strings(sequence, nails, calc_size=CALC_SIZE, size=RENDER_SIZE):
+    # size - пиксели или уровень: "thumbnail" (миниатюра), "screen" (холст), "print" (файл)
+    density = thread_density(sequence, nails, calc_size, size)
+    return strings_layer(density_to_alpha(density))
+
+
+def flatten_on_white(strings_img, size=None):
+    white = Image.new("RGB", strings_img.size, "white")
+    white.paste(strings_img, (0, 0), strings_img)
+    if size is not None:
+        white = white.resize((size, size), Image.Resampling.LANCZOS)
+    return white
+
+
+class StringArtEngine:
+    # Полный цикл фото -> схема -> рендер с фиксированными параметрами.
+    # cache - ResultCache: тот же фото и параметры отдаются без расчета.
+    def __init__(self, params=None, instrument=None, cache=None):
+        self.params = params or SolverParams()
+        self.instrument = instrument
+        self.cache = cache
+
+    def prepare(self, image, brightness=1.0, contrast=1.0):
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        with phase(self.instrument, "crop"):
+            return fit_to_hoop(adjust_photo(image, brightness, contrast), self.params.calc_size)
+
+    def generate(self, image, brightness=1.0, contrast=1.0, render=True, compare=False, **callbacks):
+        # compare=True - для не жадной стратегии еще и жадный расчет для сравнения
+        # (compare_with_greedy): второй расчет того же фото, поэтому только по запросу
+        calc_img = self.prepare(image, brightness, contrast)
+        key = result = None
+        # Продолжение с чекпоинта кэшируется под ключом с его происхождением
+        # (Checkpoint.provenance), а не под ключом расчета с нуля
+        if self.cache is not None:
+            with phase(self.instrument, "cache"):
+                key = self.cache.key(calc_img, self.params, callbacks.get("checkpoint"))
+                if key is not None:
+                    result = self.cache.get(key, self.params)
+        fresh = result is None
+        if fresh:
+            result = solve(calc_img, self.params, instrument=self.instrument, **callbacks)
+        if compare and result.report is not None and not result.stopped and "greedy_error" not in result.report:
+            with phase(self.instrument, "compare"):
+                result.report.update(compare_with_greedy(calc_img, result))
+        if fresh and key is not None:
+            self.cache.put(key, result)
+        if key is not None and not result.stopped:
+            result.cache_key = key
+        if render:
+            with phase(self.instrument, "finalize"):
+                result.image = self.render(result)
+        return result
+
+    def render(self, result, size=RENDER_SIZE):
+        # Рендер нитей; альфа-канал кэшированного результата берется из кэша
+        if result.cache_key is not None and self.cache is not None:
+            return self.cache.render(result.cache_key, result, size)
+        return render_strings(result.sequence, result.nails, self.params.calc_size, size)
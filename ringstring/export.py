@@ -0,0 +1,220 @@
+"""Экспорт схемы для печати: SVG / PDF в натуральную величину и PNG любого размера.
+
+SVG и PDF пишутся потоково прямо из последовательности: обруч, гвозди с номерами
+(шаблон для разметки) и нити отдельными отрезками - перекрытия темнеют так же, как
+на рендере. Гвозди стоят на точной окружности заданного диаметра (мм), а не на
+сетке расчета. PNG рендерится полосами строк (thread_density с rows) в пределах
+бюджета памяти, полосы сжимаются и пишутся по мере готовности.
+"""
+import math
+import struct
+import zlib
+
+import numpy as np
+
+from .engine import RENDER_SIZE, THREAD_OPACITY, THREAD_WIDTH, density_to_alpha, thread_density
+from .geometry import calculate_nails
+
+DIAMETER_MM = 300   # Диаметр обруча по умолчанию
+MARGIN_MM = 12      # Поле вокруг обруча (номера гвоздей)
+_CHUNK = 1000       # Линий за одну запись
+_MM_TO_PT = 72 / 25.4
+
+
+def nail_positions(n_nails, diameter=DIAMETER_MM, margin=MARGIN_MM):
+    # Точные координаты гвоздей (мм от левого верхнего угла листа); порядок и
+    # направление - как у calculate_nails
+    a = 2 * np.pi * np.arange(n_nails) / n_nails
+    c = margin + diameter / 2
+    return np.stack([c + diameter / 2 * np.cos(a), c + diameter / 2 * np.sin(a)], axis=1)
+
+
+def _hex_rgb(color):
+    color = (color or "#000000").lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _layout(n_nails, diameter, width):
+    # (размер листа, толщина нити, радиус гвоздя, кегль номеров), мм
+    if width is None:
+        width = diameter * THREAD_WIDTH / RENDER_SIZE
+    pitch = math.pi * diameter / n_nails  # Расстояние между гвоздями по дуге
+    return diameter + 2 * MARGIN_MM, width, min(0.8, pitch / 4), min(3.0, pitch * 0.8)
+
+
+def _label_positions(n_nails, diameter, font):
+    # Номера - снаружи обруча, напротив своих гвоздей
+    gap = 1.5 + font
+    return nail_positions(n_nails, diameter + 2 * gap, MARGIN_MM - gap)
+
+
+def _segments(pts, sequence):
+    # Отрезки нитей пачками по _CHUNK: массивы (x1, y1, x2, y2)
+    seq = np.asarray(sequence)
+    for k in range(0, max(len(seq) - 1, 0), _CHUNK):
+        part = seq[k:k + _CHUNK + 1]
+        yield np.hstack([pts[part[:-1]], pts[part[1:]]])
+
+
+# =================================================================================
+# SVG
+# =================================================================================
+def write_svg(path, sequence, nails_count, diameter=DIAMETER_MM, color=None, width=None,
+              opacity=THREAD_OPACITY, labels=True):
+    # diameter, width - мм; width=None - толщина как на рендере
+    page, width, nail_r, font = _layout(nails_count, diameter, width)
+    pts = nail_positions(nails_count, diameter)
+    c = MARGIN_MM + diameter / 2
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<svg xmlns="http://www.w3.org/2000/svg" width="{page:g}mm" height="{page:g}mm" '
+                f'viewBox="0 0 {page:g} {page:g}">\n'
+                '<rect width="100%" height="100%" fill="white"/>\n'
+                f'<circle cx="{c:g}" cy="{c:g}" r="{diameter / 2:g}" fill="none" stroke="#999" stroke-width="0.2"/>\n'
+                f'<g id="nails" fill="#000">\n')
+        f.writelines(f'<circle cx="{x:.2f}" cy="{y:.2f}" r="{nail_r:.2f}"/>\n' for x, y in pts)
+        f.write('</g>\n')
+        if labels:
+            f.write(f'<g id="labels" font-family="sans-serif" font-size="{font:.2f}" fill="#555" '
+                    'text-anchor="middle" dominant-baseline="central">\n')
+            f.writelines(f'<text x="{x:.2f}" y="{y:.2f}">{i}</text>\n'
+                         for i, (x, y) in enumerate(_label_positions(nails_count, diameter, font)))
+            f.write('</g>\n')
+        # Каждая нить - отдельный элемент: непрозрачность перекрытий перемножается
+        f.write(f'<g id="threads" fill="none" stroke="{color or "#000000"}" stroke-width="{width:.3f}" '
+                f'stroke-opacity="{opacity / 255:.4f}" stroke-linecap="round">\n')
+        for seg in _segments(pts, sequence):
+            f.writelines(f'<path d="M{x1:.2f} {y1:.2f}L{x2:.2f} {y2:.2f}"/>\n' for x1, y1, x2, y2 in seg)
+        f.write('</g>\n</svg>\n')
+
+
+# =================================================================================
+# PDF
+# =================================================================================
+_KAPPA = 0.5523  # Четверть окружности кривой Безье
+
+
+def _pdf_circle(x, y, r):
+    k = r * _KAPPA
+    return (f"{x + r:.2f} {y:.2f} m "
+            f"{x + r:.2f} {y + k:.2f} {x + k:.2f} {y + r:.2f} {x:.2f} {y + r:.2f} c "
+            f"{x - k:.2f} {y + r:.2f} {x - r:.2f} {y + k:.2f} {x - r:.2f} {y:.2f} c "
+            f"{x - r:.2f} {y - k:.2f} {x - k:.2f} {y - r:.2f} {x:.2f} {y - r:.2f} c "
+            f"{x + k:.2f} {y - r:.2f} {x + r:.2f} {y - k:.2f} {x + r:.2f} {y:.2f} c\n")
+
+
+def write_pdf(path, sequence, nails_count, diameter=DIAMETER_MM, color=None, width=None,
+              opacity=THREAD_OPACITY, labels=True):
+    # Одна страница размером с обруч и поля. Поток страницы сжимается по мере записи,
+    # его длина пишется отдельным объектом после потока.
+    page, width, nail_r, font = _layout(nails_count, diameter, width)
+    pts = nail_positions(nails_count, diameter)
+    c = MARGIN_MM + diameter / 2
+    r, g, b = (v / 255 for v in _hex_rgb(color))
+    size_pt = page * _MM_TO_PT
+    offsets = {}
+
+    with open(path, "wb") as f:
+        def obj(num, body):
+            offsets[num] = f.tell()
+            f.write(f"{num} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        obj(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        obj(2, "<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        obj(3, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {size_pt:.2f} {size_pt:.2f}] /Contents 4 0 R "
+               "/Resources << /Font << /F1 6 0 R >> /ExtGState << /GS0 7 0 R /GS1 8 0 R >> >> >>")
+        obj(6, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        obj(7, "<< /Type /ExtGState /CA 1 /ca 1 >>")
+        obj(8, f"<< /Type /ExtGState /CA {opacity / 255:.4f} >>")
+
+        offsets[4] = f.tell()
+        f.write(b"4 0 obj\n<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n")
+        z = zlib.compressobj(6)
+        length = 0
+
+        def put(text):
+            nonlocal length
+            data = z.compress(text.encode("latin-1"))
+            length += len(data)
+            f.write(data)
+
+        # Единица - мм, ось y вниз (как в SVG)
+        put(f"q {_MM_TO_PT:.6f} 0 0 {-_MM_TO_PT:.6f} 0 {size_pt:.2f} cm /GS0 gs\n")
+        put(f"0.6 G 0.2 w\n{_pdf_circle(c, c, diameter / 2)}S\n0 g\n")
+        for k in range(0, nails_count, _CHUNK):
+            put("".join(_pdf_circle(x, y, nail_r) + "f\n" for x, y in pts[k:k + _CHUNK]))
+        if labels:
+            put(f"0.33 g BT /F1 {font:.2f} Tf\n")
+            for i, (x, y) in enumerate(_label_positions(nails_count, diameter, font)):
+                # Helvetica: цифра 0.556 кегля; текст отражаем обратно по y
+                text = str(i)
+                put(f"1 0 0 -1 {x - len(text) * 0.278 * font:.2f} {y + 0.35 * font:.2f} Tm ({text}) Tj\n")
+            put("ET\n")
+        put(f"/GS1 gs {r:.3f} {g:.3f} {b:.3f} RG {width:.3f} w 1 J\n")
+        for seg in _segments(pts, sequence):
+            put("".join(f"{x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S\n" for x1, y1, x2, y2 in seg))
+        put("Q\n")
+        data = z.flush()
+        length += len(data)
+        f.write(data)
+        f.write(b"\nendstream\nendobj\n")
+        obj(5, str(length))
+
+        xref = f.tell()
+        f.write(b"xref\n0 9\n0000000000 65535 f \n")
+        for num in range(1, 9):
+            f.write(f"{offsets[num]:010d} 00000 n \n".encode("latin-1"))
+        f.write(f"trailer\n<< /Size 9 /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+
+
+# =================================================================================
+# PNG ПО ПОЛОСАМ
+# =================================================================================
+def _png_chunk(f, tag, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(tag + data)
+    f.write(struct.pack(">I", zlib.crc32(tag + data)))
+
+
+def write_png_tiled(path, sequence, nails_count, calc_size, size, color=None, max_mb=256, progress=None):
+    # Нити на белом, size x size px - как flatten_on_white(render_strings(...)), но полосами:
+    # память ограничена max_mb при любом size. progress(готово строк, всего).
+    nails = calculate_nails(calc_size, nails_count)
+    rgb = _hex_rgb(color)
+    gray = rgb[0] == rgb[1] == rgb[2]
+    channels = 1 if gray else 3
+    budget = max_mb * 1024**2
+    # Половина бюджета - полоса (плотность и два результата bincount во float64, альфа,
+    # пиксели, строки PNG), половина - точки хорд одного прохода (~128 байт на точку)
+    per_row = (size + 1) * 24 + size * (8 + 5 * channels)
+    band = max(1, min(size, int(budget / 2 // per_row)))
+    chunk = max(1 << 16, int(budget / 2 // 128))
+    color_arr = np.array(rgb[:channels], dtype=np.uint32)
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _png_chunk(f, b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 0 if gray else 2, 0, 0, 0))
+        z = zlib.compressobj(6)
+        for y0 in range(0, size, band):
+            y1 = min(y0 + band, size)
+            alpha = density_to_alpha(thread_density(sequence, nails, calc_size, size, rows=(y0, y1),
+                                                    chunk=chunk)).astype(np.uint32)[..., None]
+            # Наложение на белый с округлением, как у Image.paste с маской
+            pix = (color_arr * alpha + 255 * (255 - alpha) + 127) // 255
+            rows = np.zeros((y1 - y0, size * channels + 1), dtype=np.uint8)  # Байт фильтра 0 - без фильтра
+            rows[:, 1:] = pix.reshape(y1 - y0, -1)
+            data = z.compress(rows.tobytes())
+            if data: _png_chunk(f, b"IDAT", data)
+            if progress: progress(y1, size)
+        _png_chunk(f, b"IDAT", z.flush())
+        _png_chunk(f, b"IEND", b"")
+
+
+EXPORT_EXTS = (".svg", ".pdf")
+
+
+def write_vector(path, sequence, nails_count, diameter=DIAMETER_MM, color=None, **kwargs):
+    # SVG или PDF по расширению
+    writer = write_pdf if path.lower().endswith(".pdf") else write_svg
+    writer(path, sequence, nails_count, diameter, color, **kwargs)
@@ -0,0 +1,320 @@
+"""Чтение и запись схем в форматах TXT / JSON / CSV и компактном бинарном RSQ.
+SVG / PDF (шаблон для печати, только запись) - см. export.
+
+RSQ (*.rsq), все числа little-endian:
+    заголовок  "RSQ1", версия u8, кодировка u8, флаги u8, резерв u8,
+               гвоздей u16, размер расчета u16, шагов u32, длина метаданных u32
+    метаданные JSON (параметры расчета, цвет нити)
+    данные     u8 / u16 номера гвоздей или varint-разности соседних гвоздей
+    CRC32      u32 от данных, если установлен флаг FLAG_CRC
+Текстовые форматы читаются и пишутся потоково, RSQ открывается через mmap.
+"""
+import csv
+import itertools
+import json
+import mmap
+import re
+import struct
+import zlib
+from dataclasses import asdict, is_dataclass
+
+import numpy as np
+
+from .export import DIAMETER_MM, EXPORT_EXTS, write_vector
+
+RSQ_MAGIC = b"RSQ1"
+RSQ_VERSION = 1
+RSQ_EXT = ".rsq"
+ENC_U8, ENC_U16, ENC_DELTA = 0, 1, 2
+ENCODINGS = {"u8": ENC_U8, "u16": ENC_U16, "delta": ENC_DELTA}
+FLAG_CRC = 1
+_HEADER = struct.Struct("<4sBBBBHHII")
+
+# Строка TXT-схемы: номера гвоздей через " - "; остальные строки (заголовок,
+# заметки) номерами гвоздей не считаются
+_TXT_ROW = re.compile(r"^\s*\d+(?:\s*-\s*\d+)*\s*$")
+
+
+# =================================================================================
+# RSQ: КОДИРОВАНИЕ
+# =================================================================================
+def _encode_varint(values):
+    # Беззнаковые целые -> байты varint (7 бит на байт, старший бит - "продолжение")
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        nbytes += values >= (1 << shift)
+    ends = np.cumsum(nbytes)
+    k = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - nbytes, nbytes)
+    v = np.repeat(values, nbytes)
+    out = ((v >> (7 * k).astype(np.uint64)) & 0x7F).astype(np.uint8)
+    out[k < np.repeat(nbytes - 1, nbytes)] |= 0x80
+    return out.tobytes()
+
+
+def _decode_varint(buf):
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if not len(data): return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    k = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.int64) << (7 * k)
+    return np.add.reduceat(parts, starts)
+
+
+def _delta_encode(seq, nails):
+    # Разность с предыдущим гвоздем по кругу в (-n/2, n/2], затем zigzag -> varint
+    d = np.diff(seq, prepend=0) % nails
+    d = np.where(d > nails // 2, d - nails, d)
+    return _encode_varint((d << 1) ^ (d >> 63))
+
+
+def _delta_decode(payload, nails):
+    z = _decode_varint(payload)
+    d = (z >> 1) ^ -(z & 1)
+    return np.cumsum(d) % nails
+
+
+def encode_sequence(sequence, nails_count, encoding="auto"):
+    # (код кодировки, байты данных); "auto" - самый короткий вариант
+    seq = np.asarray(sequence, dtype=np.int64)
+    if len(seq) and (seq.min() < 0 or seq.max() >= nails_count):
+        raise ValueError(f"Номер гвоздя вне диапазона 0..{nails_count - 1}")
+    raw = ENC_U8 if nails_count <= 256 else ENC_U16
+    if encoding == "auto":
+        delta = _delta_encode(seq, nails_count)
+        if len(delta) < len(seq) * (1 if raw == ENC_U8 else 2):
+            return ENC_DELTA, delta
+        encoding = "u8" if raw == ENC_U8 else "u16"
+    enc = ENCODINGS[encoding]
+    if enc == ENC_DELTA:
+        return enc, _delta_encode(seq, nails_count)
+    if enc == ENC_U8 and raw != ENC_U8:
+        raise ValueError("Кодировка u8 допустима только до 256 гвоздей")
+    return enc, seq.astype("<u1" if enc == ENC_U8 else "<u2").tobytes()
+
+
+def _params_dict(params):
+    if params is None: return {}
+    return asdict(params) if is_dataclass(params) else dict(params)
+
+
+def write_binary(path, sequence, nails_count, calc_size=0, params=None, color=None,
+                 encoding="auto", checksum=True):
+    meta = {"params": _params_dict(params)}
+    if color is not None: meta["color"] = color
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    enc, payload = encode_sequence(sequence, nails_count, encoding)
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(RSQ_MAGIC, RSQ_VERSION, enc, FLAG_CRC if checksum else 0, 0,
+                             nails_count, calc_size, len(sequence), len(meta_bytes)))
+        f.write(meta_bytes)
+        f.write(payload)
+        if checksum:
+            f.write(struct.pack("<I", zlib.crc32(payload)))
+
+
+class SequenceFile:
+    # RSQ через mmap: заголовок читается сразу, последовательность - при первом обращении.
+    # u8/u16 отдаются без копирования (np.frombuffer поверх mmap).
+    def __init__(self, path):
+        self.path = path
+        self._mm = self._payload = self._array = None
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Пустой файл
+            self._file.close()
+            raise ValueError(f"Не файл RSQ: {path}")
+        if len(self._mm) < _HEADER.size or self._mm[:4] != RSQ_MAGIC:
+            self.close()
+            raise ValueError(f"Не файл RSQ: {path}")
+        (_, self.version, self.encoding, self.flags, _, self.nails_count, self.calc_size,
+         self.count, meta_len) = _HEADER.unpack_from(self._mm)
+        if self.version > RSQ_VERSION:
+            self.close()
+            raise ValueError(f"Версия RSQ {self.version} не поддерживается")
+        meta_end = _HEADER.size + meta_len
+        self.meta = json.loads(bytes(self._mm[_HEADER.size:meta_end]).decode("utf-8") or "{}")
+        end = len(self._mm) - (4 if self.flags & FLAG_CRC else 0)
+        self._payload = memoryview(self._mm)[meta_end:end]
+
+    @property
+    def params(self):
+        return self.meta.get("params", {})
+
+    @property
+    def color(self):
+        return self.meta.get("color")
+
+    @property
+    def array(self):
+        if self._array is None:
+            if self.encoding == ENC_DELTA:
+                self._array = _delta_decode(self._payload, self.nails_count)
+            else:
+                dtype = "<u1" if self.encoding == ENC_U8 else "<u2"
+                self._array = np.frombuffer(self._payload, dtype=dtype, count=self.count)
+            if len(self._array) != self.count:
+                raise ValueError(f"Файл поврежден: {self.path}")
+        return self._array
+
+    def verify(self):
+        # True, если контрольная сумма совпала (или ее нет)
+        if not self.flags & FLAG_CRC: return True
+        stored = struct.unpack_from("<I", self._mm, len(self._mm) - 4)[0]
+        return zlib.crc32(self._payload) == stored
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        return self.array[item]
+
+    def __iter__(self):
+        return (int(x) for x in self.array)
+
+    def tolist(self):
+        return self.array.tolist()
+
+    def close(self):
+        self._array = None
+        if self._mm is not None:
+            try:
+                if self._payload is not None: self._payload.release()
+                self._mm.close()
+            except BufferError:
+                pass  # Массив из файла еще используется - mmap закроется вместе с ним
+            self._payload = self._mm = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =================================================================================
+# ЗАПИСЬ
+# =================================================================================
+def _chunks(iterable, n):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, n))
+        if not chunk: return
+        yield chunk
+
+
+def write_instructions(path, sequence, nails_count, color=None, params=None, diameter=DIAMETER_MM):
+    # sequence - любая итерируемая последовательность (TXT и CSV пишутся потоково).
+    # color - цвет нити ("#rrggbb") для цветных схем; пишется в JSON, RSQ, SVG и PDF.
+    # params - SolverParams (или словарь); сохраняется в RSQ.
+    # diameter - диаметр обруча в мм для SVG / PDF (печать в натуральную величину).
+    # Формат - по расширению без учета регистра (SCHEME.SVG - тоже SVG).
+    ext = path.lower()
+    if ext.endswith(EXPORT_EXTS):
+        write_vector(path, list(sequence), nails_count, diameter, color)
+    elif ext.endswith(RSQ_EXT):
+        calc_size = _params_dict(params).get("calc_size", 0)
+        write_binary(path, list(sequence), nails_count, calc_size, params, color)
+    elif ext.endswith(".json"):
+        data = {"nails_count": nails_count, "sequence": [int(x) for x in sequence]}
+        if color is not None: data["color"] = color
+        with open(path, "w") as f:
+            json.dump(data, f)
+    elif ext.endswith(".csv"):
+        with open(path, "w", newline='') as f:
+            w = csv.writer(f)
+            for row in _chunks(sequence, 20): w.writerow(row)
+    else:
+        with open(path, "w") as f:
+            f.write(f"Гвозди: {nails_count}\n")
+            for row in _chunks(sequence, 10):
+                f.write(" - ".join(map(str, row)) + "\n")
+
+
+# =================================================================================
+# ЧТЕНИЕ
+# =================================================================================
+def _iter_csv(f):
+    for row in csv.reader(f):
+        for c in row:
+            c = c.strip()
+            if c.isdigit(): yield int(c)
+
+
+def _iter_txt(f):
+    for line in f:
+        if _TXT_ROW.match(line):
+            yield from (int(x) for x in line.split("-"))
+
+
+def _txt_nails(f, default_nails):
+    # Заголовок "Гвозди: N" ищется в начале файла, до первой строки схемы
+    pos = f.tell()
+    for line in f:
+        m = re.search(r"Гвозди:\s*(\d+)", line)
+        if m: return int(m.group(1))
+        if _TXT_ROW.match(line): break
+    f.seek(pos)
+    return default_nails
+
+
+def iter_instructions(path, default_nails=240):
+    # (кол-во гвоздей, итератор номеров) без чтения всего файла в память.
+    # Файл закрывается, когда итератор исчерпан.
+    ext = path.lower()
+    if ext.endswith(RSQ_EXT):
+        sf = SequenceFile(path)
+        def gen():
+            with sf:
+                yield from sf
+        return sf.nails_count, gen()
+    if ext.endswith(".json"):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return data.get("nails_count", default_nails), iter(data.get("sequence", []))
+
+    f = open(path, "r", encoding="utf-8", newline="" if ext.endswith(".csv") else None)
+    if ext.endswith(".csv"):
+        nails, rows = default_nails, _iter_csv(f)
+    else:
+        nails = _txt_nails(f, default_nails)
+        rows = _iter_txt(f)
+    def gen():
+        with f:
+            yield from rows
+    return nails, gen()
+
+
+def read_instructions(path, default_nails=240):
+    # Возвращает (кол-во гвоздей, последовательность)
+    if path.lower().endswith(RSQ_EXT):
+        with SequenceFile(path) as sf:
+            if not sf.verify(): raise ValueError("Контрольная сумма не совпала")
+            nails, seq = sf.nails_count, sf.tolist()
+    else:
+        nails, it = iter_instructions(path, default_nails)
+        seq = list(it)
+    if not seq: raise ValueError("Данные не найдены")
+    return nails, seq
+
+
+def convert_instructions(src, dst, default_nails=240, params=None):
+    # Одна схема в другой формат; цвет и параметры RSQ/JSON переносятся
+    color = None
+    ext = src.lower()
+    if ext.endswith(RSQ_EXT):
+        with SequenceFile(src) as sf:
+            if not sf.verify(): raise ValueError("Контрольная сумма не совпала")
+            params = params or sf.params or None
+            color = sf.color
+    elif ext.endswith(".json"):
+        with open(src, "r") as f:
+            color = json.load(f).get("color")
+    nails, seq = iter_instructions(src, default_nails)
+    # Пустая схема - ошибка, как и при чтении; пустой файл не пишется
+    first = next(seq, None)
+    if first is None: raise ValueError("Данные не найдены")
+    write_instructions(dst, itertools.chain([first], seq), nails, color=color, params=params)
@@ -0,0 +1,370 @@
+"""Геометрия обруча: координаты гвоздей и индекс пикселей всех хорд."""
+import math
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+GEOMETRY_VERSION = 1   # Меняется при любом изменении формата или обхода хорд
+HOOP_SHAPE = "circle"
+
+# =================================================================================
+# ГЕОМЕТРИЯ: ИНДЕКС ПИКСЕЛЕЙ ХОРД
+# Пиксели каждой хорды (пары гвоздей) считаются один раз на сочетание
+# (кол-во гвоздей, размер расчета) и хранятся в плоских массивах в стиле CSR:
+# pixels[offsets[row]:offsets[row+1]] - индексы y*size+x пикселей одной хорды.
+# Обход хорды в точности повторяет старый np.linspace + astype + clip.
+# =================================================================================
+def calculate_nails(size, n_nails):
+    cx, cy = size / 2, size / 2
+    rad = size / 2 - 1
+    nails = []
+    for i in range(n_nails):
+        a = 2 * math.pi * i / n_nails
+        nails.append((int(cx + rad * math.cos(a)), int(cy + rad * math.sin(a))))
+    return nails
+
+
+class ChordIndex:
+    def __init__(self, n_nails, size):
+        self.n_nails = n_nails
+        self.size = size
+        self.nails = calculate_nails(size, n_nails)
+        # pair_row[a, b] - строка CSR для хорды a -> b (-1: хорда нулевой длины)
+        self.pair_row = np.full((n_nails, n_nails), -1, dtype=np.int32)
+        self.offsets, self.pixels = self._build()
+        self._candidates = {}
+        self._inverted = None
+        self.cache_entry = None  # Папка дискового кэша, если индекс в нем сохранен
+
+    @classmethod
+    def from_arrays(cls, n_nails, size, pair_row, offsets, pixels, inverted=None):
+        # Индекс поверх готовых массивов (разделяемая память, файлы) без перестроения
+        index = cls.__new__(cls)
+        index.n_nails = n_nails
+        index.size = size
+        index.nails = calculate_nails(size, n_nails)
+        index.pair_row = pair_row
+        index.offsets = offsets
+        index.pixels = pixels
+        index._candidates = {}
+        index._inverted = inverted
+        index.cache_entry = None
+        return index
+
+    def arrays(self):
+        # Массивы, из которых состоит индекс (для передачи в другие процессы)
+        data = {"pair_row": self.pair_row, "offsets": self.offsets, "pixels": self.pixels}
+        if self._inverted is not None:
+            data["pix_offsets"], data["pix_rows"] = self._inverted
+        return data
+
+    def _walk(self, start, stop, ln):
+        # Векторный np.linspace по группе хорд одной длины (столбец = хорда).
+        # Хорды с нулевым шагом по оси считаем отдельно: если такая есть в группе,
+        # numpy выбирает для всей группы другую формулу и округление
+        # расходится со скалярным вызовом.
+        pts = np.repeat(start[None, :], ln, axis=0)
+        moving = start != stop
+        if moving.any():
+            pts[:, moving] = np.linspace(start[moving], stop[moving], ln)
+        return np.clip(pts.astype(int), 0, self.size - 1)
+
+    def _build(self):
+        n, size = self.n_nails, self.size
+        xy = np.array(self.nails, dtype=np.float64).reshape(-1, 2)
+        a_idx, b_idx = np.triu_indices(n, k=1)
+        d = xy[b_idx] - xy[a_idx]
+        lengths = np.hypot(d[:, 0], d[:, 1]).astype(int)
+
+        chunks, lens = [], []
+        row = 0
+        for ln in np.unique(lengths):
+            if ln == 0: continue
+            sel = np.nonzero(lengths == ln)[0]
+            a, b = a_idx[sel], b_idx[sel]
+            fwd = self._walk(xy[a, 1], xy[b, 1], ln) * size + self._walk(xy[a, 0], xy[b, 0], ln)
+            rev = self._walk(xy[b, 1], xy[a, 1], ln) * size + self._walk(xy[b, 0], xy[a, 0], ln)
+
+            self.pair_row[a, b] = np.arange(row, row + len(sel))
+            self.pair_row[b, a] = self.pair_row[a, b]
+            chunks.append(fwd.T.ravel())
+            lens.append(np.full(len(sel), ln))
+            row += len(sel)
+
+            # Обратный обход почти всегда дает те же пиксели, но из-за округления
+            # float бывают исключения - для них храним отдельную строку b -> a.
+            same = np.all(np.sort(fwd, axis=0) == np.sort(rev, axis=0), axis=0)
+            diff = np.nonzero(~same)[0]
+            if len(diff):
+                self.pair_row[b[diff], a[diff]] = np.arange(row, row + len(diff))
+                chunks.append(rev[:, diff].T.ravel())
+                lens.append(np.full(len(diff), ln))
+                row += len(diff)
+
+        offsets = np.zeros(row + 1, dtype=np.int64)
+        if lens:
+            np.cumsum(np.concatenate(lens), out=offsets[1:])
+        pixels = np.concatenate(chunks).astype(np.int32) if chunks else np.zeros(0, dtype=np.int32)
+        return offsets, pixels
+
+    def chord(self, a, b):
+        row = self.pair_row[a, b]
+        if row < 0: return None
+        return self.pixels[self.offsets[row]:self.offsets[row + 1]]
+
+    def allowed_mask(self, skip_nails):
+        # Булева таблица разрешенных хорд: без соседей ближе skip_nails
+        # и без хорд нулевой длины
+        idx = np.arange(self.n_nails)
+        dist = np.abs(idx[:, None] - idx[None, :])
+        return (dist >= skip_nails) & (dist <= self.n_nails - skip_nails) & (self.pair_row >= 0)
+
+    def candidates(self, skip_nails):
+        # Для каждого гвоздя: (номера целевых гвоздей, строки CSR), по возрастанию номера
+        if skip_nails not in self._candidates:
+            mask = self.allowed_mask(skip_nails)
+            table = []
+            for a in range(self.n_nails):
+                targets = np.nonzero(mask[a])[0]
+                table.append((targets, self.pair_row[a, targets].astype(np.int64)))
+            self._candidates[skip_nails] = table
+        return self._candidates[skip_nails]
+
+    def candidate_csr(self, skip_nails):
+        # То же, что candidates(), в трех плоских массивах (для JIT-ядра):
+        # цели гвоздя a - targets[offsets[a]:offsets[a+1]], их строки - rows[...]
+        key = ("csr", skip_nails)
+        if key not in self._candidates:
+            table = self.candidates(skip_nails)
+            offsets = np.zeros(self.n_nails + 1, dtype=np.int64)
+            np.cumsum([len(t) for t, _ in table], out=offsets[1:])
+            targets = np.concatenate([t for t, _ in table]).astype(np.int64)
+            rows = np.concatenate([r for _, r in table]).astype(np.int64)
+            self._candidates[key] = (offsets, targets, rows)
+        return self._candidates[key]
+
+    def chord_sums(self, err_flat, rows=None):
+        # Суммы ошибки под несколькими хордами за один проход:
+        # собираем пиксели всех хорд подряд и сворачиваем по сегментам (reduceat).
+        # rows=None - все строки индекса сразу.
+        if rows is None:
+            return np.add.reduceat(err_flat[self.pixels], self.offsets[:-1], dtype=np.float64)
+        starts = self.offsets[rows]
+        lens = self.offsets[rows + 1] - starts
+        seg = np.zeros(len(rows), dtype=np.int64)
+        np.cumsum(lens[:-1], out=seg[1:])
+        idx = np.repeat(starts - seg, lens) + np.arange(seg[-1] + lens[-1])
+        return np.add.reduceat(err_flat[self.pixels[idx]], seg, dtype=np.float64)
+
+    @property
+    def n_rows(self):
+        return len(self.offsets) - 1
+
+    def inverted(self):
+        # Обратный индекс пиксель -> строки хорд (тоже CSR), строится по требованию.
+        # Пиксель, попавший в хорду дважды, дает две записи - как и в сумме.
+        if self._inverted is None and self.cache_entry is not None:
+            self._inverted = geometry_cache.load_inverted(self.cache_entry)
+        if self._inverted is None:
+            # Сортировка упакованных ключей пиксель*n_rows+строка: тот же порядок, что
+            # у устойчивого argsort по пикселям, но в ~3 раза быстрее на 20M записей
+            row_of_entry = np.repeat(np.arange(self.n_rows, dtype=np.int64), np.diff(self.offsets))
+            keys = self.pixels.astype(np.int64) * self.n_rows + row_of_entry
+            keys.sort()
+            pix_rows = (keys % self.n_rows).astype(np.int32)
+            pix_offsets = np.zeros(self.size * self.size + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.pixels, minlength=self.size * self.size), out=pix_offsets[1:])
+            self._inverted = (pix_offsets, pix_rows)
+            if self.cache_entry is not None:
+                geometry_cache.store_inverted(self.cache_entry, self._inverted)
+        return self._inverted
+
+
+class ChordScoreTable:
+    # Текущие суммы ошибки для всех хорд индекса.
+    # После вычитания нити обновляются только хорды, проходящие через ее пиксели.
+    def __init__(self, index, err_flat):
+        self.index = index
+        self.pix_offsets, self.pix_rows = index.inverted()
+        self.scores = index.chord_sums(err_flat)
+
+    def subtract(self, pix, weight):
+        # err_flat[pix] -= weight уменьшает каждый пиксель один раз, даже при повторах
+        pix = np.unique(pix)
+        starts = self.pix_offsets[pix]
+        lens = self.pix_offsets[pix + 1] - starts
+        total = int(lens.sum())
+        if total == 0: return
+        seg = np.cumsum(lens) - lens
+        idx = np.repeat(starts - seg, lens) + np.arange(total)
+        hits = np.bincount(self.pix_rows[idx], minlength=self.index.n_rows)
+        self.scores -= weight * hits
+
+
+# =================================================================================
+# ДИСКОВЫЙ КЭШ ГЕОМЕТРИИ
+# Массивы индекса сохраняются как .npy в папке
+# <кэш>/v<версия>_<форма>_n<гвозди>_s<размер>/ и открываются через mmap_mode="r":
+# холодный процесс сразу начинает расчет, а несколько процессов делят одни и те же
+# страницы памяти. Маски пропуска соседей строятся из pair_row мгновенно и
+# не хранятся. При превышении бюджета удаляются давно не использованные записи.
+# Настройка: RINGSTRING_CACHE_DIR ("" - выключить), RINGSTRING_CACHE_MB.
+# =================================================================================
+_BASE_ARRAYS = ("pair_row", "offsets", "pixels")
+_INVERTED_ARRAYS = ("pix_offsets", "pix_rows")
+
+
+class DirCache:
+    # Записи - папки внутри path; общая часть дисковых кэшей (геометрия, результаты):
+    # атомарная запись, LRU по времени изменения папки, бюджет в байтах
+    def __init__(self, path=None, max_bytes=2 * 1024**3):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    def _write(self, entry, arrays, texts=None):
+        # Запись в отдельную папку и атомарное переименование: параллельные
+        # процессы либо видят полную запись, либо не видят ее совсем
+        os.makedirs(self.path, exist_ok=True)
+        tmp = os.path.join(self.path, f".tmp_{os.getpid()}_{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp, name + ".npy"), arr)
+            for name, text in (texts or {}).items():
+                with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(entry): raise  # Иначе запись уже сделал другой процесс
+
+    def _add_array(self, entry, name, arr):
+        # Дописать массив в готовую запись: временный файл и переименование,
+        # читатели не видят половину файла
+        tmp = os.path.join(entry, f".{name}.{uuid.uuid4().hex}.npy")
+        np.save(tmp, arr)
+        os.replace(tmp, os.path.join(entry, name + ".npy"))
+
+    def entries(self):
+        # [(mtime, байты, путь)] для всех записей кэша
+        result = []
+        if not self.enabled or not os.path.isdir(self.path): return result
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith(".") or not os.path.isdir(entry): continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry) if f.is_file())
+                result.append((os.stat(entry).st_mtime, size, entry))
+            except OSError:
+                continue
+        return result
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes: break
+            if entry == keep: continue
+            # Открытые через mmap файлы другого процесса остаются доступны ему
+            # до закрытия (POSIX); на Windows такие записи просто пропускаются
+            shutil.rmtree(entry, ignore_errors=True)
+            if not os.path.isdir(entry):
+                total -= size
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+class GeometryCache(DirCache):
+    def entry_path(self, n_nails, size):
+        return os.path.join(self.path, f"v{GEOMETRY_VERSION}_{HOOP_SHAPE}_n{n_nails}_s{size}")
+
+    def load(self, n_nails, size):
+        if not self.enabled: return None
+        entry = self.entry_path(n_nails, size)
+        try:
+            arrays = {name: np.load(os.path.join(entry, name + ".npy"), mmap_mode="r")
+                      for name in _BASE_ARRAYS}
+            os.utime(entry)  # Отметка для LRU
+        except (OSError, ValueError):
+            return None
+        index = ChordIndex.from_arrays(n_nails, size, **arrays)
+        index.cache_entry = entry
+        return index
+
+    def store(self, index):
+        if not self.enabled: return
+        entry = self.entry_path(index.n_nails, index.size)
+        try:
+            self._write(entry, {name: getattr(index, name) for name in _BASE_ARRAYS})
+            index.cache_entry = entry
+            self.evict(keep=entry)
+        except OSError:
+            pass  # Кэш - только ускорение; без записи на диск расчет продолжается
+
+    def load_inverted(self, entry):
+        try:
+            return tuple(np.load(os.path.join(entry, name + ".npy"), mmap_mode="r")
+                         for name in _INVERTED_ARRAYS)
+        except (OSError, ValueError):
+            return None
+
+    def store_inverted(self, entry, inverted):
+        try:
+            for name, arr in zip(_INVERTED_ARRAYS, inverted):
+                self._add_array(entry, name, arr)
+            self.evict(keep=entry)
+        except OSError:
+            pass
+
+
+def _default_cache_dir():
+    path = os.environ.get("RINGSTRING_CACHE_DIR")
+    if path is not None:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "ringstring", "geometry")
+
+
+geometry_cache = GeometryCache(_default_cache_dir(),
+                               int(float(os.environ.get("RINGSTRING_CACHE_MB", 2048)) * 1024**2))
+
+
+def configure_geometry_cache(path=None, max_mb=None):
+    # path="" выключает дисковый кэш
+    if path is not None:
+        geometry_cache.path = path
+    if max_mb is not None:
+        geometry_cache.max_bytes = int(max_mb * 1024**2)
+    return geometry_cache
+
+
+_chord_index_cache = {}
+_chord_index_lock = threading.Lock()
+
+def get_chord_index(n_nails, size):
+    # Геометрия обруча полностью задается размером расчета (вписанный круг).
+    # Порядок поиска: память процесса -> дисковый кэш -> построение с нуля.
+    key = (n_nails, size)
+    with _chord_index_lock:
+        index = _chord_index_cache.get(key)
+        if index is None:
+            index = geometry_cache.load(n_nails, size)
+            if index is None:
+                index = ChordIndex(n_nails, size)
+                geometry_cache.store(index)
+            _chord_index_cache[key] = index
+    return index
+
+
+def register_chord_index(index):
+    # Подставить готовый индекс в кэш процесса (например, из разделяемой памяти)
+    with _chord_index_lock:
+        _chord_index_cache[(index.n_nails, index.size)] = index
@@ -0,0 +1,132 @@
+"""Инструментирование расчета: поток событий, таймеры фаз, профиль задания.
+
+Решатель и рендер публикуют события в Instrumentation, а интерфейс, CLI и
+журнал подписываются на нужные им виды событий. Событие собирается, только
+если на его вид кто-то подписан, поэтому без подписчиков накладных расходов нет.
+
+Виды событий (словарь с ключами "event", "t" и данными):
+    phase    - name, seconds: фаза crop / mask / geometry / scoring / apply / refine / finalize
+    progress - i, total: каждые 25 линий
+    line     - i, a, b, score, residual: каждая линия (residual - None при trace_residual=False)
+    memory   - peak_mb, top: снимок tracemalloc в конце расчета (trace_memory=True)
+"""
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+ALL_EVENTS = ("phase", "progress", "line", "memory")
+
+
+class Instrumentation:
+    def __init__(self, trace_memory=False, trace_residual=True):
+        self.trace_memory = trace_memory
+        self.trace_residual = trace_residual  # Остаток ошибки в событиях "line" (чуть дороже)
+        self._subscribers = []  # [(callback, виды событий)]
+
+    def subscribe(self, callback, kinds=ALL_EVENTS):
+        self._subscribers.append((callback, frozenset(kinds)))
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers = [(cb, k) for cb, k in self._subscribers if cb is not callback]
+
+    def wants(self, kind):
+        return any(kind in kinds for _, kinds in self._subscribers)
+
+    def emit(self, kind, **data):
+        targets = [cb for cb, kinds in self._subscribers if kind in kinds]
+        if not targets: return
+        event = {"event": kind, "t": time.perf_counter(), **data}
+        for cb in targets:
+            cb(event)
+
+    @contextmanager
+    def _timed(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.emit("phase", name=name, seconds=time.perf_counter() - t0)
+
+
+def phase(instrument, name):
+    # Таймер фазы; без подписчиков на "phase" - пустой контекст
+    if instrument is None or not instrument.wants("phase"):
+        return nullcontext()
+    return instrument._timed(name)
+
+
+@contextmanager
+def memory_trace(instrument, top=10):
+    # Снимок tracemalloc за время блока, если включен trace_memory
+    if instrument is None or not instrument.trace_memory or not instrument.wants("memory"):
+        yield
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        stats = tracemalloc.take_snapshot().statistics("lineno")[:top]
+        if started:
+            tracemalloc.stop()
+        instrument.emit("memory", peak_mb=peak / 1024**2,
+                        top=[{"where": str(s.traceback), "mb": s.size / 1024**2} for s in stats])
+
+
+# =================================================================================
+# ПОДПИСЧИКИ
+# =================================================================================
+class Profiler:
+    # Собирает профиль одного задания; profile.dump(path) пишет JSON
+    def __init__(self, meta=None):
+        self.meta = dict(meta or {})
+        self.phases = {}
+        self.scores = []
+        self.residuals = []
+        self.memory = None
+
+    def attach(self, instrument, trace_lines=True):
+        kinds = ["phase", "memory"] + (["line"] if trace_lines else [])
+        instrument.subscribe(self, kinds)
+        return self
+
+    def __call__(self, event):
+        kind = event["event"]
+        if kind == "phase":
+            self.phases[event["name"]] = self.phases.get(event["name"], 0.0) + event["seconds"]
+        elif kind == "line":
+            self.scores.append(event["score"])
+            self.residuals.append(event.get("residual"))
+        elif kind == "memory":
+            self.memory = {"peak_mb": event["peak_mb"], "top": event["top"]}
+
+    def to_dict(self):
+        return {"meta": self.meta, "phases": self.phases,
+                "trace": {"score": self.scores, "residual": self.residuals},
+                "memory": self.memory}
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+
+def log_sink(logger=None, every=500):
+    # Подписчик для журнала: фазы, память и каждая every-я линия
+    logger = logger or logging.getLogger("ringstring")
+
+    def sink(event):
+        kind = event["event"]
+        if kind == "phase":
+            logger.info("фаза %s: %.3f с", event["name"], event["seconds"])
+        elif kind == "line" and event["i"] % every == 0:
+            logger.info("линия %d: %d -> %d, score %.0f, остаток %s", event["i"], event["a"],
+                        event["b"], event["score"], event.get("residual"))
+        elif kind == "memory":
+            logger.info("пик памяти: %.1f МБ", event["peak_mb"])
+    return sink
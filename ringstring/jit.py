@@ -0,0 +1,93 @@
+"""Необязательное JIT-ядро жадного расчета (Numba).
+
+Ядро проходит сразу пачку линий - сумма под каждой хордой-кандидатом, выбор
+лучшей, вычитание нити, переход к следующему гвоздю - не возвращаясь в
+интерпретатор на каждой линии. Суммы считаются в том же порядке и в тех же
+типах, что и в NumPy-пути (последовательно в float64, вычитание во float32),
+поэтому последовательности совпадают бит в бит. Без Numba используется NumPy.
+"""
+import logging
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # Без Numba ядро остается обычной функцией Python (для проверки на малых размерах)
+        if args and callable(args[0]): return args[0]
+        return lambda f: f
+
+BACKENDS = ("auto", "numpy", "numba")
+log = logging.getLogger("ringstring")
+_warned = False
+
+
+def use_jit(backend):
+    # "auto" - Numba, если установлена; "numba" без Numba - NumPy с предупреждением в журнал
+    global _warned
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный backend: {backend}")
+    if backend == "numpy": return False
+    if not NUMBA_AVAILABLE and backend == "numba" and not _warned:
+        log.warning("Numba не установлена - расчет идет на NumPy")
+        _warned = True
+    return NUMBA_AVAILABLE
+
+
+@njit(cache=True, nogil=True)
+def greedy_lines(err_flat, pixels, offsets, cand_offsets, cand_targets, cand_rows,
+                 stamp, tag, curr, n_lines, weight, out_nails, out_scores):
+    # До n_lines линий от гвоздя curr. Пишет гвозди и суммы выбранных хорд в out_*,
+    # возвращает сколько линий проложено (меньше n_lines - кандидатов не осталось).
+    # stamp/tag - метки пикселей: повтор пикселя в хорде вычитается один раз, как err_flat[pix] -= w.
+    w = np.float32(weight)
+    for i in range(n_lines):
+        start, stop = cand_offsets[curr], cand_offsets[curr + 1]
+        if stop == start: return i
+        best_k = start
+        best = -np.inf
+        for k in range(start, stop):
+            r = cand_rows[k]
+            s = 0.0
+            for q in range(offsets[r], offsets[r + 1]):
+                s += np.float64(err_flat[pixels[q]])
+            if s > best:
+                best = s
+                best_k = k
+        if best <= -999999999.0: return i
+
+        tag += 1
+        r = cand_rows[best_k]
+        for q in range(offsets[r], offsets[r + 1]):
+            p = pixels[q]
+            if stamp[p] != tag:
+                stamp[p] = tag
+                err_flat[p] = err_flat[p] - w
+        curr = cand_targets[best_k]
+        out_nails[i] = curr
+        out_scores[i] = best
+    return n_lines
+
+
+class JitGreedy:
+    # Состояние ядра на один расчет: массивы индекса и метки пикселей
+    def __init__(self, index, skip_nails, err_flat, weight):
+        self.index = index
+        self.err_flat = err_flat
+        self.weight = weight
+        self.cand = index.candidate_csr(skip_nails)
+        self.stamp = np.zeros(len(err_flat), dtype=np.int64)
+        self.tag = 0
+
+    def run(self, curr, n_lines):
+        # (гвозди, суммы) следующих линий; короче n_lines - расчет уперся в конец
+        nails = np.empty(n_lines, dtype=np.int64)
+        scores = np.empty(n_lines, dtype=np.float64)
+        done = greedy_lines(self.err_flat, self.index.pixels, self.index.offsets, *self.cand,
+                            self.stamp, self.tag, curr, n_lines, self.weight, nails, scores)
+        self.tag += done
+        return nails[:done], scores[:done]
@@ -0,0 +1,91 @@
+"""Кэш кадров плеера инструкции: растры "первые step шагов" без перерисовки с нуля.
+
+Каждые interval шагов сохраняется ключевой кадр (LRU в пределах бюджета памяти).
+Переход на шаг рисует только линии от ближайшего кадра до нужного шага,
+а воспроизведение дорисовывает предыдущий кадр по одной линии, поэтому время
+кадра не зависит от того, насколько далеко шаг от начала последовательности.
+"""
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+
+class KeyframeCache:
+    def __init__(self, points, size, interval=200, budget_mb=64, fill=(0, 0, 0, 30), width=1):
+        # points - координаты точек последовательности на холсте (None - неверный гвоздь)
+        self.points = points
+        self.size = size
+        self.interval = interval
+        self.budget = int(budget_mb * 1024**2)
+        self.fill = fill
+        self.width = width
+        self._keys = OrderedDict()  # шаг -> Image, от давно использованных к недавним
+        self._cursor_step, self._cursor = 0, None
+
+    @property
+    def nbytes(self):
+        return len(self._keys) * self.size * self.size * 3
+
+    def _blank(self):
+        return Image.new("RGB", (self.size, self.size), "white")
+
+    def _store(self, step, img):
+        self._keys[step] = img.copy()
+        while self.nbytes > self.budget and len(self._keys) > 1:
+            self._keys.popitem(last=False)
+
+    def _nearest(self, step):
+        # (шаг, кадр) ближайшего готового растра не дальше step
+        k = step // self.interval * self.interval
+        while k > 0 and k not in self._keys:
+            k -= self.interval
+        if self._cursor is not None and k <= self._cursor_step <= step:
+            return self._cursor_step, self._cursor
+        if k > 0:
+            self._keys.move_to_end(k)
+            return k, self._keys[k].copy()
+        return 0, self._blank()
+
+    def _draw(self, img, start, stop):
+        # Отрезки, заканчивающиеся в точках start ... stop-1, каждый отдельно: полупрозрачный
+        # стык рисуется одинаково, поэтому кадр не зависит от того, шагами или переходом
+        # к нему пришли. Неверные точки (None) пропускаются, соседние соединяются.
+        draw = ImageDraw.Draw(img, "RGBA")
+        k = start - 1
+        while k >= 0 and self.points[k] is None:
+            k -= 1
+        prev = self.points[k] if k >= 0 else None
+        for p in self.points[start:stop]:
+            if p is None: continue
+            if prev is not None:
+                draw.line((prev, p), fill=self.fill, width=self.width)
+            prev = p
+
+    def last_line(self, step):
+        # Две последние точки первых step шагов (для подсветки текущей линии)
+        pts = []
+        for p in reversed(self.points[max(step - 2, 0):step]):
+            if p is not None: pts.insert(0, p)
+        if len(pts) < 2:
+            k = step - 3
+            while k >= 0 and len(pts) < 2:
+                if self.points[k] is not None: pts.insert(0, self.points[k])
+                k -= 1
+        return pts
+
+    def frame(self, step):
+        # Растр первых step шагов. Кадр принадлежит кэшу: рисовать поверх - только на копии.
+        step = max(0, min(step, len(self.points)))
+        cur, img = self._nearest(step)
+        while cur < step:
+            nxt = min((cur // self.interval + 1) * self.interval, step)
+            self._draw(img, cur, nxt)
+            cur = nxt
+            if cur % self.interval == 0 and cur not in self._keys:
+                self._store(cur, img)
+        self._cursor_step, self._cursor = step, img
+        return img
+
+    def clear(self):
+        self._keys.clear()
+        self._cursor_step, self._cursor = 0, None
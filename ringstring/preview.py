@@ -0,0 +1,123 @@
+"""Слои холста в редакторе: слайдеры работают с кэшированными слоями, а не с оригиналом.
+
+Серое изображение и его гистограмма считаются один раз при загрузке. На холст идет
+только видимая часть зума: кадр размером не больше холста кэшируется по (зум, окно),
+яркость и контраст накладываются на него одной таблицей (photo_lut) - цена шага
+слайдера не зависит от зума. Полноразмерная обработка - только для расчета (full).
+Слой нитей уменьшается под обруч один раз на радиус, прозрачность - таблицей по альфа-каналу.
+"""
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .engine import adjust_gray, photo_lut
+
+
+class PhotoPreview:
+    def __init__(self, budget_mb=96):
+        self.budget = int(budget_mb * 1024**2)
+        self.gray = None
+        self.histogram = None
+        self._pixels = None
+        self._layers = OrderedDict()  # (зум, окно) -> серый кадр, от давно использованных к недавним
+        self._lut_key, self._lut = None, None
+        self._last_key, self._last = None, None
+
+    @property
+    def loaded(self):
+        return self.gray is not None
+
+    def load(self, img):
+        self.clear()
+        self.gray = ImageOps.grayscale(img.convert("RGB"))
+        self.histogram = self.gray.histogram()
+        self._pixels = np.asarray(self.gray)
+
+    def clear(self):
+        self.gray = self.histogram = self._pixels = None
+        self._layers.clear()
+        self._lut_key = self._lut = self._last_key = self._last = None
+
+    def lut(self, brightness, contrast):
+        key = (brightness, contrast)
+        if key != self._lut_key:
+            self._lut_key, self._lut = key, photo_lut(self.histogram, brightness, contrast)
+        return self._lut
+
+    def zoom_size(self, scale):
+        return int(self.gray.width * scale), int(self.gray.height * scale)
+
+    def viewport(self, scale, center, canvas):
+        # Видимая часть зума: (x0, y0, x1, y1) в пикселях зума или None.
+        # center - центр фото на холсте (как create_image), canvas - (ширина, высота).
+        zw, zh = self.zoom_size(scale)
+        left, top = center[0] - zw // 2, center[1] - zh // 2
+        box = (max(0, -left), max(0, -top), min(zw, canvas[0] - left), min(zh, canvas[1] - top))
+        return box if box[0] < box[2] and box[1] < box[3] else None
+
+    def zoom_layer(self, scale, box):
+        # Кадр box зума без построения всего зума: пиксель (x, y) зума - пиксель оригинала
+        # ((x + 0.5) * W / zw, (y + 0.5) * H / zh), одинаково для любого окна
+        key = (self.zoom_size(scale), box)
+        layer = self._layers.get(key)
+        if layer is None:
+            (zw, zh), (x0, y0, x1, y1) = key
+            xs = ((np.arange(x0, x1) + 0.5) * (self.gray.width / zw)).astype(np.intp)
+            ys = ((np.arange(y0, y1) + 0.5) * (self.gray.height / zh)).astype(np.intp)
+            layer = self._layers[key] = Image.fromarray(self._pixels[ys[:, None], xs])
+            while sum(im.width * im.height for im in self._layers.values()) > self.budget and len(self._layers) > 1:
+                self._layers.popitem(last=False)
+        self._layers.move_to_end(key)
+        return layer
+
+    def layer(self, scale, brightness=1.0, contrast=1.0, alpha=255, center=(0, 0), canvas=(0, 0)):
+        # RGBA-кадр для холста и его левый верхний угол на холсте; (None, None) - фото не видно
+        box = self.viewport(scale, center, canvas)
+        if box is None: return None, None
+        zw, zh = self.zoom_size(scale)
+        pos = (center[0] - zw // 2 + box[0], center[1] - zh // 2 + box[1])
+        key = (scale, box, brightness, contrast, alpha)
+        if key != self._last_key:
+            gray = self.zoom_layer(scale, box).point(self.lut(brightness, contrast))
+            self._last_key = key
+            self._last = Image.merge("RGBA", (gray, gray, gray, Image.new("L", gray.size, alpha)))
+        return self._last, pos
+
+    def full(self, brightness=1.0, contrast=1.0):
+        # Обработанное фото в полном разрешении - как adjust_photo(оригинал)
+        return adjust_gray(self.gray, brightness, contrast, self.histogram)
+
+
+class StringsOverlay:
+    def __init__(self, sizes=4):
+        self.image = None
+        self.sizes = sizes            # Сколько размеров обруча держать
+        self._scaled = OrderedDict()  # размер -> каналы R, G, B, A под обруч
+        self._last_key, self._last = None, None
+
+    def set(self, strings_img):
+        # Новый рендер нитей (RGBA); None - нитей нет
+        self.image = strings_img
+        self._scaled.clear()
+        self._last_key = self._last = None
+
+    def scaled(self, size):
+        channels = self._scaled.get(size)
+        if channels is None:
+            channels = self._scaled[size] = self.image.resize((size, size), Image.Resampling.LANCZOS).split()
+            while len(self._scaled) > self.sizes:
+                self._scaled.popitem(last=False)
+        self._scaled.move_to_end(size)
+        return channels
+
+    def layer(self, size, opacity=1.0):
+        # RGBA-слой для холста; тот же объект, пока размер и прозрачность не менялись
+        key = (size, opacity)
+        if key != self._last_key:
+            channels = self.scaled(size)
+            if opacity < 1.0:
+                channels = channels[:3] + (channels[3].point([int(p * opacity) for p in range(256)]),)
+            self._last_key = key
+            self._last = Image.merge("RGBA", channels)
+        return self._last
@@ -0,0 +1,248 @@
+"""Кэш готовых расчетов: ключ - содержимое обрезанного фото и все параметры алгоритма.
+
+Повторный заказ того же фото с теми же параметрами не запускает расчет и рендер:
+последовательность, матрица ошибки (для продолжения расчета), сводка и альфа-каналы
+рендера по уровням берутся из памяти процесса или с диска
+(<кэш>/<ключ>/: meta.json, sequence.npy, error.npy, alpha_<px>.npy).
+Уровни рендера дописываются в запись по мере запроса.
+
+Пакетный режим и сервер находят результат еще до загрузки фото: ключ исходного файла
+(байты файла и настройки подготовки, source_key) ссылается на ключ результата, а готовые
+PNG / SVG / PDF хранятся в записи (out_<имя>) и просто копируются.
+Настройка: RINGSTRING_RESULT_CACHE ("" - выключить), RINGSTRING_RESULT_CACHE_MB.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from .engine import (
+    ALGORITHM_VERSION, NO_EFFECT, Checkpoint, GenerationResult,
+    density_to_alpha, render_size, strings_layer, thread_density,
+)
+from .geometry import GEOMETRY_VERSION, HOOP_SHAPE, DirCache, get_chord_index
+
+
+def result_key(calc_img, params, checkpoint=None):
+    # checkpoint - продолжение расчета: в ключ входит происхождение чекпоинта.
+    # None - чекпоинт без хэша фото, такой результат не кэшируется
+    resumed = None
+    if checkpoint is not None:
+        resumed = checkpoint.provenance()
+        if resumed is None: return None
+    h = hashlib.blake2b(digest_size=16)
+    p = {k: v for k, v in params.to_dict().items() if k not in NO_EFFECT}
+    h.update(json.dumps({"algorithm": ALGORITHM_VERSION, "geometry": GEOMETRY_VERSION,
+                         "hoop": HOOP_SHAPE, "params": p, "resumed": resumed}, sort_keys=True).encode())
+    h.update(f"{calc_img.mode}|{calc_img.size}".encode())
+    h.update(calc_img.tobytes())
+    return h.hexdigest()
+
+
+def source_key(data, params, settings):
+    # Ключ исходного файла: байты как есть (до загрузки, rembg и яркости) и настройки подготовки
+    h = hashlib.blake2b(digest_size=16)
+    p = {k: v for k, v in params.to_dict().items() if k not in NO_EFFECT}
+    h.update(json.dumps({"algorithm": ALGORITHM_VERSION, "geometry": GEOMETRY_VERSION,
+                         "hoop": HOOP_SHAPE, "params": p, "source": settings}, sort_keys=True).encode())
+    h.update(data)
+    return "src_" + h.hexdigest()
+
+
+class _Entry:
+    # Запись в памяти: meta, sequence, error, альфа-каналы рендера {px: массив}
+    def __init__(self, meta, sequence, error, path=None):
+        self.meta = meta
+        self.sequence = sequence
+        self.error = error
+        self.path = path
+        self.alphas = {}
+
+    @property
+    def nbytes(self):
+        return self.error.nbytes + sum(a.nbytes for a in self.alphas.values())
+
+
+class ResultCache(DirCache):
+    def __init__(self, path=None, max_bytes=1024**3, memory_mb=128):
+        super().__init__(path, max_bytes)
+        self.memory_bytes = int(memory_mb * 1024**2)
+        self._memory = OrderedDict()  # ключ -> _Entry, от давно использованных к недавним
+        self._links = OrderedDict()   # ключ файла -> ключ результата
+        self._lock = threading.Lock()
+
+    def key(self, calc_img, params, checkpoint=None):
+        return result_key(calc_img, params, checkpoint)
+
+    # -----------------------------------------------------------------------------
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > 1 and sum(e.nbytes for e in self._memory.values()) > self.memory_bytes:
+                self._memory.popitem(last=False)
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        if not self.enabled: return None
+        path = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            sequence = np.load(os.path.join(path, "sequence.npy")).tolist()
+            error = np.load(os.path.join(path, "error.npy"))
+            os.utime(path)  # Отметка для LRU
+        except (OSError, ValueError):
+            return None
+        error.flags.writeable = False
+        entry = _Entry(meta, sequence, error, path)
+        self._remember(key, entry)
+        return entry
+
+    def get(self, key, params):
+        # GenerationResult из кэша (result.cached=True) или None
+        if key is None: return None
+        entry = self._entry(key)
+        if entry is None: return None
+        nails = get_chord_index(params.nails, params.calc_size).nails
+        sequence = list(entry.sequence)
+        return GenerationResult(params, sequence, nails, elapsed=entry.meta["elapsed"],
+                                checkpoint=Checkpoint(params, sequence, entry.error, entry.meta.get("image", "")),
+                                report=dict(entry.meta["report"]) if entry.meta["report"] else None,
+                                cached=True, cache_key=key)
+
+    def put(self, key, result):
+        # Только полный расчет: остановленный и продолжение без ключа (key=None) не кэшируются
+        if key is None or result.stopped or result.checkpoint is None: return
+        meta = {"params": result.params.to_dict(), "elapsed": result.elapsed, "report": result.report,
+                "lines": len(result.sequence) - 1, "image": result.checkpoint.image}
+        sequence = np.asarray(result.sequence, dtype=np.int32)
+        error = result.checkpoint.error_matrix
+        path = os.path.join(self.path, key) if self.enabled else None
+        if path:
+            try:
+                self._write(path, {"sequence": sequence, "error": error},
+                            {"meta.json": json.dumps(meta, ensure_ascii=False)})
+                self.evict(keep=path)
+            except OSError:
+                path = None  # Кэш - только ускорение
+        error = error.copy()
+        error.flags.writeable = False
+        self._remember(key, _Entry(meta, list(result.sequence), error, path))
+
+    # -----------------------------------------------------------------------------
+    def link(self, source, key):
+        # Ключ исходного файла (source_key) -> ключ результата
+        with self._lock:
+            self._links[source] = key
+            self._links.move_to_end(source)
+            while len(self._links) > 4096:
+                self._links.popitem(last=False)
+        if not self.enabled: return
+        try:
+            self._write(os.path.join(self.path, source), {}, {"link.txt": key})
+        except OSError:
+            pass
+
+    def lookup(self, source, params):
+        # Результат по ключу файла или None: фото не загружается и не обрабатывается
+        with self._lock:
+            key = self._links.get(source)
+        if key is None and self.enabled:
+            try:
+                with open(os.path.join(self.path, source, "link.txt"), encoding="utf-8") as f:
+                    key = f.read().strip()
+                os.utime(os.path.join(self.path, source))
+            except OSError:
+                return None
+        return self.get(key, params) if key else None
+
+    def output(self, key, name, dst):
+        # Скопировать готовый файл записи в dst; False - его нет
+        entry = self._entry(key)
+        if entry is None or not entry.path: return False
+        try:
+            shutil.copyfile(os.path.join(entry.path, f"out_{name}"), dst)
+        except OSError:
+            return False
+        return True
+
+    def add_output(self, key, name, src):
+        # Сохранить готовый файл (PNG, SVG, PDF) в запись результата
+        entry = self._entry(key)
+        if entry is None or not entry.path: return
+        tmp = os.path.join(entry.path, f".out_{name}.{uuid.uuid4().hex}")
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, os.path.join(entry.path, f"out_{name}"))
+            self.evict(keep=entry.path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def render(self, key, result, size):
+        # То же, что render_strings(result.sequence, result.nails, calc_size, size),
+        # но альфа-канал уровня берется из кэша или сохраняется в него
+        px = render_size(size)
+        entry = self._entry(key) if key is not None else None
+        alpha = None
+        if entry is not None:
+            with self._lock:
+                alpha = entry.alphas.get(px)
+        if alpha is None and entry is not None and entry.path:
+            try:
+                alpha = np.load(os.path.join(entry.path, f"alpha_{px}.npy"))
+            except (OSError, ValueError):
+                alpha = None
+        if alpha is None:
+            alpha = density_to_alpha(thread_density(result.sequence, result.nails,
+                                                    result.params.calc_size, px))
+            if entry is not None and entry.path:
+                try:
+                    self._add_array(entry.path, f"alpha_{px}", alpha)
+                    self.evict(keep=entry.path)
+                except OSError:
+                    pass
+        if entry is not None:
+            # Запись общая для потоков (сервер): альфа-каналы меняются только под замком
+            with self._lock:
+                added = entry.alphas.setdefault(px, alpha) is alpha
+            if added: self._remember(key, entry)
+        return strings_layer(alpha)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._links.clear()
+        super().clear()
+
+
+def _default_cache_dir():
+    path = os.environ.get("RINGSTRING_RESULT_CACHE")
+    if path is not None:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "ringstring", "results")
+
+
+result_cache = ResultCache(_default_cache_dir(),
+                           int(float(os.environ.get("RINGSTRING_RESULT_CACHE_MB", 1024)) * 1024**2))
+
+
+def configure_result_cache(path=None, max_mb=None):
+    # path="" выключает дисковый кэш (в памяти процесса результаты остаются)
+    if path is not None:
+        result_cache.path = path
+    if max_mb is not None:
+        result_cache.max_bytes = int(max_mb * 1024**2)
+    return result_cache
@@ -0,0 +1,504 @@
+"""Локальный HTTP-сервис очереди заданий: фото -> схема без интерфейса и без брокера.
+
+    POST   /jobs?lines=3000&nails=240...   тело - файл фото; 202 и {"id": ...}
+                                            503 + Retry-After, если очередь полна
+    GET    /jobs                            все задания
+    GET    /jobs/<id>                       состояние и число посчитанных линий
+    GET    /jobs/<id>/events                поток состояний (NDJSON) до завершения задания
+    GET    /jobs/<id>/<формат>              результат: txt, json, csv, rsq, svg, pdf, png
+    DELETE /jobs/<id>                       отмена (как кнопка "Стоп" в программе)
+    GET    /stats                           очередь, рабочие потоки, счетчики
+
+Параметры задания - поля SolverParams и brightness, contrast, formats, render, remove_bg,
+diameter_mm (SVG / PDF), compare_greedy; nails, lines и calc_size - в пределах PARAM_LIMITS (иначе 400).
+С одним рабочим (-j 1) задание считается в потоке сервиса. Решатель держит GIL, поэтому
+при -j N задания идут в N процессах, как в пакетном режиме: индексы хорд параметров по
+умолчанию - в общей памяти, ход расчета и флаг остановки - в общих массивах по слотам.
+Остановленное задание сохраняет посчитанные линии, как при остановке в программе.
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass, field, fields, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from PIL import Image
+
+from .background import rembg_available
+from .batch import JobOptions, JobResult, SharedChordIndex, attach_chord_index, process_photo
+from .engine import STRATEGIES, SolverParams, check_params, pyramid_levels
+from .geometry import get_chord_index
+from .jit import BACKENDS
+
+log = logging.getLogger("ringstring")
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+MEDIA_TYPES = {"txt": "text/plain; charset=utf-8", "json": "application/json", "csv": "text/csv",
+               "rsq": "application/octet-stream", "png": "image/png", "svg": "image/svg+xml",
+               "pdf": "application/pdf"}
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    path: str                # Загруженное фото (удаляется после расчета)
+    params: SolverParams
+    options: JobOptions
+    status: str = QUEUED
+    lines_done: int = 0
+    lines_total: int = 0
+    created: float = field(default_factory=time.time)
+    started: float = 0.0
+    finished: float = 0.0
+    error: str = ""
+    outputs: dict = field(default_factory=dict)  # формат -> путь
+    stop_flag: bool = False
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def state(self):
+        # Снимок для ответа и потока событий
+        end = self.finished or time.time()
+        return {"id": self.id, "status": self.status, "lines_done": self.lines_done,
+                "lines_total": self.lines_total or self.params.lines,
+                "elapsed": round(end - self.started, 3) if self.started else 0.0,
+                "error": self.error, "results": sorted(self.outputs)}
+
+
+# =================================================================================
+# ОЧЕРЕДЬ
+# =================================================================================
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_slots = None  # В рабочем процессе: (флаги остановки, посчитано линий) по слотам
+
+
+def _init_worker(specs, stop, done):
+    global _slots
+    _slots = (stop, done)
+    for spec in specs:
+        attach_chord_index(spec)
+
+
+def _run_in_process(slot, path, params, options):
+    stop, done = _slots
+
+    def progress(i, max_lines):
+        done[slot] = i
+    return process_photo(path, params, options, progress, lambda: bool(stop[slot]))
+
+
+class JobQueue:
+    # Ограниченная очередь; workers рабочих потоков ведут задания. При workers > 1
+    # каждый поток считает свое задание в пуле процессов (слот = номер потока).
+    def __init__(self, output_dir="ringstring_jobs", workers=1, max_queue=8, history=200):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.max_queue = max_queue
+        self.history = history          # Сколько завершенных заданий (и их файлов) хранить
+        self.jobs = OrderedDict()       # id -> Job, в порядке поступления
+        self.stats = {"submitted": 0, "rejected": 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closing = False
+        self._pool = None
+        self._shared = []
+        self._stop = self._done = None
+
+    def start(self, params=None):
+        # params - параметры по умолчанию: их индексы хорд делятся между процессами
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.workers > 1:
+            if params is not None:
+                self._shared = [SharedChordIndex(get_chord_index(params.nails, size))
+                                for size in pyramid_levels(params)]
+            ctx = mp.get_context()
+            self._stop = ctx.Array("b", self.workers, lock=False)
+            self._done = ctx.Array("i", self.workers, lock=False)
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=ctx, initializer=_init_worker,
+                                             initargs=([sh.spec for sh in self._shared], self._stop, self._done))
+        for n in range(self.workers):
+            t = threading.Thread(target=self._work, args=(n,), name=f"ringstring-worker-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def shutdown(self, cancel=True):
+        # cancel=True - остановить текущие расчеты, иначе дождаться их
+        with self._cond:
+            self._closing = True
+            for job in self._pending:
+                self._finish(job, CANCELLED)
+            self._pending.clear()
+            if cancel:
+                for job in self.jobs.values():
+                    job.stop_flag = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for sh in self._shared:
+            sh.close()
+        self._shared = []
+
+    def submit(self, data, params, options):
+        # data - байты фото. QueueFull - ожидающих заданий уже max_queue.
+        with self._cond:
+            if self._closing or len(self._pending) >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise QueueFull()
+            job_id = uuid.uuid4().hex[:12]
+            path = os.path.join(self.output_dir, f"{job_id}.upload")
+            with open(path, "wb") as f:
+                f.write(data)
+            job = Job(job_id, path, params, replace(options, output_dir=self.output_dir))
+            self.jobs[job_id] = job
+            self._pending.append(job)
+            self.stats["submitted"] += 1
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self.jobs.get(job_id)
+
+    def states(self):
+        with self._cond:
+            return [job.state() for job in self.jobs.values()]
+
+    def position(self, job):
+        # Место в очереди (0 - следующее), None - уже не в очереди
+        with self._cond:
+            for n, j in enumerate(self._pending):
+                if j is job: return n
+        return None
+
+    def cancel(self, job_id):
+        # Ожидающее задание снимается сразу; идущее останавливается после текущей пачки линий
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED: return job
+            job.stop_flag = True
+            if job.status == QUEUED:
+                self._pending.remove(job)
+                self._finish(job, CANCELLED)
+        return job
+
+    def snapshot(self):
+        with self._cond:
+            running = sum(job.status == RUNNING for job in self.jobs.values())
+            return {"queued": len(self._pending), "max_queue": self.max_queue, "running": running,
+                    "workers": self.workers, **self.stats}
+
+    def _finish(self, job, status):
+        # Вызывается под self._cond
+        job.status = status
+        job.finished = time.time()
+        self.stats[status] += 1
+        job.done.set()
+        _remove(job.path)
+        finished = [j for j in self.jobs.values() if j.status in FINISHED]
+        for old in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[old.id]
+            for path in old.outputs.values():
+                _remove(path)
+
+    def _work(self, slot):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending: return
+                job = self._pending.popleft()
+                job.status = RUNNING
+                job.started = time.time()
+            self._run(job, slot)
+
+    def _run(self, job, slot):
+        def progress(i, max_lines):
+            job.lines_done, job.lines_total = i, max_lines
+
+        if self._pool is None:
+            res = process_photo(job.path, job.params, job.options, progress, lambda: job.stop_flag)
+        else:
+            res = self._run_in_pool(job, slot)
+        with self._cond:
+            job.outputs = {os.path.splitext(p)[1][1:]: p for p in res.outputs}
+            if not res.ok:
+                job.error = res.error
+                self._finish(job, FAILED)
+                return
+            job.lines_done = res.lines
+            self._finish(job, CANCELLED if res.stopped else DONE)
+
+    def _run_in_pool(self, job, slot):
+        # Поток ждет процесс, переносит ход расчета в задание и флаг остановки - в процесс
+        self._stop[slot] = 0
+        self._done[slot] = 0
+        fut = self._pool.submit(_run_in_process, slot, job.path, job.params, job.options)
+        while not wait([fut], timeout=0.1).done:
+            job.lines_done = self._done[slot]
+            if job.stop_flag: self._stop[slot] = 1
+        try:
+            return fut.result()
+        except Exception as e:
+            # Упал сам рабочий процесс
+            return JobResult(job.path, False, error=f"{type(e).__name__}: {e}")
+
+
+# =================================================================================
+# ПАРАМЕТРЫ ЗАДАНИЯ
+# =================================================================================
+_PARAM_FIELDS = {f.name: type(f.default) for f in fields(SolverParams)}
+_OPTION_FIELDS = {"brightness": float, "contrast": float, "render": bool, "remove_bg": bool,
+                  "bg_max_side": int, "diameter_mm": float, "compare_greedy": bool}
+
+
+def _value(kind, text):
+    if kind is bool:
+        if text.lower() in ("1", "true", "yes", "on"): return True
+        if text.lower() in ("0", "false", "no", "off"): return False
+        raise ValueError(text)
+    return kind(text)
+
+
+def job_settings(query, base_params, base_options):
+    # Строка запроса -> (SolverParams, JobOptions); ValueError - понятное сообщение клиенту
+    params, options = {}, {}
+    for key, text in parse_qsl(query):
+        if key in _PARAM_FIELDS:
+            target, kind = params, _PARAM_FIELDS[key]
+        elif key in _OPTION_FIELDS:
+            target, kind = options, _OPTION_FIELDS[key]
+        elif key == "formats":
+            options["formats"] = tuple(f.strip().lower() for f in text.split(",") if f.strip())
+            continue
+        else:
+            raise ValueError(f"Неизвестный параметр: {key}")
+        try:
+            target[key] = _value(kind, text)
+        except ValueError:
+            raise ValueError(f"Неверное значение {key}: {text}")
+    params = replace(base_params, **params)
+    options = replace(base_options, **options)
+    check_params(params)
+    if params.strategy not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия: {params.strategy}")
+    if params.backend not in BACKENDS:
+        raise ValueError(f"Неизвестный backend: {params.backend}")
+    for f in options.formats:
+        if f not in MEDIA_TYPES or f == "png":
+            raise ValueError(f"Неизвестный формат: {f}")
+    if options.remove_bg and not rembg_available():
+        raise ValueError("rembg недоступен")
+    return params, options
+
+
+# =================================================================================
+# HTTP
+# =================================================================================
+class JobHandler(BaseHTTPRequestHandler):
+    server_version = "RingString"
+
+    @property
+    def jobs(self):
+        return self.server.jobs
+
+    def log_message(self, fmt, *args):
+        log.debug("%s %s", self.address_string(), fmt % args)
+
+    def _send_json(self, code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, message, headers=None):
+        self._send_json(code, {"error": message}, headers)
+
+    def _route(self):
+        # (id задания, остаток пути) для /jobs/<id>[/...]
+        parts = [p for p in urlsplit(self.path).path.split("/") if p]
+        if len(parts) < 2 or parts[0] != "jobs": return None, None
+        return parts[1], "/".join(parts[2:])
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._error(404, "Нет такого адреса")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length <= 0 or length > self.server.max_upload:
+            self.close_connection = True  # Тело не читаем - соединение дальше не годится
+            if length < 0:
+                return self._error(400, "Неверный Content-Length")
+            if not length:
+                return self._error(400, "Пустое тело: нужен файл фото")
+            return self._error(413, "Фото слишком большое")
+        data = self.rfile.read(length)
+        try:
+            params, options = job_settings(url.query, self.server.params, self.server.options)
+            Image.open(io.BytesIO(data))  # Только заголовок - не фото отклоняем сразу
+        except ValueError as e:
+            return self._error(400, str(e))
+        except OSError:
+            return self._error(400, "Не удалось прочитать фото")
+        try:
+            job = self.jobs.submit(data, params, options)
+        except QueueFull:
+            return self._error(503, "Очередь заполнена", {"Retry-After": str(self.server.retry_after)})
+        self._send_json(202, {**job.state(), "position": self.jobs.position(job)},
+                        {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/stats":
+            return self._send_json(200, self.jobs.snapshot())
+        if path == "/jobs":
+            return self._send_json(200, self.jobs.states())
+        job_id, rest = self._route()
+        job = self.jobs.get(job_id) if job_id else None
+        if job is None:
+            return self._error(404, "Задание не найдено")
+        if not rest:
+            return self._send_json(200, {**job.state(), "position": self.jobs.position(job)})
+        if rest == "events":
+            return self._stream(job)
+        if rest not in MEDIA_TYPES:
+            return self._error(404, "Нет такого адреса")
+        if job.status not in FINISHED:
+            return self._error(409, "Задание еще не завершено")
+        path = job.outputs.get(rest)
+        if path is None:
+            return self._error(404, f"Результата {rest} нет")
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except OSError:
+            return self._error(410, "Результат удален")
+        self.send_response(200)
+        self.send_header("Content-Type", MEDIA_TYPES[rest])
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, job):
+        # Строка JSON при каждом изменении состояния; соединение закрывается после завершения
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        last = None
+        try:
+            while True:
+                finished = job.done.wait(self.server.stream_interval)
+                state = job.state()
+                key = (state["status"], state["lines_done"])
+                if key != last:
+                    last = key
+                    self.wfile.write(json.dumps(state, ensure_ascii=False).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+                if finished: return
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Клиент отключился - задание продолжает считаться
+
+    def do_DELETE(self):
+        job_id, rest = self._route()
+        if not job_id or rest:
+            return self._error(404, "Нет такого адреса")
+        job = self.jobs.cancel(job_id)
+        if job is None:
+            return self._error(404, "Задание не найдено")
+        self._send_json(200, job.state())
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, jobs, params=None, options=None, max_upload_mb=20,
+                 stream_interval=0.25, retry_after=5):
+        super().__init__(address, JobHandler)
+        self.jobs = jobs
+        self.params = params or SolverParams()
+        self.options = options or JobOptions(formats=("txt", "json"))
+        self.max_upload = int(max_upload_mb * 1024**2)
+        self.stream_interval = stream_interval
+        self.retry_after = retry_after
+
+
+def serve(host="127.0.0.1", port=8765, output_dir="ringstring_jobs", workers=1, max_queue=8,
+          params=None, options=None):
+    # Блокирует до Ctrl+C; текущие расчеты при выходе останавливаются
+    params = params or SolverParams()
+    for size in pyramid_levels(params):
+        get_chord_index(params.nails, size)  # Индекс по умолчанию - до первого задания
+    jobs = JobQueue(output_dir, workers, max_queue).start(params)
+    server = JobServer((host, port), jobs, params, options)
+    log.info("ringstring: http://%s:%d, рабочих: %d (%s), очередь: %d", host, server.server_port, workers,
+             "процессы" if workers > 1 else "поток", max_queue)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        jobs.shutdown()
+
+
+# =================================================================================
+# КОМАНДНАЯ СТРОКА
+# =================================================================================
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m ringstring.server",
+                                description="Локальный HTTP-сервис очереди заданий стринг-арта.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("-o", "--output", default="ringstring_jobs", help="папка для фото и результатов")
+    p.add_argument("-j", "--workers", type=int, default=1,
+                   help="одновременно считаемых заданий (больше 1 - в отдельных процессах)")
+    p.add_argument("--queue", type=int, default=8, help="сколько заданий может ждать (дальше - 503)")
+    p.add_argument("--nails", type=int, default=240, help="кол-во гвоздей по умолчанию")
+    p.add_argument("--lines", type=int, default=3000, help="кол-во линий по умолчанию")
+    p.add_argument("--backend", default="auto", choices=BACKENDS)
+    p.add_argument("-v", "--verbose", action="store_true", help="журнал запросов")
+    args = p.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(message)s")
+    serve(args.host, args.port, args.output, args.workers, args.queue,
+          SolverParams(nails=args.nails, lines=args.lines, backend=args.backend))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
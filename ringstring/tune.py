@@ -0,0 +1,249 @@
+"""Автоподбор параметров: короткие расчеты на малом разрешении вместо таблицы порогов.
+
+Кандидат - сочетание гвоздей, веса нити и пропуска соседей. Жадный расчет на N
+линий содержит в себе все расчеты на меньшее число линий, поэтому один прогон
+кандидата дает всю кривую "линии -> ошибка". Кандидаты считаются параллельно
+ступенями (successive halving): после каждой ступени худшие отсекаются, а
+лучшие продолжают со своего чекпоинта. Весь подбор укладывается в бюджет времени.
+
+Ошибка - насколько рендер нитей (по закону пропускания, как в render_strings)
+отличается от фото по темноте после сглаживания, как видит глаз издалека.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, field
+
+import numpy as np
+from PIL import Image
+
+from .engine import (
+    CALC_SIZE, SolverParams, adjust_photo, fit_to_hoop, solve, scale_weight, thread_density, density_to_alpha,
+)
+from .geometry import get_chord_index
+
+TUNE_SIZE = 250  # Разрешение пробных расчетов
+BLUR = 5         # Сглаживание при сравнении: блоки BLUR x BLUR пикселей
+DEFAULT_SPACE = {
+    "nails": (180, 240, 300),
+    "line_weight": (20, 30, 45),   # Вес нити для расчета на calc_size
+    "skip_nails": (10, 15, 25),
+    "lines": (1000, 6000, 500),    # От, до, шаг кривой
+}
+FIRST_RUNG = 1 / 4  # Первая ступень - доля верхней границы числа линий
+MIN_KEEP = 3        # Сколько кандидатов продолжают после каждой ступени, как минимум
+
+
+@dataclass
+class TunePoint:
+    nails: int
+    line_weight: int
+    skip_nails: int
+    lines: int
+    error: float
+
+
+@dataclass
+class TuneResult:
+    best: SolverParams
+    curve: list                # Все измеренные точки TunePoint
+    evaluated: int = 0         # Кандидатов запущено
+    pruned: int = 0            # Отсечено на промежуточных ступенях
+    elapsed: float = 0.0
+    budget_hit: bool = False   # Подбор остановлен по бюджету времени
+    candidates: list = field(default_factory=list)
+
+    def best_curve(self):
+        # Кривая "линии -> ошибка" для гвоздей, веса и пропуска лучшего набора
+        b = self.best
+        pts = [p for p in self.curve
+               if (p.nails, p.line_weight, p.skip_nails) == (b.nails, b.line_weight, b.skip_nails)]
+        return sorted(pts, key=lambda p: p.lines)
+
+    def to_dict(self):
+        return {"best": self.best.to_dict(), "evaluated": self.evaluated, "pruned": self.pruned,
+                "elapsed": self.elapsed, "budget_hit": self.budget_hit,
+                "curve": [asdict(p) for p in self.curve]}
+
+
+# =================================================================================
+# ОЦЕНКА
+# =================================================================================
+def target_darkness(calc_img):
+    # 0 - белый, 1 - черный
+    return 1.0 - np.asarray(calc_img.convert("L"), dtype=np.float32) / 255.0
+
+
+def _pool(arr, k):
+    n = arr.shape[0] // k * k
+    return arr[:n, :n].reshape(n // k, k, n // k, k).mean(axis=(1, 3))
+
+
+def _inside(size):
+    # Блоки сглаживания, центр которых внутри круга
+    c = (np.arange(size // BLUR) + 0.5) * BLUR - size / 2
+    return np.hypot(c[:, None], c[None, :]) < size / 2
+
+
+def visual_error(target, sequence, nails, size):
+    # RMSE темноты рендера и фото внутри круга после сглаживания блоками BLUR x BLUR
+    alpha = density_to_alpha(thread_density(sequence, nails, size, size)).astype(np.float32) / 255.0
+    diff = _pool(alpha, BLUR) - _pool(target, BLUR)
+    return float(np.sqrt(np.mean(diff[_inside(size)] ** 2)))
+
+
+def _run_candidate(config, tune_img, checkpoint, lines, step, deadline, calc_size):
+    # Один кандидат до lines линий (с чекпоинта, если есть): (config, чекпоинт, точки, остановлен)
+    nails, weight, skip = config
+    size = tune_img.width
+    # Вес пересчитывается под разрешение так же, как на уровнях пирамиды
+    params = SolverParams(nails=nails, lines=lines, line_weight=scale_weight(weight, size, calc_size),
+                          skip_nails=skip, calc_size=size, incremental=True)
+    target = target_darkness(tune_img)
+    node_xy = get_chord_index(nails, size).nails
+    points = []
+
+    def on_checkpoint(ckpt):
+        points.append((ckpt.lines_done, visual_error(target, ckpt.sequence, node_xy, size)))
+
+    result = solve(tune_img, params, should_stop=lambda: time.time() > deadline,
+                   checkpoint=checkpoint, checkpoint_every=step, on_checkpoint=on_checkpoint)
+    done = result.checkpoint.lines_done
+    if done and (not points or points[-1][0] != done):
+        points.append((done, visual_error(target, result.sequence, node_xy, size)))
+    return config, result.checkpoint, points, result.stopped
+
+
+def _rungs(lo, hi, step):
+    # Ступени successive halving: первая - не короче FIRST_RUNG диапазона (на коротких
+    # расчетах кандидаты еще не различаются), дальше x2 до hi
+    first = max(lo, math.ceil(hi * FIRST_RUNG / step) * step)
+    rungs = [min(first, hi)]
+    while rungs[-1] * 2 < hi:
+        rungs.append(rungs[-1] * 2)
+    if rungs[-1] != hi: rungs.append(hi)
+    return rungs
+
+
+# =================================================================================
+# ПОДБОР
+# =================================================================================
+def tune(calc_img, space=None, budget=30.0, workers=None, keep=1 / 3, tolerance=0.01, on_progress=None):
+    # calc_img - подготовленное изображение ("L", в круге, размер calc_size).
+    # tolerance - из наборов с ошибкой не хуже лучшей на эту долю берется самый короткий по линиям.
+    # on_progress(готово, всего) - кандидат досчитал ступень.
+    t0 = time.perf_counter()
+    space = {**DEFAULT_SPACE, **(space or {})}
+    calc_size = calc_img.width
+    tune_img = calc_img
+    if calc_size > TUNE_SIZE:
+        tune_img = calc_img.resize((TUNE_SIZE, TUNE_SIZE), Image.Resampling.LANCZOS)
+    lo, hi, step = space["lines"]
+    configs = list(itertools.product(space["nails"], space["line_weight"], space["skip_nails"]))
+    deadline = time.time() + budget
+
+    # Индексы хорд (с таблицей для инкрементального режима) - до запуска процессов
+    for n in space["nails"]:
+        get_chord_index(n, tune_img.width).inverted()
+
+    workers = min(workers or os.cpu_count() or 1, len(configs))
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    alive = {cfg: None for cfg in configs}
+    curves = {cfg: [] for cfg in configs}
+    pruned, budget_hit, done_jobs = 0, False, 0
+    rungs = _rungs(lo, hi, step)
+    total_jobs = len(configs) * len(rungs)
+    try:
+        for r, lines in enumerate(rungs):
+            if time.time() >= deadline:
+                budget_hit = True
+                break
+            args = [(cfg, tune_img, alive[cfg], lines, step, deadline, calc_size) for cfg in alive]
+            if pool is None:
+                results = (_run_candidate(*a) for a in args)
+            else:
+                results = (f.result() for f in as_completed([pool.submit(_run_candidate, *a) for a in args]))
+            for cfg, ckpt, points, stopped in results:
+                alive[cfg] = ckpt
+                curves[cfg] += points
+                budget_hit |= stopped
+                done_jobs += 1
+                if on_progress: on_progress(done_jobs, total_jobs)
+            if budget_hit or r == len(rungs) - 1: break
+            n_alive = len(alive)
+            # Ошибка уже растет: минимум кривой пройден, новые линии только перечерняют -
+            # кандидат закончен (не отсечен) и места среди продолжающих не занимает
+            improving = [c for c in alive
+                         if curves[c] and curves[c][-1][1] <= min(e for _, e in curves[c]) * (1 + tolerance)]
+            # Дальше идут лучшие по ошибке на этой ступени, но не меньше MIN_KEEP
+            ranked = sorted(improving, key=lambda c: curves[c][-1][1])
+            n_keep = min(len(ranked), max(MIN_KEEP, math.ceil(n_alive * keep)))
+            pruned += len(ranked) - n_keep
+            total_jobs -= (n_alive - n_keep) * (len(rungs) - r - 1)
+            alive = {cfg: alive[cfg] for cfg in ranked[:n_keep]}
+            if not alive: break
+    finally:
+        if pool is not None: pool.shutdown()
+
+    curve = [TunePoint(n, w, s, lines, err) for (n, w, s), pts in curves.items() for lines, err in pts]
+    if not curve:
+        raise RuntimeError("Бюджет времени слишком мал: ни один кандидат не успел посчитаться")
+    in_range = [p for p in curve if lo <= p.lines <= hi] or curve
+    best_err = min(p.error for p in in_range)
+    best = min((p for p in in_range if p.error <= best_err * (1 + tolerance)), key=lambda p: (p.lines, p.error))
+    params = SolverParams(nails=best.nails, lines=best.lines, line_weight=best.line_weight,
+                          skip_nails=best.skip_nails, calc_size=calc_size)
+    return TuneResult(params, sorted(curve, key=lambda p: (p.nails, p.line_weight, p.skip_nails, p.lines)),
+                      len(configs), pruned, time.perf_counter() - t0, budget_hit, configs)
+
+
+# =================================================================================
+# КОМАНДНАЯ СТРОКА
+# =================================================================================
+def _int_list(text):
+    return tuple(int(x) for x in text.split(",") if x.strip())
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m ringstring.tune",
+                                description="Автоподбор параметров схемы для фото.")
+    p.add_argument("input", help="фото")
+    p.add_argument("-o", "--output", help="сохранить кривую и лучший набор в JSON")
+    p.add_argument("--budget", type=float, default=30.0, help="бюджет времени, с")
+    p.add_argument("-j", "--workers", type=int, default=0, help="кол-во процессов (0 - все ядра)")
+    p.add_argument("--nails", type=_int_list, help="варианты через запятую")
+    p.add_argument("--weights", type=_int_list, help="варианты через запятую")
+    p.add_argument("--skips", type=_int_list, help="варианты через запятую")
+    p.add_argument("--lines", type=_int_list, help="от,до,шаг")
+    p.add_argument("--brightness", type=float, default=1.0)
+    p.add_argument("--contrast", type=float, default=1.0)
+    p.add_argument("--calc-size", type=int, default=CALC_SIZE)
+    args = p.parse_args(argv)
+
+    space = {}
+    if args.nails: space["nails"] = args.nails
+    if args.weights: space["line_weight"] = args.weights
+    if args.skips: space["skip_nails"] = args.skips
+    if args.lines: space["lines"] = args.lines
+    calc_img = fit_to_hoop(adjust_photo(Image.open(args.input), args.brightness, args.contrast), args.calc_size)
+    res = tune(calc_img, space, args.budget, args.workers or None)
+
+    b = res.best
+    print(f"Кандидатов: {res.evaluated}, отсечено: {res.pruned}, {res.elapsed:.1f} с"
+          + (" (бюджет исчерпан)" if res.budget_hit else ""))
+    print(f"Лучшее: гвоздей {b.nails}, линий {b.lines}, плотность {b.line_weight}, пропуск {b.skip_nails}")
+    for pt in res.best_curve():
+        print(f"  {pt.lines:5d} линий: ошибка {pt.error:.4f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(res.to_dict(), f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
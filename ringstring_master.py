@@ -1,27 +1,41 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk, ImageOps, ImageDraw, ImageEnhance
-import numpy as np
+from tkinter import filedialog, messagebox, simpledialog, ttk
+from PIL import Image, ImageTk, ImageDraw
 import threading
 import math
-import json
-import re
-import csv
 import time
+from collections import deque
+from dataclasses import replace
+
+from ringstring.background import get_remover, rembg_available, rembg_error
+from ringstring.engine import (
+    CALC_SIZE, STRATEGIES, SolverParams, crop_to_hoop, compare_with_greedy, format_strategy_report,
+    solve, resume, flatten_on_white,
+)
+from ringstring.export import DIAMETER_MM, write_png_tiled
+from ringstring.formats import write_instructions, read_instructions
+from ringstring.geometry import calculate_nails
+from ringstring.instrument import Instrumentation, Profiler, phase
+from ringstring.jit import BACKENDS, NUMBA_AVAILABLE
+from ringstring.keyframes import KeyframeCache
+from ringstring.preview import PhotoPreview, StringsOverlay
+from ringstring.results import result_cache
+from ringstring.tune import tune
+
+TUNE_BUDGET = 20  # Секунд на автоподбор параметров
+PREVIEW_DELAY_MS = 30  # События слайдеров за это время сливаются в одну перерисовку
 
 # =================================================================================
 # БЛОК ИМПОРТА REMBG (БЕЗОПАСНЫЙ РЕЖИМ)
-# Мы оборачиваем импорт в try-except. Если библиотека сломана или не установлена,
-# программа просто отключит функцию удаления фона, но продолжит работать.
+# Если библиотека сломана или не установлена, программа просто отключит функцию
+# удаления фона, но продолжит работать. Модель загружается при первом удалении фона
+# и переиспользуется; маски кэшируются по содержимому фото (ringstring.background).
 # =================================================================================
-REMBG_AVAILABLE = False
-try:
-    from rembg import remove as remove_bg
-    REMBG_AVAILABLE = True
+REMBG_AVAILABLE = rembg_available()
+if REMBG_AVAILABLE:
     print("[INFO] Библиотека rembg найдена. Удаление фона доступно.")
-except Exception as e:
-    print(f"[INFO] rembg недоступен ({e}). Программа запущена в базовом режиме.")
-    REMBG_AVAILABLE = False
+else:
+    print(f"[INFO] rembg недоступен ({rembg_error()}). Программа запущена в базовом режиме.")
 
 # =================================================================================
 # UI: СКРОЛЛ-ПАНЕЛЬ
@@ -87,8 +101,14 @@ class InstructionPlayer(tk.Toplevel):
         self.canvas.pack(expand=True, pady=10)
         
         self.nails_coords = self._calculate_nails(self.canvas_size, self.nails_count)
+        self._reset_frames()
         self.update_view(0)
 
+    def _reset_frames(self):
+        # Кадры плеера: ключевые растры + дорисовка от ближайшего
+        points = [self.nails_coords[idx] if idx < len(self.nails_coords) else None for idx in self.sequence]
+        self.frames = KeyframeCache(points, self.canvas_size)
+
     def _calculate_nails(self, size, count):
         cx, cy = size / 2, size / 2
         radius = size / 2 - 20
@@ -106,16 +126,13 @@ class InstructionPlayer(tk.Toplevel):
         self.update_view(step)
 
     def update_view(self, step):
-        img = Image.new("RGB", (self.canvas_size, self.canvas_size), "white")
-        draw = ImageDraw.Draw(img, "RGBA")
+        # Кадр из кэша (прозрачный черный, наложение); красную линию рисуем на копии
+        img = self.frames.frame(step).copy()
         if step > 1:
-            current_seq = self.sequence[:step]
-            line_points = [self.nails_coords[idx] for idx in current_seq if idx < len(self.nails_coords)]
-            # Рисуем прозрачным черным (наложение)
-            draw.line(line_points, fill=(0, 0, 0, 30), width=1)
+            line_points = self.frames.last_line(step)
             # Последняя линия красная
             if len(line_points) >= 2:
-                draw.line([line_points[-2], line_points[-1]], fill="red", width=2)
+                ImageDraw.Draw(img, "RGBA").line(line_points, fill="red", width=2)
 
         self.tk_img = ImageTk.PhotoImage(img)
         self.canvas.delete("all")
@@ -145,37 +162,15 @@ class InstructionPlayer(tk.Toplevel):
         self.is_playing = False
 
     def load_external_file(self):
-        path = filedialog.askopenfilename(filetypes=[("Files", "*.txt;*.json;*.csv")])
+        path = filedialog.askopenfilename(filetypes=[("Files", "*.txt;*.json;*.csv;*.rsq")])
         if not path: return
-        seq, nails = [], 240
         try:
-            if path.endswith(".json"):
-                with open(path, "r") as f:
-                    data = json.load(f)
-                    nails = data.get("nails_count", 240)
-                    seq = data.get("sequence", [])
-            elif path.endswith(".csv"):
-                with open(path, "r") as f:
-                    reader = csv.reader(f)
-                    rows = list(reader)
-                    flat = []
-                    for row in rows:
-                        for c in row:
-                            if c.isdigit(): flat.append(int(c))
-                    seq = flat
-            else: # TXT
-                with open(path, "r", encoding='utf-8') as f:
-                    c = f.read()
-                    m = re.search(r"Гвозди:\s*(\d+)", c)
-                    if m: nails = int(m.group(1))
-                    seq = [int(s) for s in re.findall(r'\b\d+\b', c)]
-                    if seq and seq[0] == nails: seq.pop(0)
-            
-            if not seq: raise ValueError("Данные не найдены")
+            nails, seq = read_instructions(path)
             self.pause_animation()
             self.nails_count = nails
             self.sequence = seq
             self.nails_coords = self._calculate_nails(self.canvas_size, self.nails_count)
+            self._reset_frames()
             self.slider.config(to=len(seq))
             self.slider_var.set(0)
             self.update_view(0)
@@ -183,6 +178,61 @@ class InstructionPlayer(tk.Toplevel):
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+# =================================================================================
+# UI: ЖИВОЙ ПРЕДПРОСМОТР РАСЧЕТА
+# Поток расчета только складывает номера гвоздей в очередь. Таймер Tk с
+# фиксированной частотой кадров дорисовывает накопленные линии в растр и
+# обновляет одну картинку на холсте: промежуточные кадры пропускаются сами,
+# если интерфейс не успевает.
+# =================================================================================
+class LivePreview:
+    def __init__(self, canvas, fps=20, tag="string_art"):
+        self.canvas = canvas
+        self.fps = fps
+        self.tag = tag
+        self.running = False
+        self._pending = deque()
+        self._job = None  # Запланированный _tick (id от canvas.after)
+
+    def start(self, nails, start_nail, origin, size, scale):
+        # nails - координаты в пикселях расчета, scale - пикселей холста на пиксель расчета,
+        # origin и size - угол и размер растра на холсте.
+        # Предыдущий запуск останавливается: его _tick и гвозди в очереди не доживают до нового.
+        self.stop()
+        self.origin = origin
+        self.points = [(x * scale, y * scale) for x, y in nails]
+        self.raster = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        self.draw = ImageDraw.Draw(self.raster)
+        self.last = start_nail
+        self.running = True
+        self.canvas.delete(self.tag)
+        self.tk_img = None
+        self._tick()
+
+    def push(self, nail):
+        # Вызывается из потока расчета: только добавление в очередь
+        self._pending.append(nail)
+
+    def _tick(self):
+        self._job = None
+        if not self.running: return
+        n = len(self._pending)
+        if n:
+            nails = [self.last] + [self._pending.popleft() for _ in range(n)]
+            self.draw.line([self.points[i] for i in nails], fill="black", width=1)
+            self.last = nails[-1]
+            self.tk_img = ImageTk.PhotoImage(self.raster)
+            self.canvas.delete(self.tag)
+            self.canvas.create_image(*self.origin, image=self.tk_img, anchor="nw", tags=self.tag)
+        self._job = self.canvas.after(int(1000 / self.fps), self._tick)
+
+    def stop(self):
+        self.running = False
+        self._pending.clear()
+        if self._job is not None:
+            self.canvas.after_cancel(self._job)
+            self._job = None
+
 # =================================================================================
 # ГЛАВНЫЙ КЛАСС ПРИЛОЖЕНИЯ
 # =================================================================================
@@ -194,8 +244,15 @@ class RingStringApp:
 
         # --- Данные ---
         self.original_image = None
-        self.processed_image = None
+        self.photo = PhotoPreview() # Серый оригинал и кэш слоев превью
         self.final_strings_pil = None
+        self.strings = StringsOverlay() # Слой нитей под размер обруча
+        self._preview_job = None
+        self._bg_layer = None
+        self._strings_layer = None
+        self._hoop_r = None
+        self.removing_bg = False
+        self.strategy_report = None
         
         # --- Настройки Фото ---
         self.brightness_var = tk.DoubleVar(value=1.0)
@@ -211,6 +268,15 @@ class RingStringApp:
         self.nails_count_var = tk.IntVar(value=240)
         self.lines_count_var = tk.IntVar(value=3000)
         self.calc_opacity_var = tk.IntVar(value=30) # "Вес" одной нити
+        self.skip_nails_var = tk.IntVar(value=15) # Пропуск соседних гвоздей
+        self.incremental_var = tk.BooleanVar(value=False) # Таблица сумм всех хорд
+        self.calc_size_var = tk.IntVar(value=CALC_SIZE) # Разрешение расчета
+        self.pyramid_var = tk.BooleanVar(value=False) # Черновик на 250px + уточнение
+        self.strategy_var = tk.StringVar(value="greedy") # Выбор линии (STRATEGIES)
+        self.time_budget_var = tk.IntVar(value=60) # Секунд на просмотр вперед (beam)
+        self.backend_var = tk.StringVar(value="auto") # Жадный цикл: numpy / numba (JIT)
+        self.compare_greedy_var = tk.BooleanVar(value=False) # Не жадная стратегия: сравнить с жадным
+        self.preview_fps_var = tk.IntVar(value=20) # Кадров/с анимации расчета
         
         # --- Холст ---
         self.canvas_size = 750
@@ -223,6 +289,8 @@ class RingStringApp:
         self.is_generating = False
         self.stop_flag = False
         self.sequence = []
+        self.solver_params = None
+        self.checkpoint = None # Состояние решателя для продолжения / добавления линий
 
         self._init_ui()
         self.reset_canvas_position()
@@ -282,6 +350,27 @@ class RingStringApp:
         
         tk.Label(content, text="Плотность нити (при расчете):", bg="#f5f5f5").pack(anchor="w", padx=10)
         tk.Scale(content, from_=10, to=150, orient=tk.HORIZONTAL, variable=self.calc_opacity_var).pack(fill=tk.X, padx=10)
+        tk.Label(content, text="Пропуск соседних гвоздей:", bg="#f5f5f5").pack(anchor="w", padx=10)
+        tk.Scale(content, from_=1, to=60, orient=tk.HORIZONTAL, variable=self.skip_nails_var).pack(fill=tk.X, padx=10)
+        tk.Checkbutton(content, text="Инкрементальный расчет (сам включается от 2000 линий)", variable=self.incremental_var, bg="#f5f5f5", anchor="w").pack(fill=tk.X, padx=10)
+
+        f_calc = tk.Frame(content, bg="#f5f5f5")
+        f_calc.pack(fill=tk.X, padx=10, pady=(5,0))
+        tk.Label(f_calc, text="Разрешение расчета (px):", bg="#f5f5f5").pack(side=tk.LEFT)
+        tk.OptionMenu(f_calc, self.calc_size_var, 250, 500, 1000, 2000).pack(side=tk.RIGHT)
+        tk.Checkbutton(content, text="Пирамида: черновик 250px + уточнение", variable=self.pyramid_var, bg="#f5f5f5", anchor="w").pack(fill=tk.X, padx=10)
+        f_strat = tk.Frame(content, bg="#f5f5f5")
+        f_strat.pack(fill=tk.X, padx=10, pady=(5,0))
+        tk.Label(f_strat, text="Алгоритм:", bg="#f5f5f5").pack(side=tk.LEFT)
+        tk.OptionMenu(f_strat, self.strategy_var, *STRATEGIES).pack(side=tk.LEFT)
+        tk.Entry(f_strat, textvariable=self.time_budget_var, width=5).pack(side=tk.RIGHT)
+        tk.Label(f_strat, text="бюджет beam, с:", bg="#f5f5f5").pack(side=tk.RIGHT)
+        tk.Checkbutton(content, text="Сравнить с жадным (второй расчет)", variable=self.compare_greedy_var, bg="#f5f5f5", anchor="w").pack(fill=tk.X, padx=10)
+        f_backend = tk.Frame(content, bg="#f5f5f5")
+        f_backend.pack(fill=tk.X, padx=10, pady=(5,0))
+        jit_note = "" if NUMBA_AVAILABLE else " (numba не установлена)"
+        tk.Label(f_backend, text="Ускорение" + jit_note + ":", bg="#f5f5f5").pack(side=tk.LEFT)
+        tk.OptionMenu(f_backend, self.backend_var, *BACKENDS).pack(side=tk.RIGHT)
 
         # 4. Генерация
         self._add_header(content, "4. Генерация")
@@ -289,8 +378,13 @@ class RingStringApp:
         f_gen.pack(fill=tk.X, padx=10)
         tk.Button(f_gen, text="🚀 Быстро", command=lambda: self.start_generation(animate=False), bg="#b3e5fc", width=15).pack(side=tk.LEFT, padx=2)
         tk.Button(f_gen, text="🎬 Анимация", command=lambda: self.start_generation(animate=True), bg="#e1bee7", width=15).pack(side=tk.RIGHT, padx=2)
+        f_fps = tk.Frame(content, bg="#f5f5f5")
+        f_fps.pack(fill=tk.X, padx=10, pady=(5,0))
+        tk.Label(f_fps, text="Анимация (кадров/с):", bg="#f5f5f5").pack(side=tk.LEFT)
+        tk.OptionMenu(f_fps, self.preview_fps_var, 5, 10, 20, 30).pack(side=tk.RIGHT)
         
         tk.Button(content, text="⛔ СТОП", command=self.stop_generation, bg="#ffccbc").pack(fill=tk.X, padx=10, pady=5)
+        tk.Button(content, text="⏯ Продолжить / добавить линии", command=lambda: self.start_generation(animate=False, extend=True), bg="#c8e6c9").pack(fill=tk.X, padx=10, pady=2)
         tk.Button(content, text="🗑 Очистить нити", command=self.clear_strings_only, bg="#eee", fg="red").pack(fill=tk.X, padx=10, pady=2)
         
         tk.Label(content, text="Прогресс:", bg="#f5f5f5").pack(padx=10, pady=(5,0), anchor="w")
@@ -328,6 +422,7 @@ class RingStringApp:
         right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         self.canvas = tk.Canvas(right_panel, width=self.canvas_size, height=self.canvas_size, bg="white", highlightthickness=0)
         self.canvas.pack(expand=True)
+        self.preview = LivePreview(self.canvas)
         
         self.canvas.bind("<ButtonPress-1>", self.on_drag_start)
         self.canvas.bind("<B1-Motion>", self.on_drag_motion)
@@ -353,6 +448,7 @@ class RingStringApp:
         cx, cy = self.canvas_size // 2, self.canvas_size // 2
         r = self.hoop_radius_var.get()
         w = self.canvas_size
+        self._hoop_r = r
         
         self.canvas.delete("hoop_mask")
         self.canvas.delete("hoop_ring")
@@ -376,9 +472,11 @@ class RingStringApp:
         self.stop_flag = True
         self.is_generating = False
         self.original_image = None
-        self.processed_image = None
+        self.photo.clear()
+        self._bg_layer = None
         self.final_strings_pil = None
         self.sequence = []
+        self.checkpoint = None
         
         self.brightness_var.set(1.0)
         self.contrast_var.set(1.0)
@@ -390,8 +488,10 @@ class RingStringApp:
         self.progress['value'] = 0
         
         self.canvas.delete("image_bg")
+        self.preview.stop()
         self.canvas.delete("string_art")
         self.canvas.delete("final_res")
+        self._strings_layer = None
         self.reset_canvas_position()
         self._draw_base_structure()
         self.miniature_lbl.config(image=self.empty_img)
@@ -401,9 +501,12 @@ class RingStringApp:
         self.stop_flag = True
         self.is_generating = False
         self.sequence = []
+        self.checkpoint = None
         self.final_strings_pil = None
+        self.preview.stop()
         self.canvas.delete("string_art")
         self.canvas.delete("final_res")
+        self._strings_layer = None
         self.progress['value'] = 0
         self.miniature_lbl.config(image=self.empty_img)
         self.status_var.set("Нити очищены.")
@@ -415,6 +518,7 @@ class RingStringApp:
             img = Image.open(path).convert("RGBA")
             img.thumbnail((1200, 1200))
             self.original_image = img
+            self.photo.load(img)
             self.reset_canvas_position()
             self.scale_var.set(1.0)
             self.update_preview()
@@ -426,97 +530,116 @@ class RingStringApp:
             messagebox.showwarning("Ошибка", "Библиотека rembg недоступна.")
             return
 
-        if not self.original_image: return
+        if not self.original_image or self.removing_bg: return
+        self.removing_bg = True
         self.status_var.set("Удаление фона...")
         self.root.update()
+        src = self.original_image
         def t():
             try:
-                out = remove_bg(self.original_image)
-                bg = Image.new("RGBA", out.size, (255,255,255,255))
-                bg.paste(out, (0,0), out)
-                self.original_image = bg
-                self.root.after(0, self.update_preview)
-                self.root.after(0, lambda: self.status_var.set("Фон удален."))
+                bg = get_remover().remove(src)
+                self.root.after(0, lambda: self.set_background_removed(src, bg))
             except Exception as e:
-                self.root.after(0, lambda: messagebox.showerror("Ошибка", str(e)))
+                self.root.after(0, lambda e=e: messagebox.showerror("Ошибка", str(e)))
+            self.removing_bg = False
         threading.Thread(target=t, daemon=True).start()
 
+    def set_background_removed(self, src, bg):
+        if self.original_image is not src: return  # Пока считали, загрузили другое фото
+        self.original_image = bg
+        self.photo.load(bg)
+        self.update_preview()
+        self.status_var.set("Фон удален.")
+
     def auto_enhance(self):
         self.contrast_var.set(1.5)
         self.brightness_var.set(1.1)
         self.update_preview()
 
     def auto_calculate_params(self):
-        if self.processed_image is None:
+        if not self.photo.loaded:
             messagebox.showwarning("!", "Загрузите изображение")
             return
-        img = self.get_cropped_image()
-        stat = ImageOps.invert(img)
-        arr = np.array(stat)
-        avg_darkness = np.mean(arr)
-        
-        # Логика подбора параметров
-        if avg_darkness < 30:
-            lines = 2500
-            opacity = 20
-        elif avg_darkness < 60:
-            lines = 3000
-            opacity = 30
-        elif avg_darkness < 100:
-            lines = 3500
-            opacity = 35
-        else:
-            lines = 4000
-            opacity = 45
-        
-        nails = 240
-        self.lines_count_var.set(lines)
-        self.calc_opacity_var.set(opacity)
-        self.nails_count_var.set(nails)
-        msg = f"Анализ завершен:\nНасыщенность: {avg_darkness:.1f}\n\nРекомендовано:\nЛиний: {lines}\nПлотность: {opacity}"
+        if self.is_generating: return
+        # Пробные расчеты на малом разрешении в фоне; бюджет - TUNE_BUDGET секунд
+        calc_img = self.get_cropped_image()
+        self.is_generating = True
+        self.status_var.set("Подбор параметров...")
+        self.progress['value'] = 0
+
+        def on_progress(done, total):
+            self.root.after(0, lambda p=100 * done / total: self.progress.configure(value=p))
+
+        def t():
+            try:
+                res = tune(calc_img, budget=TUNE_BUDGET, on_progress=on_progress)
+            except Exception as e:
+                self.root.after(0, lambda e=e: messagebox.showerror("Ошибка", str(e)))
+                res = None
+            self.is_generating = False
+            if res is not None: self.root.after(0, lambda: self.apply_tuned_params(res))
+        threading.Thread(target=t, daemon=True).start()
+
+    def apply_tuned_params(self, res):
+        b = res.best
+        self.lines_count_var.set(b.lines)
+        self.calc_opacity_var.set(b.line_weight)
+        self.nails_count_var.set(b.nails)
+        self.skip_nails_var.set(b.skip_nails)
+        self.progress['value'] = 100
+        self.status_var.set(f"Подбор: {res.evaluated} вариантов за {res.elapsed:.1f} с")
+        curve = "\n".join(f"  {p.lines} линий: ошибка {p.error:.3f}" for p in res.best_curve()[1::2])
+        msg = (f"Рекомендовано:\nГвозди: {b.nails}\nЛиний: {b.lines}\nПлотность: {b.line_weight}\n"
+               f"Пропуск: {b.skip_nails}\n\nОшибка от числа линий:\n{curve}")
+        if res.budget_hit: msg += "\n\n(бюджет времени исчерпан - подбор неполный)"
         messagebox.showinfo("Автоподбор", msg)
 
     def update_preview(self, *args):
-        if self.original_image is None: return
-        img = self.original_image.copy().convert("RGB")
-        img = ImageOps.grayscale(img)
-        img = ImageEnhance.Brightness(img).enhance(self.brightness_var.get())
-        img = ImageEnhance.Contrast(img).enhance(self.contrast_var.get())
-        self.processed_image = img
+        # Слайдер шлет событие на каждый шаг: все события за PREVIEW_DELAY_MS - одна перерисовка
+        if self._preview_job is not None: return
+        self._preview_job = self.root.after(PREVIEW_DELAY_MS, self._flush_preview)
+
+    def _flush_preview(self):
+        self._preview_job = None
         self.update_layers_visibility()
 
     def update_layers_visibility(self, *args):
-        self._draw_base_structure()
+        # Каждый слой перестраивается, только если изменились его собственные входы
+        r = self.hoop_radius_var.get()
+        if r != self._hoop_r: self._draw_base_structure()
         
-        if self.processed_image:
-            scale = self.scale_var.get()
-            nw, nh = int(self.processed_image.width * scale), int(self.processed_image.height * scale)
-            img_bg = self.processed_image.resize((nw, nh), Image.Resampling.NEAREST).convert("RGBA")
-            
+        if self.photo.loaded:
             alpha_val = self.bg_opacity_var.get()
             if not self.show_original_var.get(): alpha_val = 0.0
-            img_bg.putalpha(int(255 * alpha_val))
-            
-            self.tk_img_bg = ImageTk.PhotoImage(img_bg)
-            self.canvas.delete("image_bg")
-            self.canvas.create_image(self.img_x, self.img_y, image=self.tk_img_bg, tags="image_bg")
-            self.canvas.tag_lower("image_bg")
+            # На холст идет только видимый кадр зума - не больше самого холста
+            img_bg, pos = self.photo.layer(self.scale_var.get(), self.brightness_var.get(), self.contrast_var.get(),
+                                           int(255 * alpha_val), (self.img_x, self.img_y),
+                                           (self.canvas_size, self.canvas_size))
+            # Слой не изменился (двигали круг, меняли нити) - холст не трогаем
+            if img_bg is None:
+                self._bg_layer = None
+                self.canvas.delete("image_bg")
+            elif img_bg is not self._bg_layer:
+                self._bg_layer = img_bg
+                self.tk_img_bg = ImageTk.PhotoImage(img_bg)
+                self.canvas.delete("image_bg")
+                self.canvas.create_image(*pos, image=self.tk_img_bg, anchor=tk.NW, tags="image_bg")
+                self.canvas.tag_lower("image_bg")
+            elif tuple(self.canvas.coords("image_bg")) != pos:
+                self.canvas.coords("image_bg", *pos)
         
         if self.final_strings_pil:
-            r = self.hoop_radius_var.get()
-            disp_size = r * 2
-            str_img = self.final_strings_pil.resize((disp_size, disp_size), Image.Resampling.LANCZOS)
-            
-            user_alpha = self.strings_opacity_var.get()
-            if user_alpha < 1.0:
-                r_ch, g_ch, b_ch, a_ch = str_img.split()
-                a_ch = a_ch.point(lambda p: int(p * user_alpha))
-                str_img = Image.merge("RGBA", (r_ch, g_ch, b_ch, a_ch))
-            
-            self.tk_img_res = ImageTk.PhotoImage(str_img)
-            cx, cy = self.canvas_size // 2, self.canvas_size // 2
-            self.canvas.delete("final_res")
-            self.canvas.create_image(cx, cy, image=self.tk_img_res, tags="final_res")
+            str_img = self.strings.layer(r * 2, self.strings_opacity_var.get())
+            if str_img is not self._strings_layer:
+                if (self._strings_layer is not None and self._strings_layer.size == str_img.size
+                        and self.canvas.find_withtag("final_res")):
+                    self.tk_img_res.paste(str_img)  # Сменилась только прозрачность - та же картинка Tk
+                else:
+                    self.tk_img_res = ImageTk.PhotoImage(str_img)
+                    cx, cy = self.canvas_size // 2, self.canvas_size // 2
+                    self.canvas.delete("final_res")
+                    self.canvas.create_image(cx, cy, image=self.tk_img_res, tags="final_res")
+                self._strings_layer = str_img
             
         self.canvas.tag_raise("hoop_mask")
         self.canvas.tag_raise("hoop_ring")
@@ -534,50 +657,52 @@ class RingStringApp:
         self.drag_data["x"] = event.x
         self.drag_data["y"] = event.y
         self.canvas.move("image_bg", dx, dy)
+        self.update_preview()  # Дорисовать открывшуюся часть кадра
 
     def get_cropped_image(self):
-        if self.processed_image is None: return None
-        r = self.hoop_radius_var.get()
-        size = r * 2
-        calc_size = 500
-        
+        if not self.photo.loaded: return None
         cx, cy = self.canvas_size // 2, self.canvas_size // 2
-        rel_x = self.img_x - cx
-        rel_y = self.img_y - cy
-        
-        scale = self.scale_var.get()
-        cur_w = int(self.processed_image.width * scale)
-        cur_h = int(self.processed_image.height * scale)
-        
-        base = Image.new("L", (size, size), 255)
-        img_res = self.processed_image.resize((cur_w, cur_h), Image.Resampling.LANCZOS)
-        
-        paste_x = int(rel_x + r - cur_w/2)
-        paste_y = int(rel_y + r - cur_h/2)
-        base.paste(img_res, (paste_x, paste_y))
-        
-        mask = Image.new("L", (size, size), 0)
-        ImageDraw.Draw(mask).ellipse((0,0,size,size), fill=255)
-        final = Image.composite(base, Image.new("L", base.size, 255), mask)
-        return final.resize((calc_size, calc_size), Image.Resampling.LANCZOS)
+        offset = (self.img_x - cx, self.img_y - cy)
+        # Полное разрешение нужно только расчету - превью работает со слоями PhotoPreview
+        processed = self.photo.full(self.brightness_var.get(), self.contrast_var.get())
+        return crop_to_hoop(processed, self.hoop_radius_var.get(), self.scale_var.get(), offset, self.calc_size_var.get())
 
-    def start_generation(self, animate=True):
+    def start_generation(self, animate=True, extend=False):
         if self.is_generating: return
-        if not self.processed_image:
+        if extend:
+            # Продолжаем с чекпоинта до текущего значения "Линии (шт)"
+            if self.checkpoint is None:
+                messagebox.showwarning("!", "Нет расчета для продолжения")
+                return
+            if self.lines_count_var.get() <= self.checkpoint.lines_done:
+                messagebox.showwarning("!", f"Уже посчитано {self.checkpoint.lines_done} линий - увеличьте кол-во линий")
+                return
+        elif not self.photo.loaded:
             messagebox.showwarning("!", "Загрузите изображение")
             return
         
         self.canvas.delete("string_art")
         self.canvas.delete("final_res")
+        self._strings_layer = None
         self.final_strings_pil = None
         
-        self.calc_img_pil = self.get_cropped_image()
+        # Поток событий расчета: прогресс, анимация линий и профиль фаз
+        self.instrument = Instrumentation(trace_residual=False)
+        self.profiler = Profiler().attach(self.instrument, trace_lines=False)
+        if not extend:
+            with phase(self.instrument, "crop"):
+                self.calc_img_pil = self.get_cropped_image()
         self.is_generating = True
         self.stop_flag = False
         self.status_var.set("Расчет...")
         self.progress['value'] = 0
+        if animate:
+            # Превью запускается до потока расчета: start() очищает очередь, и линии,
+            # присланные потоком, не должны в нее попасть раньше
+            n_nails = self.checkpoint.params.nails if extend else self.nails_count_var.get()
+            self.start_live_preview(calculate_nails(self.calc_img_pil.width, n_nails))
         
-        self.thread = threading.Thread(target=self.run_algorithm_improved, args=(animate,))
+        self.thread = threading.Thread(target=self.run_algorithm_improved, args=(animate, extend))
         self.thread.start()
 
     def stop_generation(self):
@@ -586,156 +711,131 @@ class RingStringApp:
     # =========================================================================
     # ГЛАВНЫЙ АЛГОРИТМ (ERROR MINIMIZATION)
     # =========================================================================
-    def run_algorithm_improved(self, animate):
-        # Целевое изображение: 255 - черный, 0 - белый
-        target_img = ImageOps.invert(self.calc_img_pil)
-        w, h = target_img.size
-        
-        # Маска круга
-        msk = Image.new("L", (w,h), 0)
-        ImageDraw.Draw(msk).ellipse((0,0,w,h), fill=255)
-        target_img = Image.composite(target_img, Image.new("L", target_img.size, 0), msk)
-        
-        # Error Matrix: содержит "сколько еще нужно добавить черноты"
-        # Может уходить в минус (перечернено)
-        error_matrix = np.array(target_img, dtype=np.float32)
-        
-        n_nails = self.nails_count_var.get()
-        max_lines = self.lines_count_var.get()
-        
-        nails = []
-        cx, cy = w/2, h/2
-        rad = w/2 - 1
-        for i in range(n_nails):
-            a = 2*math.pi*i/n_nails
-            nails.append((int(cx+rad*math.cos(a)), int(cy+rad*math.sin(a))))
-
-        curr = 0
-        self.sequence = [curr]
-        
-        line_weight = float(self.calc_opacity_var.get())
-        skip_nails = 15 # Пропуск соседей
-        
-        for i in range(max_lines):
-            if self.stop_flag: break
-            
-            best_nail = -1
-            best_score = -999999999.0
-            sx, sy = nails[curr]
-            
-            for t in range(n_nails):
-                dist_idx = abs(t - curr)
-                if dist_idx < skip_nails or dist_idx > (n_nails - skip_nails): continue
-                
-                ex, ey = nails[t]
-                ln = int(math.hypot(ex-sx, ey-sy))
-                if ln == 0: continue
-                
-                xs = np.linspace(sx, ex, ln).astype(int)
-                ys = np.linspace(sy, ey, ln).astype(int)
-                xs = np.clip(xs, 0, w-1)
-                ys = np.clip(ys, 0, h-1)
-                
-                # СУТЬ АЛГОРИТМА: Считаем сумму значений под линией.
-                # Если значения положительные - там нужно рисовать.
-                # Если отрицательные (уже перечернено) - сумма уменьшается, линия не выбирается.
-                vals = error_matrix[ys, xs]
-                score = np.sum(vals)
-                
-                if score > best_score:
-                    best_score = score
-                    best_nail = t
-            
-            if best_nail == -1: break
-            
-            # Рисуем
-            ex, ey = nails[best_nail]
-            ln = int(math.hypot(ex-sx, ey-sy))
-            xs = np.linspace(sx, ex, ln).astype(int)
-            ys = np.linspace(sy, ey, ln).astype(int)
-            xs = np.clip(xs, 0, w-1)
-            ys = np.clip(ys, 0, h-1)
-            
-            # Вычитаем вес нити из матрицы. 
-            # Разрешаем уходить в минус (не используем clip(0)).
-            error_matrix[ys, xs] -= line_weight
-            
-            self.sequence.append(best_nail)
-            curr = best_nail
-            
-            # UI Updates
-            if i % 25 == 0:
-                pct = (i / max_lines) * 100
-                self.root.after(0, lambda p=pct: self.progress.configure(value=p))
-            if animate and i % 5 == 0:
-                self.root.after(0, self.draw_line_live, nails[self.sequence[-2]], nails[curr])
-
+    def run_algorithm_improved(self, animate, extend=False):
+        ckpt = self.checkpoint if extend else None
+        params = ckpt.params if ckpt is not None else SolverParams(
+            nails=self.nails_count_var.get(),
+            lines=self.lines_count_var.get(),
+            line_weight=self.calc_opacity_var.get(),
+            skip_nails=self.skip_nails_var.get(),
+            incremental=self.incremental_var.get() or None,
+            calc_size=self.calc_img_pil.width,
+            draft_size=250 if self.pyramid_var.get() else 0,
+            strategy=self.strategy_var.get(),
+            time_budget=self.time_budget_var.get(),
+            backend=self.backend_var.get(),
+        )
+
+        def on_progress(event):
+            pct = (event["i"] / event["total"]) * 100
+            self.root.after(0, lambda p=pct: self.progress.configure(value=p))
+
+        # Тот же кадр с теми же параметрами уже считали - берем результат из кэша.
+        # Продолжение ищется по происхождению чекпоинта (None - чекпоинт без хэша фото)
+        final_params = replace(params, lines=self.lines_count_var.get()) if ckpt is not None else params
+        key = result_cache.key(self.calc_img_pil, final_params, ckpt)
+        with phase(self.instrument, "cache"):
+            result = result_cache.get(key, final_params)
+        fresh = result is None
+        if fresh:
+            self.instrument.subscribe(on_progress, ("progress",))
+            if animate:
+                if ckpt is not None:
+                    for nail in ckpt.sequence[1:]: self.preview.push(nail)
+                self.instrument.subscribe(lambda event: self.preview.push(event["b"]), ("line",))
+            if ckpt is not None:
+                result = resume(ckpt, self.lines_count_var.get(), should_stop=lambda: self.stop_flag,
+                                instrument=self.instrument)
+            else:
+                result = solve(self.calc_img_pil, params, should_stop=lambda: self.stop_flag,
+                               instrument=self.instrument)
+        if self.compare_greedy_var.get() and result.report is not None and not result.stopped \
+                and "greedy_error" not in result.report:
+            # Не жадная стратегия: сравнение с жадным расчетом при том же числе линий (по запросу)
+            self.root.after(0, lambda: self.status_var.set("Сравнение с жадным расчетом..."))
+            result.report.update(compare_with_greedy(self.calc_img_pil, result))
+        if fresh:
+            result_cache.put(key, result)
+        self.sequence = result.sequence
+        self.solver_params = result.params
+        self.strategy_report = result.report
+        self.checkpoint = result.checkpoint
         self.is_generating = False
-        self.root.after(0, lambda: self.finalize_result(nails))
+        self.root.after(0, lambda: self.finalize_result(result, None if result.stopped else key))
 
-    def draw_line_live(self, p1, p2):
+    def start_live_preview(self, nails):
         r = self.hoop_radius_var.get()
-        scale = (r * 2) / 500
-        off_x = (self.canvas_size//2) - r
-        off_y = (self.canvas_size//2) - r
-        self.canvas.create_line(p1[0]*scale+off_x, p1[1]*scale+off_y, 
-                                p2[0]*scale+off_x, p2[1]*scale+off_y, 
-                                width=1, fill="black", tags="string_art")
-
-    def finalize_result(self, nails):
+        off = (self.canvas_size // 2) - r
+        self.preview.fps = self.preview_fps_var.get()
+        self.preview.start(nails, 0, (off, off), r * 2 + 1, (r * 2) / self.calc_img_pil.width)
+
+    def finalize_result(self, result, key=None):
         self.status_var.set("Рендер высокой четкости...")
         self.progress['value'] = 100
+        self.preview.stop()
         self.canvas.delete("string_art")
         
-        size = 2000 
-        img = Image.new("RGBA", (size, size), (255, 255, 255, 0))
-        draw = ImageDraw.Draw(img)
-        sf = size / 500
-        sc_nails = [(x*sf, y*sf) for x,y in nails]
-        
-        # Полупрозрачная нить для реализма
-        color = (0, 0, 0, 40)
-        pts = [sc_nails[i] for i in self.sequence]
-        
-        for i in range(len(pts)-1):
-            draw.line([pts[i], pts[i+1]], fill=color, width=2)
-            
-        mask = Image.new("L", (size, size), 0)
-        ImageDraw.Draw(mask).ellipse((0,0,size,size), fill=255)
-        
-        self.final_strings_pil = img
-        white_thumb = Image.new("RGB", (size, size), "white")
-        white_thumb.paste(img, (0,0), img)
-        thumb = white_thumb.resize((400, 400), Image.Resampling.LANCZOS)
+        # Рендерим только то, что показываем: холст и миниатюру (уровни рендера кэшируются)
+        with phase(self.instrument, "finalize"):
+            self.final_strings_pil = result_cache.render(key, result, "screen")
+            self.strings.set(self.final_strings_pil)
+            thumb = flatten_on_white(result_cache.render(key, result, "thumbnail"))
         tk_thumb = ImageTk.PhotoImage(thumb)
         self.miniature_lbl.config(image=tk_thumb)
         self.miniature_lbl.image = tk_thumb
         self.update_layers_visibility()
-        self.status_var.set(f"Готово! Линий: {len(self.sequence)}")
+        solve_time = sum(t for name, t in self.profiler.phases.items() if name not in ("crop", "finalize"))
+        self.status_var.set(f"Готово! Линий: {len(self.sequence)} ("
+                            + ("из кэша" if result.cached else f"{solve_time:.1f} с") + ")")
+        if self.strategy_report and "greedy_error" in self.strategy_report:
+            messagebox.showinfo("Сравнение с жадным", format_strategy_report(self.strategy_report))
 
     def save_instructions(self):
         if not self.sequence: return
-        types = [("TXT", "*.txt"), ("JSON", "*.json"), ("CSV", "*.csv")]
+        types = [("TXT", "*.txt"), ("JSON", "*.json"), ("CSV", "*.csv"), ("RSQ (компактный)", "*.rsq"),
+                 ("SVG (шаблон для печати)", "*.svg"), ("PDF (шаблон для печати)", "*.pdf"),
+                 ("PNG (рендер любого размера)", "*.png")]
         path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=types)
         if not path: return
+        if path.lower().endswith(".png"):
+            return self.export_large_png(path)
+        diameter = DIAMETER_MM
+        if path.lower().endswith((".svg", ".pdf")):
+            # Шаблон печатается в натуральную величину
+            diameter = simpledialog.askfloat("Печать", "Диаметр обруча, мм:", initialvalue=DIAMETER_MM,
+                                             minvalue=50, maxvalue=5000)
+            if not diameter: return
         try:
-            if path.endswith(".json"):
-                json.dump({"nails_count": self.nails_count_var.get(), "sequence": self.sequence}, open(path, "w"))
-            elif path.endswith(".csv"):
-                with open(path, "w", newline='') as f:
-                    w = csv.writer(f)
-                    for i in range(0, len(self.sequence), 20): w.writerow(self.sequence[i:i+20])
-            else:
-                with open(path, "w") as f:
-                    f.write(f"Гвозди: {self.nails_count_var.get()}\n")
-                    for i in range(0, len(self.sequence), 10):
-                        f.write(" - ".join(map(str, self.sequence[i:i+10])) + "\n")
+            # Гвозди - те, с которыми посчитана схема, а не текущее значение поля
+            write_instructions(path, self.sequence, self.solver_params.nails, params=self.solver_params,
+                               diameter=diameter)
             messagebox.showinfo("OK", "Сохранено")
         except Exception as e:
             messagebox.showerror("Err", str(e))
 
+    def export_large_png(self, path):
+        # Рендер полосами в фоне: память не зависит от размера
+        size = simpledialog.askinteger("Рендер", "Размер, px:", initialvalue=8000, minvalue=500, maxvalue=60000)
+        if not size: return
+        seq, p = self.sequence, self.solver_params
+        self.status_var.set("Рендер по частям...")
+        self.progress['value'] = 0
+
+        def on_progress(done, total):
+            self.root.after(0, lambda v=100 * done / total: self.progress.configure(value=v))
+
+        def t():
+            try:
+                write_png_tiled(path, seq, p.nails, p.calc_size, size, progress=on_progress)
+                self.root.after(0, lambda: self.status_var.set(f"Сохранено: {size}x{size} px"))
+            except Exception as e:
+                self.root.after(0, lambda e=e: messagebox.showerror("Ошибка", str(e)))
+        threading.Thread(target=t, daemon=True).start()
+
     def open_player_window(self):
-        InstructionPlayer(self.root, self.nails_count_var.get(), self.sequence)
+        # Без схемы плеер открывается пустым (схема загружается в нем из файла)
+        nails = self.solver_params.nails if self.sequence else self.nails_count_var.get()
+        InstructionPlayer(self.root, nails, self.sequence)
 
 if __name__ == "__main__":
     root = tk.Tk()
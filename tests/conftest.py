@@ -0,0 +1,24 @@
+import os
+
+import pytest
+from PIL import Image
+
+# Тесты не пишут в пользовательские кэши (~/.cache/ringstring): переменные читаются
+# при импорте ringstring, поэтому задаются до него
+for _var in ("RINGSTRING_CACHE_DIR", "RINGSTRING_MASK_CACHE", "RINGSTRING_RESULT_CACHE"):
+    os.environ[_var] = ""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHOTO = os.path.join(ROOT, "1.jpg")
+
+
+@pytest.fixture(scope="session")
+def photo():
+    return PHOTO
+
+
+@pytest.fixture(scope="session")
+def calc_img():
+    # Подготовленное фото 300 px, как в пакетном режиме
+    from ringstring.engine import adjust_photo, fit_to_hoop
+    return fit_to_hoop(adjust_photo(Image.open(PHOTO)), 300)
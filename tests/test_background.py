@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from ringstring import background
+from ringstring.background import BackgroundRemover
+
+
+class FakeRembg:
+    # Вместо модели: маска - светлые пиксели фото; считает вызовы
+    def __init__(self):
+        self.calls = []
+
+    def remove(self, img, session=None, only_mask=True):
+        self.calls.append(img.size)
+        return img.convert("L").point(lambda v: 255 if v > 128 else 0)
+
+
+@pytest.fixture
+def rembg(monkeypatch):
+    fake = FakeRembg()
+    monkeypatch.setattr(background, "_rembg", fake)
+    monkeypatch.setattr(background, "get_session", lambda model: None)
+    return fake
+
+
+def _photo(seed, size=(120, 80)):
+    return Image.fromarray(np.random.default_rng(seed).integers(0, 256, size[::-1] + (3,), dtype=np.uint8))
+
+
+def test_mask_is_computed_once(rembg, tmp_path):
+    img = _photo(0)
+    remover = BackgroundRemover(cache_dir=str(tmp_path))
+    first = remover.mask(img)
+    assert remover.mask(img.copy()) is first and len(rembg.calls) == 1
+    # Новый процесс (новый экземпляр) берет маску с диска
+    again = BackgroundRemover(cache_dir=str(tmp_path)).mask(img)
+    assert len(rembg.calls) == 1 and np.array_equal(np.asarray(again), np.asarray(first))
+
+    remover.mask(_photo(1))
+    assert len(rembg.calls) == 2
+
+
+def test_model_runs_on_reduced_copy(rembg):
+    img = _photo(2, (400, 200))
+    mask = BackgroundRemover(max_side=100, cache_dir="").mask(img)
+    assert rembg.calls == [(100, 50)] and mask.size == (400, 200)
+
+
+def test_remove_puts_photo_on_background(rembg):
+    img = _photo(3)
+    out = BackgroundRemover(cache_dir="").remove(img)
+    mask = np.asarray(img.convert("L")) > 128
+    pixels = np.asarray(out)
+    assert (pixels[~mask] == 255).all()
+    assert np.array_equal(pixels[mask][:, :3], np.asarray(img)[mask])
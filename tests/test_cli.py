@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+from dataclasses import replace
+
+from ringstring import cli
+from ringstring.batch import JobOptions, load_photo, process_photo
+from ringstring.engine import SolverParams, StringArtEngine
+from ringstring.formats import read_instructions
+
+
+def test_batch_cli_writes_schemes(tmp_path, photo):
+    out = tmp_path / "out"
+    code = cli.main([photo, "-o", str(out), "--nails", "120", "--lines", "80", "--formats", "txt,json"])
+    assert code == 0
+    assert sorted(p.name for p in out.iterdir()) == ["1.json", "1.png", "1.txt"]
+
+    expected = StringArtEngine(SolverParams(nails=120, lines=80)).generate(
+        load_photo(photo), render=False).sequence
+    for ext in ("txt", "json"):
+        assert read_instructions(str(out / f"1.{ext}")) == (120, expected)
+
+
+def test_process_pool_matches_single_process(tmp_path, photo):
+    src = tmp_path / "photos"
+    src.mkdir()
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        shutil.copy(photo, src / name)
+    args = [str(src), "--nails", "120", "--lines", "60", "--formats", "json", "--no-render"]
+    assert cli.main(args + ["-o", str(tmp_path / "one"), "-j", "1"]) == 0
+    report = str(tmp_path / "report.json")
+    assert cli.main(args + ["-o", str(tmp_path / "pool"), "-j", "2", "--report", report]) == 0
+
+    with open(report) as f:
+        data = json.load(f)
+    assert data["workers"] == 2 and [job["ok"] for job in data["jobs"]] == [True] * 3
+    for name in ("a", "b", "c"):
+        assert (tmp_path / "pool" / f"{name}.json").read_text() == (tmp_path / "one" / f"{name}.json").read_text()
+
+
+def test_unknown_format_is_usage_error(tmp_path, photo):
+    assert cli.main([photo, "-o", str(tmp_path), "--formats", "txt,bmp"]) == 2
+
+
+def test_checkpoint_of_other_photo_is_not_resumed(tmp_path, photo):
+    src = tmp_path / "a.jpg"
+    shutil.copy(photo, src)
+    params = SolverParams(nails=120, lines=60, calc_size=200)
+    options = JobOptions(output_dir=str(tmp_path), formats=("json",), render=False, use_cache=False,
+                         checkpoint_dir=str(tmp_path / "ckpt"))
+    assert process_photo(str(src), params, options).ok
+    # То же имя файла, другое фото: чекпоинт a.ckpt.npz не продолжается
+    other = os.path.join(os.path.dirname(photo), "3.jpg")
+    shutil.copy(other, src)
+    more = replace(params, lines=100)
+    res = process_photo(str(src), more, options)
+    assert res.ok and not res.stopped, res.error
+    expected = StringArtEngine(more).generate(load_photo(other), render=False).sequence
+    assert read_instructions(str(tmp_path / "a.json")) == (120, expected)
+
+
+def test_out_of_range_params_are_usage_error(tmp_path, photo, capsys):
+    assert cli.main([photo, "-o", str(tmp_path / "out"), "--nails", "5000"]) == 2
+    assert "nails" in capsys.readouterr().err and not (tmp_path / "out").exists()
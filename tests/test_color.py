@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+from PIL import Image
+
+from ringstring import cli
+from ringstring.color import CMYK, parse_palette, prepare_color, solve_color, split_layers, split_lines
+from ringstring.engine import SolverParams
+
+
+def test_parse_palette():
+    assert parse_palette("CMYK") is CMYK
+    assert parse_palette("#d62828, black") == [("d62828", (214, 40, 40)), ("black", (0, 0, 0))]
+
+
+def test_cmyk_layers_of_pure_inks():
+    img = Image.new("RGB", (4, 1))
+    for x, rgb in enumerate([(0, 255, 255), (255, 0, 255), (0, 0, 0), (255, 255, 255)]):
+        img.putpixel((x, 0), rgb)
+    layers = {name: np.asarray(layer)[0].tolist() for name, _, layer in split_layers(img, CMYK)}
+    # Темнее - больше нити этого цвета; черный уходит в слой K, белый - пустой
+    assert layers == {"cyan": [0, 255, 255, 255], "magenta": [255, 0, 255, 255],
+                      "yellow": [255, 255, 255, 255], "black": [255, 255, 0, 255]}
+
+
+def test_lines_follow_ink():
+    full, half = Image.new("L", (10, 10), 0), Image.new("L", (10, 10), 128)
+    assert split_lines(300, [full, half]) == [200, 100]
+
+
+def test_parallel_layers_match_serial(photo):
+    rgb = prepare_color(Image.open(photo), calc_size=200)
+    params = SolverParams(nails=90, lines=150, calc_size=200)
+    serial = solve_color(rgb, params, "cmy", workers=1)
+    parallel = solve_color(rgb, params, "cmy", workers=3)
+    assert [(l.name, l.sequence) for l in parallel] == [(l.name, l.sequence) for l in serial]
+    assert abs(sum(len(l.sequence) - 1 for l in serial) - 150) <= len(serial)
+
+
+def test_cli_writes_layer_per_colour(tmp_path, photo):
+    code = cli.main([photo, "-o", str(tmp_path), "--nails", "90", "--lines", "90", "--calc-size", "200",
+                     "--colors", "#d62828,black", "--formats", "json", "--no-render"])
+    assert code == 0
+    with open(tmp_path / "1_d62828.json") as f:
+        assert json.load(f)["color"] == "#d62828"
+    assert (tmp_path / "1_black.json").exists()
+
+
+def test_invalid_palette_is_usage_error(tmp_path, photo, capsys):
+    assert cli.main([photo, "-o", str(tmp_path), "--colors", "nope"]) == 2
+    assert capsys.readouterr().err and not list(tmp_path.iterdir())
@@ -0,0 +1,38 @@
+import numpy as np
+
+from ringstring import convert
+from ringstring.formats import SequenceFile, read_instructions, write_instructions
+
+
+def _archive(root):
+    seqs = {}
+    for rel, nails in (("a/1.txt", 200), ("a/1.json", 300), ("b/c/2.csv", 240)):
+        seq = np.random.default_rng(nails).integers(0, nails, 500).tolist()
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_instructions(str(path), seq, nails)
+        seqs[rel] = (nails, seq)
+    return seqs
+
+
+def test_archive_to_rsq_keeps_tree(tmp_path):
+    seqs = _archive(tmp_path / "src")
+    (tmp_path / "src" / "broken.txt").write_text("пусто")
+    code = convert.main([str(tmp_path / "src"), "-o", str(tmp_path / "dst"), "-j", "2"])
+    assert code == 1  # Одна схема без данных
+
+    # Одна схема в двух форматах не перезаписывает саму себя
+    expected = {"a/1.rsq": "a/1.json", "a/1_txt.rsq": "a/1.txt", "b/c/2.rsq": "b/c/2.csv"}
+    for dst, src in expected.items():
+        with SequenceFile(str(tmp_path / "dst" / dst)) as sf:
+            assert sf.verify() and sf.tolist() == seqs[src][1]
+    assert read_instructions(str(tmp_path / "dst" / "a/1_txt.rsq"))[0] == 200
+
+
+def test_convert_back_to_text(tmp_path):
+    seqs = _archive(tmp_path / "src")
+    done, failed, _, _ = convert.convert_archive(str(tmp_path / "src"), str(tmp_path / "rsq"))
+    assert (done, failed) == (3, 0)
+    done, failed, _, _ = convert.convert_archive(str(tmp_path / "rsq"), str(tmp_path / "txt"), "txt")
+    assert (done, failed) == (3, 0)
+    assert read_instructions(str(tmp_path / "txt" / "b/c/2.txt")) == seqs["b/c/2.csv"]
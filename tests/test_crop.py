@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from ringstring.engine import adjust_photo, crop_to_hoop
+
+
+def two_step_crop(processed, radius, scale, offset, calc_size):
+    # Прежний путь: фото в масштабе зума, вставка в квадрат круга, маска, resize
+    size = radius * 2
+    cur_w, cur_h = int(processed.width * scale), int(processed.height * scale)
+    base = Image.new("L", (size, size), 255)
+    base.paste(processed.resize((cur_w, cur_h), Image.Resampling.LANCZOS),
+               (int(offset[0] + radius - cur_w / 2), int(offset[1] + radius - cur_h / 2)))
+    mask = Image.new("L", (size, size), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, size, size), fill=255)
+    final = Image.composite(base, Image.new("L", base.size, 255), mask)
+    return final.resize((calc_size, calc_size), Image.Resampling.LANCZOS)
+
+
+@pytest.fixture(scope="module")
+def gray(photo):
+    img = Image.open(photo)
+    img.thumbnail((600, 600))
+    return adjust_photo(img)
+
+
+def _interior(gray, radius, scale, offset, calc_size, margin=4):
+    # Пиксели внутри круга и фото, дальше margin от их краев
+    k = calc_size / (2 * radius)
+    cur_w, cur_h = int(gray.width * scale), int(gray.height * scale)
+    px, py = int(offset[0] + radius - cur_w / 2) * k, int(offset[1] + radius - cur_h / 2) * k
+    yy, xx = np.mgrid[:calc_size, :calc_size]
+    c = (calc_size - 1) / 2
+    return ((np.hypot(yy - c, xx - c) < calc_size / 2 - margin)
+            & (xx > px + margin) & (xx < px + cur_w * k - margin)
+            & (yy > py + margin) & (yy < py + cur_h * k - margin))
+
+
+def _diff(gray, radius, scale, offset, calc_size):
+    new = np.asarray(crop_to_hoop(gray, radius, scale, offset, calc_size), dtype=np.int16)
+    old = np.asarray(two_step_crop(gray, radius, scale, offset, calc_size), dtype=np.int16)
+    return np.abs(new - old)[_interior(gray, radius, scale, offset, calc_size)]
+
+
+@pytest.mark.parametrize("radius, offset, calc_size", [(375, (0, 0), 500), (300, (30, -40), 300), (375, (-101, 57), 500)])
+def test_unit_zoom_matches_two_step(gray, radius, offset, calc_size):
+    assert _diff(gray, radius, 1.0, offset, calc_size).max() <= 1
+
+
+@pytest.mark.parametrize("scale", [1.25, 2.0, 4.0])
+@pytest.mark.parametrize("offset", [(0, 0), (30, -40)])
+def test_zoom_in_matches_two_step_up_to_resampling(gray, scale, offset):
+    d = _diff(gray, 300, scale, offset, 500)
+    assert d.mean() < 0.5 and np.percentile(d, 99) <= 8
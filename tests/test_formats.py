@@ -0,0 +1,100 @@
+import json
+
+import numpy as np
+import pytest
+
+from ringstring.engine import SolverParams
+from ringstring.formats import (
+    ENC_DELTA, ENC_U16, ENC_U8, SequenceFile, convert_instructions, iter_instructions,
+    read_instructions, write_binary, write_instructions,
+)
+
+
+def _sequence(nails, n=1500, seed=1):
+    rng = np.random.default_rng(seed)
+    # Как у решателя: соседние гвозди не совпадают, шаги любые по кругу
+    steps = rng.integers(1, nails, n)
+    return np.concatenate(([0], np.cumsum(steps) % nails)).tolist()
+
+
+@pytest.mark.parametrize("ext", ["txt", "json", "csv", "rsq"])
+@pytest.mark.parametrize("nails", [200, 300])
+def test_round_trip(tmp_path, ext, nails):
+    seq = _sequence(nails)
+    path = str(tmp_path / f"scheme.{ext}")
+    write_instructions(path, seq, nails, params=SolverParams(nails=nails))
+    assert read_instructions(path) == (nails if ext != "csv" else 240, seq)
+    _, it = iter_instructions(path)
+    assert list(it) == seq
+
+
+@pytest.mark.parametrize("encoding, code", [("u8", ENC_U8), ("u16", ENC_U16), ("delta", ENC_DELTA)])
+def test_rsq_encodings(tmp_path, encoding, code):
+    nails = 200 if encoding == "u8" else 1000
+    seq = _sequence(nails)
+    path = str(tmp_path / "scheme.rsq")
+    write_binary(path, seq, nails, calc_size=500, encoding=encoding)
+    with SequenceFile(path) as sf:
+        assert (sf.encoding, sf.nails_count, sf.calc_size, len(sf)) == (code, nails, 500, len(seq))
+        assert sf.verify() and sf.tolist() == seq
+
+
+def test_rsq_auto_is_smallest(tmp_path):
+    seq = _sequence(300)
+    sizes = {}
+    for enc in ("auto", "u16", "delta"):
+        path = tmp_path / f"{enc}.rsq"
+        write_binary(str(path), seq, 300, encoding=enc)
+        sizes[enc] = path.stat().st_size
+    assert sizes["auto"] == min(sizes.values())
+
+
+def test_rsq_checksum_detects_corruption(tmp_path):
+    path = tmp_path / "scheme.rsq"
+    write_binary(str(path), _sequence(200), 200, encoding="u8")
+    data = bytearray(path.read_bytes())
+    data[-10] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        read_instructions(str(path))
+
+
+def test_rsq_rejects_out_of_range(tmp_path):
+    with pytest.raises(ValueError):
+        write_binary(str(tmp_path / "bad.rsq"), [0, 5, 200], 200)
+
+
+def test_convert_keeps_params_and_color(tmp_path):
+    seq = _sequence(240, 300)
+    params = SolverParams(nails=240, lines=300, line_weight=25)
+    src = str(tmp_path / "scheme.rsq")
+    write_instructions(src, seq, 240, color="#d62828", params=params)
+
+    as_json = str(tmp_path / "scheme.json")
+    convert_instructions(src, as_json)
+    with open(as_json) as f:
+        assert json.load(f)["color"] == "#d62828"
+
+    back = str(tmp_path / "back.rsq")
+    convert_instructions(as_json, back, params=params)
+    with SequenceFile(back) as sf:
+        assert sf.tolist() == seq and sf.color == "#d62828"
+        assert SolverParams(**sf.params) == params
+
+
+@pytest.mark.parametrize("ext", ["TXT", "Json", "CSV", "RSQ"])
+def test_extension_is_case_insensitive(tmp_path, ext):
+    seq = _sequence(200, 300)
+    path = str(tmp_path / f"SCHEME.{ext}")
+    write_instructions(path, seq, 200)
+    write_instructions(str(tmp_path / f"lower.{ext.lower()}"), seq, 200)
+    assert (tmp_path / f"SCHEME.{ext}").read_bytes() == (tmp_path / f"lower.{ext.lower()}").read_bytes()
+    assert read_instructions(path, 200) == (200, seq)  # В CSV нет числа гвоздей
+    convert_instructions(path, str(tmp_path / "copy.txt"), 200)
+    assert read_instructions(str(tmp_path / "copy.txt")) == (200, seq)
+
+
+def test_upper_case_svg_is_vector(tmp_path):
+    path = tmp_path / "SCHEME.SVG"
+    write_instructions(str(path), _sequence(200, 50), 200)
+    assert path.read_text(encoding="utf-8").lstrip().startswith("<?xml")
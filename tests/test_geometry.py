@@ -0,0 +1,86 @@
+import math
+import os
+
+import numpy as np
+import pytest
+
+from ringstring.geometry import ChordIndex, ChordScoreTable, GeometryCache, calculate_nails, get_chord_index
+
+
+def linspace_chord(nails, size, a, b):
+    # Обход хорды, как в исходном цикле программы: np.linspace на каждом шаге
+    (sx, sy), (ex, ey) = nails[a], nails[b]
+    ln = int(math.hypot(ex - sx, ey - sy))
+    if ln == 0: return None
+    xs = np.clip(np.linspace(sx, ex, ln).astype(int), 0, size - 1)
+    ys = np.clip(np.linspace(sy, ey, ln).astype(int), 0, size - 1)
+    return ys * size + xs
+
+
+@pytest.mark.parametrize("n_nails, size", [(120, 300), (181, 400)])
+def test_chord_pixels_match_linspace(n_nails, size):
+    index = get_chord_index(n_nails, size)
+    nails = calculate_nails(size, n_nails)
+    assert index.nails == nails
+    for a in range(n_nails):
+        for b in range(n_nails):
+            expected = linspace_chord(nails, size, a, b)
+            got = index.chord(a, b)
+            if expected is None:
+                assert got is None, (a, b)
+            else:
+                # Порядок обхода не важен: сумма и вычитание зависят только от набора пикселей
+                assert np.array_equal(np.sort(got), np.sort(expected)), (a, b)
+
+
+def test_index_is_shared():
+    assert get_chord_index(120, 300) is get_chord_index(120, 300)
+
+
+def test_score_table_tracks_direct_sums():
+    index = get_chord_index(120, 300)
+    rng = np.random.default_rng(0)
+    err_flat = rng.integers(0, 256, 300 * 300).astype(np.float32)
+    table = ChordScoreTable(index, err_flat)
+    curr = 0
+    for _ in range(200):
+        nxt = int(rng.integers(0, 120))
+        pix = index.chord(curr, nxt)
+        if pix is None: continue
+        err_flat[pix] -= 30.0
+        table.subtract(pix, 30.0)
+        curr = nxt
+    assert np.array_equal(table.scores, index.chord_sums(err_flat))
+
+
+def test_inverted_index_matches_stable_argsort():
+    # Упакованная сортировка дает ту же раскладку, что и простой устойчивый argsort
+    index = ChordIndex(90, 200)
+    pix_offsets, pix_rows = index.inverted()
+    row_of_entry = np.repeat(np.arange(index.n_rows), np.diff(index.offsets))
+    assert np.array_equal(pix_rows, row_of_entry[np.argsort(index.pixels, kind="stable")])
+    assert np.array_equal(np.diff(pix_offsets), np.bincount(index.pixels, minlength=200 * 200))
+
+
+def test_geometry_cache_round_trip(tmp_path):
+    cache = GeometryCache(str(tmp_path))
+    built = ChordIndex(90, 200)
+    cache.store(built)
+    loaded = cache.load(90, 200)
+    assert isinstance(loaded.pixels, np.memmap)
+    for name in ("pair_row", "offsets", "pixels"):
+        assert np.array_equal(getattr(loaded, name), getattr(built, name))
+
+    cache.store_inverted(loaded.cache_entry, built.inverted())
+    for got, expected in zip(cache.load_inverted(loaded.cache_entry), built.inverted()):
+        assert np.array_equal(got, expected)
+
+
+def test_geometry_cache_evicts_oldest(tmp_path):
+    cache = GeometryCache(str(tmp_path))
+    cache.store(ChordIndex(60, 120))
+    first = cache.entry_path(60, 120)
+    os.utime(first, (0, 0))
+    cache.max_bytes = cache.entries()[0][1] + 1
+    cache.store(ChordIndex(70, 120))
+    assert not os.path.exists(first) and os.path.isdir(cache.entry_path(70, 120))
@@ -0,0 +1,32 @@
+import json
+
+from ringstring.engine import SolverParams, StringArtEngine, solve
+from ringstring.instrument import Instrumentation, Profiler
+
+
+def test_profile_records_phases_and_trace(calc_img, tmp_path):
+    params = SolverParams(nails=120, lines=150, calc_size=calc_img.width)
+    instrument = Instrumentation()
+    profiler = Profiler({"photo": "1.jpg"}).attach(instrument)
+    result = StringArtEngine(params, instrument).generate(calc_img)
+    # Подписчики не меняют расчет
+    assert result.sequence == solve(calc_img, params).sequence
+
+    path = tmp_path / "profile.json"
+    profiler.dump(str(path))
+    data = json.loads(path.read_text())
+    assert {"crop", "mask", "geometry", "scoring", "apply", "finalize"} <= set(data["phases"])
+    assert len(data["trace"]["score"]) == len(data["trace"]["residual"]) == 150
+    residual = data["trace"]["residual"]
+    # Вычитание нити только уменьшает положительный остаток ошибки
+    assert all(b <= a for a, b in zip(residual, residual[1:]))
+
+
+def test_events_go_only_to_subscribed_kinds(calc_img):
+    instrument = Instrumentation()
+    events = []
+    instrument.subscribe(events.append, ("progress",))
+    assert instrument.wants("progress") and not instrument.wants("line")
+    solve(calc_img, SolverParams(nails=120, lines=100, calc_size=calc_img.width), instrument=instrument)
+    assert {e["event"] for e in events} == {"progress"}
+    assert [e["i"] for e in events] == [0, 25, 50, 75]
@@ -0,0 +1,39 @@
+import logging
+
+import pytest
+
+from ringstring import jit
+from ringstring.engine import SolverParams, solve
+
+
+def _params(calc_img, backend):
+    return SolverParams(nails=60, lines=40, calc_size=calc_img.width, backend=backend)
+
+
+@pytest.fixture
+def small_img(calc_img):
+    return calc_img.resize((120, 120))
+
+
+def test_kernel_matches_numpy(small_img, monkeypatch):
+    # Без Numba ядро - обычная функция Python: проверяем ту же логику на малом размере
+    monkeypatch.setattr(jit, "NUMBA_AVAILABLE", True)
+    kernel = solve(small_img, _params(small_img, "numba"))
+    numpy = solve(small_img, _params(small_img, "numpy"))
+    assert kernel.sequence == numpy.sequence
+    assert (kernel.checkpoint.error_matrix == numpy.checkpoint.error_matrix).all()
+
+
+def test_missing_numba_falls_back(small_img, monkeypatch, caplog):
+    monkeypatch.setattr(jit, "NUMBA_AVAILABLE", False)
+    monkeypatch.setattr(jit, "_warned", False)
+    with caplog.at_level(logging.WARNING, "ringstring"):
+        fallback = solve(small_img, _params(small_img, "numba"))
+        solve(small_img, _params(small_img, "numba"))
+    assert [r.message for r in caplog.records].count("Numba не установлена - расчет идет на NumPy") == 1
+    assert fallback.sequence == solve(small_img, _params(small_img, "numpy")).sequence
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        jit.use_jit("cuda")
@@ -0,0 +1,35 @@
+import numpy as np
+
+from ringstring.geometry import calculate_nails
+from ringstring.keyframes import KeyframeCache
+
+
+def _points(n_steps=700, n_nails=120, size=300, seed=0):
+    nails = calculate_nails(size, n_nails)
+    seq = np.random.default_rng(seed).integers(0, n_nails, n_steps)
+    pts = [tuple(nails[n]) for n in seq]
+    pts[57] = pts[333] = None  # Неверные гвозди в файле схемы
+    return pts
+
+
+def _pixels(img):
+    return np.asarray(img).copy()
+
+
+def test_stepped_frame_equals_seek():
+    pts = _points()
+    player = KeyframeCache(pts, 300, interval=100)
+    for step in range(len(pts) + 1):
+        stepped = _pixels(player.frame(step))
+        if step % 23 == 0 or step % 100 in (0, 1, 99):
+            seek = _pixels(KeyframeCache(pts, 300, interval=100).frame(step))
+            assert np.array_equal(stepped, seek), step
+
+
+def test_backward_seek_uses_keyframes():
+    pts = _points()
+    player = KeyframeCache(pts, 300, interval=100)
+    player.frame(len(pts))
+    for step in (650, 401, 400, 399, 150, 3, 0):
+        fresh = _pixels(KeyframeCache(pts, 300, interval=100).frame(step))
+        assert np.array_equal(_pixels(player.frame(step)), fresh), step
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance, ImageOps
+
+from ringstring.engine import adjust_photo
+from ringstring.preview import PhotoPreview, StringsOverlay
+
+
+def _two_pass(img, brightness, contrast):
+    # Обработка до таблицы: два прохода ImageEnhance по серому фото
+    gray = ImageOps.grayscale(img.convert("RGB"))
+    gray = ImageEnhance.Brightness(gray).enhance(brightness)
+    return ImageEnhance.Contrast(gray).enhance(contrast)
+
+
+@pytest.fixture(scope="module")
+def image(photo):
+    img = Image.open(photo)
+    img.thumbnail((600, 600))
+    return img
+
+
+@pytest.mark.parametrize("brightness, contrast", [(1.0, 1.0), (1.4, 0.7), (0.6, 1.8)])
+def test_lut_matches_two_passes(image, brightness, contrast):
+    assert np.array_equal(np.asarray(adjust_photo(image, brightness, contrast)),
+                          np.asarray(_two_pass(image, brightness, contrast)))
+
+
+def test_layer_matches_full_resolution_path(image):
+    preview = PhotoPreview()
+    preview.load(image)
+    w, h = image.width // 2, image.height // 2
+    layer, pos = preview.layer(0.5, 1.3, 0.8, alpha=200, center=(w // 2, h // 2), canvas=(w, h))
+    expected = _two_pass(image, 1.3, 0.8).resize((w, h), Image.Resampling.NEAREST)
+    assert pos == (0, 0)
+    assert np.array_equal(np.asarray(layer)[..., 0], np.asarray(expected))
+    assert (np.asarray(layer)[..., 3] == 200).all()
+    # Те же входы - тот же объект: холст не перерисовывается
+    assert preview.layer(0.5, 1.3, 0.8, alpha=200, center=(w // 2, h // 2), canvas=(w, h))[0] is layer
+
+
+def test_layer_is_visible_part_of_zoom(image):
+    preview = PhotoPreview()
+    preview.load(image)
+    zw, zh = preview.zoom_size(4)
+    center, canvas = (100, 150), (300, 250)
+    layer, pos = preview.layer(4, 1.2, 1.1, center=center, canvas=canvas)
+    # Зум перекрывает весь холст: кадр размером с холст
+    assert layer.size == canvas and pos == (0, 0)
+    left, top = center[0] - zw // 2, center[1] - zh // 2
+    box = (pos[0] - left, pos[1] - top, pos[0] - left + layer.width, pos[1] - top + layer.height)
+    expected = _two_pass(image, 1.2, 1.1).resize((zw, zh), Image.Resampling.NEAREST).crop(box)
+    assert np.array_equal(np.asarray(layer)[..., 0], np.asarray(expected))
+    # Фото целиком за краем холста
+    assert preview.layer(4, center=(-zw, -zh), canvas=canvas) == (None, None)
+
+
+def test_strings_overlay_matches_direct_resize():
+    rng = np.random.default_rng(0)
+    strings = Image.fromarray(rng.integers(0, 256, (300, 300, 4), dtype=np.uint8), "RGBA")
+    overlay = StringsOverlay()
+    overlay.set(strings)
+    layer = overlay.layer(120, 0.5)
+    expected = np.asarray(strings.resize((120, 120), Image.Resampling.LANCZOS))
+    assert np.array_equal(np.asarray(layer)[..., :3], expected[..., :3])
+    assert np.array_equal(np.asarray(layer)[..., 3], (expected[..., 3] * 0.5).astype(np.uint8))
+    assert overlay.layer(120, 0.5) is layer
+    assert np.array_equal(np.asarray(overlay.layer(120, 1.0)), expected)
+    overlay.set(strings.transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+    assert overlay.layer(120, 1.0) is not layer
@@ -0,0 +1,81 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ringstring import engine
+from ringstring.engine import (
+    SolverParams, density_to_alpha, flatten_on_white, render_strings, solve, thread_density,
+)
+from ringstring.export import write_pdf, write_png_tiled, write_svg
+
+
+@pytest.fixture(scope="module")
+def result(calc_img):
+    return solve(calc_img, SolverParams(nails=120, lines=400, calc_size=calc_img.width))
+
+
+def test_density_keeps_thread_area(result):
+    size = 700
+    density = thread_density(result.sequence, result.nails, 300, size, width=2)
+    pts = np.asarray(result.nails, dtype=np.float64)[result.sequence] * size / 300
+    length = np.hypot(*np.diff(pts, axis=0).T).sum()
+    # Каждая нить кладет в буфер площадь ширина x длина (кроме поля за краем)
+    assert density.sum() == pytest.approx(2 * length, rel=0.01)
+
+
+def test_density_does_not_depend_on_chunk(result, monkeypatch):
+    full = thread_density(result.sequence, result.nails, 300, 500)
+    monkeypatch.setattr(engine, "_RENDER_CHUNK", 997)
+    assert np.array_equal(thread_density(result.sequence, result.nails, 300, 500), full)
+
+
+def test_crossings_darken_multiplicatively():
+    alpha = density_to_alpha(np.array([0.0, 1.0, 2.0], dtype=np.float32), opacity=40)
+    assert alpha.tolist() == [0, 40, round(255 * (1 - (1 - 40 / 255) ** 2))]
+
+
+def test_render_tiers(result):
+    img = render_strings(result.sequence, result.nails, 300, "thumbnail")
+    assert img.mode == "RGBA" and img.size == (400, 400)
+    assert np.asarray(img)[..., 3].max() > 0
+
+
+def test_density_bands_match_full_render(result):
+    full = thread_density(result.sequence, result.nails, 300, 700)
+    bands = [thread_density(result.sequence, result.nails, 300, 700, rows=(y0, min(y0 + 97, 700)), chunk=5000)
+             for y0 in range(0, 700, 97)]
+    assert np.array_equal(np.vstack(bands), full)
+
+
+def test_tiled_png_matches_render(result, tmp_path):
+    path = str(tmp_path / "big.png")
+    rows = []
+    write_png_tiled(path, result.sequence, 120, 300, 700, max_mb=1, progress=lambda done, total: rows.append(done))
+    assert len(rows) > 1 and rows[-1] == 700
+    expected = flatten_on_white(render_strings(result.sequence, result.nails, 300, 700)).convert("L")
+    with Image.open(path) as img:
+        assert img.size == (700, 700)
+        assert np.array_equal(np.asarray(img), np.asarray(expected))
+
+
+def test_svg_has_every_thread(result, tmp_path):
+    path = str(tmp_path / "scheme.svg")
+    write_svg(path, result.sequence, 120)
+    root = ET.parse(path).getroot()
+    ns = {"s": "http://www.w3.org/2000/svg"}
+    assert len(root.findall("s:g[@id='threads']/s:path", ns)) == len(result.sequence) - 1
+    assert len(root.findall("s:g[@id='nails']/s:circle", ns)) == 120
+
+
+def test_pdf_xref_offsets(result, tmp_path):
+    path = tmp_path / "scheme.pdf"
+    write_pdf(str(path), result.sequence, 120)
+    data = path.read_bytes()
+    assert data.startswith(b"%PDF-1.4") and data.rstrip().endswith(b"%%EOF")
+    xref = int(data[data.rindex(b"startxref") + 9:].split()[0])
+    entries = data[xref:].split(b"\n")[3:11]
+    for num, entry in enumerate(entries, 1):
+        offset = int(entry.split()[0])
+        assert data[offset:].startswith(f"{num} 0 obj".encode())
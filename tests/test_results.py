@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from ringstring import batch
+from ringstring.batch import JobOptions, process_photo
+from ringstring.engine import Checkpoint, SolverParams, StringArtEngine, render_strings
+from ringstring.results import ResultCache, result_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "results"))
+
+
+def test_engine_cache_hit_is_identical(calc_img, cache):
+    params = SolverParams(nails=120, lines=200, calc_size=calc_img.width)
+    first = StringArtEngine(params, cache=cache).generate(calc_img, render=False)
+    # Новый экземпляр кэша на той же папке - запись читается с диска
+    again = StringArtEngine(params, cache=ResultCache(cache.path)).generate(calc_img, render=False)
+    assert not first.cached and again.cached
+    assert again.sequence == first.sequence and again.cache_key == first.cache_key
+    assert np.array_equal(again.checkpoint.error_matrix, first.checkpoint.error_matrix)
+
+    image = cache.render(again.cache_key, again, 400)
+    assert np.array_equal(np.asarray(image), np.asarray(render_strings(first.sequence, first.nails, 300, 400)))
+
+
+def test_stopped_result_is_not_cached(calc_img, cache):
+    params = SolverParams(nails=120, lines=200, calc_size=calc_img.width)
+    stopped = StringArtEngine(params, cache=cache).generate(calc_img, render=False, should_stop=lambda: True)
+    assert stopped.stopped and stopped.cache_key is None
+    assert cache.get(cache.key(calc_img, params), params) is None
+
+
+def test_resumed_result_is_keyed_by_its_checkpoint(calc_img, cache):
+    params = SolverParams(nails=120, lines=100, calc_size=calc_img.width)
+    engine = StringArtEngine(params, cache=cache)
+    first = engine.generate(calc_img, render=False)
+    more = replace(params, lines=200)
+    resumed = StringArtEngine(more, cache=cache).generate(calc_img, render=False, checkpoint=first.checkpoint)
+    assert not resumed.cached and resumed.cache_key is not None
+    # Ключ расчета с нуля на 200 линий остается свободным
+    assert resumed.cache_key != cache.key(engine.prepare(calc_img), more)
+    assert cache.get(cache.key(engine.prepare(calc_img), more), more) is None
+    again = StringArtEngine(more, cache=cache).generate(calc_img, render=False, checkpoint=first.checkpoint)
+    assert again.cached and again.sequence == resumed.sequence
+    assert again.checkpoint.image == resumed.checkpoint.image == first.checkpoint.image
+
+    # Чекпоинт без хэша фото (старая версия): продолжение считается, но не кэшируется
+    old = Checkpoint(first.checkpoint.params, first.checkpoint.sequence, first.checkpoint.error_matrix)
+    plain = StringArtEngine(more, cache=cache).generate(calc_img, render=False, checkpoint=old)
+    assert plain.sequence == resumed.sequence and plain.cache_key is None and not plain.cached
+
+
+def test_key_ignores_backend_and_incremental(calc_img):
+    params = SolverParams(nails=120, lines=100, calc_size=calc_img.width)
+    assert result_key(calc_img, params) == result_key(calc_img, replace(params, incremental=True, backend="numpy"))
+    assert result_key(calc_img, params) != result_key(calc_img, replace(params, skip_nails=10))
+
+
+def test_batch_hit_skips_photo_and_reuses_outputs(tmp_path, photo, cache, monkeypatch):
+    monkeypatch.setattr(batch, "result_cache", cache)
+    params = SolverParams(nails=120, lines=200, calc_size=300)
+    options = JobOptions(output_dir=str(tmp_path / "out"), formats=("txt", "rsq", "svg"))
+    (tmp_path / "out").mkdir()
+    first = process_photo(photo, params, options)
+    assert first.ok and not first.cached
+    outputs = {path: open(path, "rb").read() for path in first.outputs}
+
+    def no_photo(*args):
+        raise AssertionError("фото загружено при попадании в кэш")
+    monkeypatch.setattr(batch, "_job_photo", no_photo)
+    again = process_photo(photo, params, options)
+    assert again.ok and again.cached, again.error
+    assert {path: open(path, "rb").read() for path in again.outputs} == outputs
+
+    report = batch.BatchReport([first, again], 1, 1.0)
+    assert report.total_lines == first.lines and len(report.cached) == 1
+
+
+def test_concurrent_renders_share_one_tier(calc_img, cache):
+    params = SolverParams(nails=120, lines=200, calc_size=calc_img.width)
+    result = StringArtEngine(params, cache=cache).generate(calc_img, render=False)
+    with ThreadPoolExecutor(4) as pool:
+        images = list(pool.map(lambda _: cache.render(result.cache_key, result, 300), range(8)))
+    expected = np.asarray(render_strings(result.sequence, result.nails, 300, 300))
+    assert all(np.array_equal(np.asarray(img), expected) for img in images)
+    assert list(cache._entry(result.cache_key).alphas) == [300]
@@ -0,0 +1,125 @@
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from dataclasses import replace
+
+import pytest
+
+from ringstring.batch import JobOptions
+from ringstring.engine import SolverParams
+from ringstring.formats import read_instructions
+from ringstring.server import JobQueue, JobServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    jobs = JobQueue(str(tmp_path / "jobs"), workers=1, max_queue=1).start()
+    srv = JobServer(("127.0.0.1", 0), jobs, SolverParams(nails=90, lines=100, calc_size=200), stream_interval=0.05)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}", jobs
+    srv.shutdown()
+    srv.server_close()
+    jobs.shutdown()
+
+
+@pytest.fixture(scope="module")
+def photo_bytes(photo):
+    with open(photo, "rb") as f:
+        return f.read()
+
+
+def request(url, method="GET", data=None):
+    req = urllib.request.Request(url, data=data, method=method)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, resp.read(), resp.headers
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), e.headers
+
+
+def test_job_round_trip(server, photo_bytes, tmp_path):
+    base, _ = server
+    code, body, headers = request(f"{base}/jobs?lines=120&formats=txt,json", "POST", photo_bytes)
+    assert code == 202
+    job_id = json.loads(body)["id"]
+    assert headers["Location"] == f"/jobs/{job_id}"
+
+    with urllib.request.urlopen(f"{base}/jobs/{job_id}/events") as resp:
+        events = [json.loads(line) for line in resp]
+    assert events[-1]["status"] == "done" and events[-1]["lines_done"] == 120
+
+    code, body, _ = request(f"{base}/jobs/{job_id}/txt")
+    assert code == 200
+    (tmp_path / "scheme.txt").write_bytes(body)
+    code, body, _ = request(f"{base}/jobs/{job_id}/json")
+    assert read_instructions(str(tmp_path / "scheme.txt")) == (90, json.loads(body)["sequence"])
+    assert len(json.loads(body)["sequence"]) == 121
+    assert request(f"{base}/jobs/{job_id}/rsq")[0] == 404  # Не заказан
+
+
+@pytest.mark.parametrize("query, data", [("?bogus=1", None), ("?lines=abc", None), ("?formats=bmp", None),
+                                         ("?nails=100000", None), ("?lines=0", None), ("?calc_size=20000", None),
+                                         ("", b"not an image")])
+def test_bad_request(server, photo_bytes, query, data):
+    base, _ = server
+    code, body, _ = request(f"{base}/jobs{query}", "POST", data or photo_bytes)
+    assert code == 400 and json.loads(body)["error"]
+
+
+def test_full_queue_and_cancel(server, photo_bytes):
+    base, jobs = server
+    running = json.loads(request(f"{base}/jobs?lines=6000&calc_size=500", "POST", photo_bytes)[1])["id"]
+    while jobs.get(running).status != "running":
+        jobs.get(running).done.wait(0.01)
+    queued = json.loads(request(f"{base}/jobs", "POST", photo_bytes)[1])["id"]
+    code, _, headers = request(f"{base}/jobs", "POST", photo_bytes)
+    assert code == 503 and headers["Retry-After"]
+
+    assert json.loads(request(f"{base}/jobs/{queued}", "DELETE")[1])["status"] == "cancelled"
+    request(f"{base}/jobs/{running}", "DELETE")
+    assert jobs.get(running).done.wait(30)
+    state = json.loads(request(f"{base}/jobs/{running}")[1])
+    assert state["status"] == "cancelled" and state["lines_done"] < 6000
+    stats = json.loads(request(f"{base}/stats")[1])
+    assert (stats["submitted"], stats["rejected"], stats["cancelled"]) == (2, 1, 2)
+
+
+@pytest.mark.parametrize("length, code", [("abc", 400), ("-5", 400), ("0", 400), (str(64 * 1024**2), 413)])
+def test_bad_content_length(server, length, code):
+    base, _ = server
+    conn = http.client.HTTPConnection(base[len("http://"):])
+    conn.putrequest("POST", "/jobs")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    resp = conn.getresponse()
+    assert resp.status == code and json.loads(resp.read())["error"]
+    conn.close()
+
+
+def test_process_workers_run_jobs_in_parallel(tmp_path, photo_bytes):
+    jobs = JobQueue(str(tmp_path / "jobs"), workers=2, max_queue=4).start(SolverParams(nails=90, calc_size=200))
+    try:
+        params, options = SolverParams(nails=90, lines=6000, calc_size=500), JobOptions(formats=("json",))
+        first, second = (jobs.submit(photo_bytes, params, options) for _ in range(2))
+        deadline = time.time() + 60
+        while jobs.snapshot()["running"] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert jobs.snapshot()["running"] == 2
+        # Ход расчета приходит из процесса, остановка уходит в процесс
+        while first.lines_done == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert first.lines_done > 0
+        jobs.cancel(first.id)
+        jobs.cancel(second.id)
+        assert first.done.wait(30) and second.done.wait(30)
+        assert first.status == second.status == "cancelled" and 0 < first.lines_done < 6000
+
+        small = jobs.submit(photo_bytes, replace(params, lines=80), options)
+        assert small.done.wait(60) and small.status == "done", small.error
+        with open(small.outputs["json"]) as f:
+            assert len(json.load(f)["sequence"]) == 81
+    finally:
+        jobs.shutdown()
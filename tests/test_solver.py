@@ -0,0 +1,147 @@
+import math
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageOps
+
+from ringstring.engine import (
+    Checkpoint, CheckpointMismatch, SolverParams, image_digest, level_params, pyramid_levels,
+    reconstruction_error, resume, scale_weight, solve, use_incremental,
+)
+from ringstring.geometry import get_chord_index
+
+
+def baseline_greedy(calc_img, n_nails, max_lines, line_weight, skip_nails):
+    # Исходный цикл программы (до ringstring): linspace по каждой хорде на каждом шаге
+    target_img = ImageOps.invert(calc_img)
+    w, h = target_img.size
+    msk = Image.new("L", (w, h), 0)
+    ImageDraw.Draw(msk).ellipse((0, 0, w, h), fill=255)
+    target_img = Image.composite(target_img, Image.new("L", target_img.size, 0), msk)
+    error_matrix = np.array(target_img, dtype=np.float32)
+
+    nails = []
+    cx, cy = w / 2, h / 2
+    rad = w / 2 - 1
+    for i in range(n_nails):
+        a = 2 * math.pi * i / n_nails
+        nails.append((int(cx + rad * math.cos(a)), int(cy + rad * math.sin(a))))
+
+    def chord(s, t):
+        (sx, sy), (ex, ey) = nails[s], nails[t]
+        ln = int(math.hypot(ex - sx, ey - sy))
+        xs = np.clip(np.linspace(sx, ex, ln).astype(int), 0, w - 1)
+        ys = np.clip(np.linspace(sy, ey, ln).astype(int), 0, h - 1)
+        return ln, ys, xs
+
+    curr = 0
+    sequence = [curr]
+    for _ in range(max_lines):
+        best_nail, best_score = -1, -999999999.0
+        for t in range(n_nails):
+            dist_idx = abs(t - curr)
+            if dist_idx < skip_nails or dist_idx > (n_nails - skip_nails): continue
+            ln, ys, xs = chord(curr, t)
+            if ln == 0: continue
+            score = np.sum(error_matrix[ys, xs])
+            if score > best_score:
+                best_score, best_nail = score, t
+        if best_nail == -1: break
+        _, ys, xs = chord(curr, best_nail)
+        error_matrix[ys, xs] -= float(line_weight)
+        sequence.append(best_nail)
+        curr = best_nail
+    return sequence
+
+
+@pytest.mark.parametrize("nails, lines, weight, skip", [(120, 150, 30, 15), (90, 120, 80, 10)])
+@pytest.mark.parametrize("incremental", [False, True])
+def test_greedy_matches_baseline(calc_img, nails, lines, weight, skip, incremental):
+    params = SolverParams(nails=nails, lines=lines, line_weight=weight, skip_nails=skip,
+                          calc_size=calc_img.width, incremental=incremental)
+    assert solve(calc_img, params).sequence == baseline_greedy(calc_img, nails, lines, weight, skip)
+
+
+def test_incremental_is_automatic_only_for_long_runs():
+    assert not use_incremental(SolverParams(lines=1000))
+    assert use_incremental(SolverParams(lines=6000))
+    assert use_incremental(SolverParams(lines=100, incremental=True))
+    assert not use_incremental(SolverParams(lines=6000, incremental=False))
+
+
+def test_pyramid_levels():
+    assert pyramid_levels(SolverParams(calc_size=500)) == [500]
+    assert pyramid_levels(SolverParams(calc_size=300, draft_size=75)) == [75, 150, 300]
+    assert pyramid_levels(SolverParams(calc_size=500, draft_size=200)) == [200, 400, 500]
+
+
+def test_pyramid_keeps_sequence_valid(calc_img):
+    params = SolverParams(nails=120, lines=150, calc_size=calc_img.width, draft_size=75)
+    seq = solve(calc_img, params).sequence
+    assert len(seq) == 151 and seq[0] == 0
+    index = get_chord_index(120, calc_img.width)
+    allowed = index.allowed_mask(params.skip_nails)
+    assert all(allowed[a, b] for a, b in zip(seq, seq[1:]))
+
+
+def test_resume_matches_uninterrupted(calc_img, tmp_path):
+    params = SolverParams(nails=120, lines=240, calc_size=calc_img.width, incremental=True)
+    full = solve(calc_img, params)
+    saved = []
+    part = solve(calc_img, replace(params, lines=100), checkpoint_every=50, on_checkpoint=saved.append)
+    assert [c.lines_done for c in saved] == [50, 100]
+    assert part.sequence == full.sequence[:101]
+
+    path = str(tmp_path / "job.ckpt.npz")
+    part.checkpoint.save(path)
+    loaded = Checkpoint.load(path)
+    assert loaded.params == part.checkpoint.params and loaded.sequence == part.sequence
+    assert np.array_equal(loaded.error_matrix, part.checkpoint.error_matrix)
+
+    resumed = resume(loaded, params.lines)
+    assert resumed.sequence == full.sequence
+    assert np.array_equal(resumed.checkpoint.error_matrix, full.checkpoint.error_matrix)
+
+
+def test_resume_rejects_other_geometry(calc_img):
+    part = solve(calc_img, SolverParams(nails=120, lines=20, calc_size=calc_img.width))
+    other = replace(part.checkpoint, params=replace(part.checkpoint.params, line_weight=45))
+    with pytest.raises(ValueError):
+        solve(None, replace(part.params, lines=40), checkpoint=other)
+
+
+def test_pyramid_levels_use_scaled_weight(calc_img):
+    params = SolverParams(nails=120, lines=150, line_weight=40, calc_size=300, draft_size=75)
+    draft = level_params(params, 75)
+    assert draft.calc_size == 75 and draft.draft_size == 0
+    assert draft.line_weight == scale_weight(40, 75, 300) == 10
+    assert level_params(params, 300).line_weight == 40
+
+    result = solve(calc_img, params)
+    assert len(result.sequence) == 151 and result.checkpoint.params.draft_size == 0
+    greedy = solve(calc_img, replace(params, draft_size=0))
+    final = replace(params, draft_size=0)
+    # Пирамида - приближение жадного расчета, а не другая картинка
+    assert reconstruction_error(calc_img, result.sequence, final) < \
+        reconstruction_error(calc_img, greedy.sequence, final) * 1.1
+
+
+def test_checkpoint_keeps_image_digest(calc_img, tmp_path):
+    params = SolverParams(nails=120, lines=50, calc_size=calc_img.width)
+    ckpt = solve(calc_img, params).checkpoint
+    assert ckpt.image == image_digest(calc_img)
+    path = str(tmp_path / "c.npz")
+    ckpt.save(path)
+    assert Checkpoint.load(path).image == ckpt.image
+    assert resume(Checkpoint.load(path), 80).checkpoint.image == ckpt.image
+
+
+def test_checkpoint_matches_full_params(calc_img):
+    params = SolverParams(nails=120, lines=50, calc_size=calc_img.width)
+    ckpt = solve(calc_img, params).checkpoint
+    assert ckpt.matches(replace(params, lines=90, incremental=True, backend="numpy"))
+    assert not ckpt.matches(replace(params, strategy="beam"))
+    assert ckpt.compatible(replace(params, strategy="beam"))
+    with pytest.raises(CheckpointMismatch):
+        solve(calc_img.transpose(Image.Transpose.FLIP_LEFT_RIGHT), replace(params, lines=60), checkpoint=ckpt)
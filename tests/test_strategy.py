@@ -0,0 +1,68 @@
+from dataclasses import replace
+
+import numpy as np
+
+from ringstring import engine
+from ringstring.engine import (
+    STRATEGIES, SolverParams, StringArtEngine, compare_with_greedy, register_strategy, residual_matrix, solve,
+)
+from ringstring.geometry import get_chord_index
+from ringstring.results import ResultCache
+
+
+def _params(calc_img, **kw):
+    return SolverParams(nails=90, lines=60, calc_size=calc_img.width, **kw)
+
+
+def test_beam_of_width_one_is_greedy(calc_img):
+    greedy = solve(calc_img, _params(calc_img)).sequence
+    for kw in ({"beam_width": 1, "lookahead": 3}, {"beam_width": 4, "lookahead": 1}):
+        assert solve(calc_img, _params(calc_img, strategy="beam", **kw)).sequence == greedy
+
+
+def test_lookahead_restores_error_matrix(calc_img):
+    params = _params(calc_img, strategy="beam", beam_width=3, lookahead=2)
+    result = solve(calc_img, params)
+    assert result.report["lookahead_lines"] == 60 and not result.report["budget_hit"]
+    # Пробные нити просмотра сняты: матрица - ровно сумма выбранных нитей
+    assert np.array_equal(result.checkpoint.error_matrix, residual_matrix(calc_img, result.sequence, params))
+
+
+def test_time_budget_falls_back_to_greedy(calc_img):
+    result = solve(calc_img, _params(calc_img, strategy="beam", beam_width=3, lookahead=2, time_budget=1e-9))
+    assert result.report["greedy_lines"] == 60 and result.report["budget_hit"]
+    assert result.sequence == solve(calc_img, _params(calc_img)).sequence
+
+
+def test_registered_strategy_is_used(calc_img):
+    # Выбор может быть и простой функцией, без report()
+    register_strategy("last", lambda index, candidates, err_flat, params: lambda curr, targets, scores: len(targets) - 1)
+    try:
+        seq = solve(calc_img, _params(calc_img, strategy="last")).sequence
+    finally:
+        STRATEGIES.pop("last")
+    candidates = get_chord_index(90, calc_img.width).candidates(15)
+    assert all(b == candidates[a][0][-1] for a, b in zip(seq, seq[1:]))
+
+
+def test_compare_with_greedy(calc_img):
+    params = _params(calc_img, strategy="beam", beam_width=3, lookahead=2)
+    result = solve(calc_img, params)
+    report = compare_with_greedy(calc_img, result)
+    greedy = solve(calc_img, replace(params, strategy="greedy"))
+    assert report["lines"] == 60
+    assert report["greedy_error"] == compare_with_greedy(calc_img, greedy)["error"]
+
+
+def test_engine_compares_only_on_request(calc_img, tmp_path, monkeypatch):
+    params = _params(calc_img, strategy="beam", beam_width=3, lookahead=2)
+    calls = []
+    monkeypatch.setattr(engine, "compare_with_greedy",
+                        lambda img, result: calls.append(1) or compare_with_greedy(img, result))
+    cache = ResultCache(str(tmp_path / "results"))
+    plain = StringArtEngine(params, cache=cache).generate(calc_img, render=False)
+    assert not calls and "greedy_error" not in plain.report
+    # Попадание в кэш без сравнения: сравнение считается по запросу
+    compared = StringArtEngine(params, cache=cache).generate(calc_img, render=False, compare=True)
+    assert compared.cached and len(calls) == 1 and "greedy_error" in compared.report
+    assert compared.sequence == plain.sequence
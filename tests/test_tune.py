@@ -0,0 +1,32 @@
+import numpy as np
+
+from ringstring.tune import _rungs, target_darkness, tune, visual_error
+
+
+def test_curve_covers_candidates(calc_img):
+    space = {"nails": (90, 120), "line_weight": (30,), "skip_nails": (15,), "lines": (100, 400, 100)}
+    progress = []
+    res = tune(calc_img, space, budget=60, workers=1, on_progress=lambda done, total: progress.append(done))
+    b = res.best
+    assert (b.nails, b.line_weight, b.skip_nails) in {(90, 30, 15), (120, 30, 15)}
+    assert 100 <= b.lines <= 400 and b.calc_size == calc_img.width
+    assert not res.budget_hit and res.evaluated == 2 and progress[-1] == len(progress)
+
+    curve = res.best_curve()
+    assert [p.lines for p in curve] == sorted({p.lines for p in curve})
+    best_err = min(p.error for p in res.curve)
+    # Лучший набор - самый короткий из тех, что в пределах допуска от лучшей ошибки
+    assert b.lines == min(p.lines for p in res.curve if p.error <= best_err * 1.01)
+
+
+def test_visual_error_of_empty_scheme(calc_img):
+    target = target_darkness(calc_img)
+    nails = np.zeros((120, 2))
+    err = visual_error(target, [0], nails, calc_img.width)
+    assert err > visual_error(np.zeros_like(target), [0], nails, calc_img.width) == 0.0
+
+
+def test_rungs():
+    assert _rungs(1000, 6000, 500) == [1500, 3000, 6000]
+    assert _rungs(100, 400, 100) == [100, 200, 400]
+    assert _rungs(2000, 3000, 500) == [2000, 3000]